@@ -0,0 +1,43 @@
+-- =====================================================
+-- Cohort retention matrix (see cohort_retention.py)
+-- retention_members: each user's cohort in an app (day of their first
+-- session) and a bitmap of the days since then on which they had a session.
+-- retention_activity: active users per (app, cohort day, days since cohort),
+-- incremented the first time a member is seen on a day, so D1/D7/D30 are
+-- read without self-joins over user_sessions.
+-- REQUIRED right after this migration: python cohort_retention.py --backfill
+-- (or POST /api/v2/admin/cohort-retention/backfill). Sessions start being
+-- recorded as soon as the tables exist, and until the backfill has run every
+-- existing user is filed under the day they are next seen, as if new; the
+-- backfill moves them back to their first session day.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS retention_members (
+    app_id INT NOT NULL,
+    user_id INT NOT NULL,
+    cohort_day DATE NOT NULL,
+    active_days BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (app_id, user_id),
+    INDEX idx_app_cohort (app_id, cohort_day),
+    FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES app_users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS retention_activity (
+    app_id INT NOT NULL,
+    cohort_day DATE NOT NULL,
+    day_offset SMALLINT NOT NULL,
+    active_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (app_id, cohort_day, day_offset),
+    FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE
+);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_cohort_retention');
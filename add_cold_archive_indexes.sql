@@ -0,0 +1,27 @@
+-- =====================================================
+-- Indexes for the cold archive export (see cold_archive.py)
+-- The export walks expired rows in keyset order, ORDER BY (<timestamp>, id),
+-- optionally for one app. InnoDB appends the primary key to secondary
+-- indexes, so (created_at) already serves app_error_logs and (app_id,
+-- <timestamp>, id) comes from add_pagination_indexes.sql for sessions and
+-- errors; these cover the remaining combinations.
+-- {table}_archive_YYYYMM tables created afterwards inherit them (CREATE TABLE ... LIKE)
+-- =====================================================
+
+-- idx_session_dates is (start_time, end_time): id is not next in that order
+ALTER TABLE user_sessions
+ADD INDEX idx_start_id (start_time, id);
+
+-- Per-app purges: WHERE app_id = ? AND updated_at < ? ORDER BY updated_at, id
+ALTER TABLE update_history
+ADD INDEX idx_app_updated_id (app_id, updated_at, id);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_cold_archive_indexes');
@@ -0,0 +1,33 @@
+-- =====================================================
+-- Composite indexes for keyset (cursor) pagination
+-- Every list endpoint orders by (<timestamp>, id) DESC and seeks past the
+-- cursor, so each page is an index range read regardless of depth
+-- =====================================================
+
+-- /api/v2/sessions/recent/{app}: WHERE app_id = ? ORDER BY start_time, id
+ALTER TABLE user_sessions
+ADD INDEX idx_app_start_id (app_id, start_time, id);
+
+-- /api/v2/errors/recent/{app}: WHERE app_id = ? [AND severity = ?] ORDER BY created_at, id
+ALTER TABLE app_error_logs
+ADD INDEX idx_app_created_id (app_id, created_at, id),
+ADD INDEX idx_app_severity_created_id (app_id, severity, created_at, id);
+
+-- /api/v2/versions and /api/v2/app-version/files: ORDER BY created_at, id
+ALTER TABLE app_versions
+ADD INDEX idx_created_id (created_at, id),
+ADD INDEX idx_app_created_id (app_id, created_at, id);
+
+-- /api/v2/users: ORDER BY last_seen_at, id
+ALTER TABLE app_users
+ADD INDEX idx_last_seen_id (last_seen_at, id);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_pagination_indexes');
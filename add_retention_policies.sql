@@ -0,0 +1,36 @@
+-- =====================================================
+-- Retention for telemetry tables (see retention.py)
+-- Per-app overrides of the RETENTION_*_DAYS defaults, plus timestamp-leading
+-- indexes so retention scans and month rotation are range reads
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS app_retention_policies (
+    app_id INT NOT NULL,
+    table_name ENUM('user_sessions', 'app_error_logs', 'update_history') NOT NULL,
+    retention_days INT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (app_id, table_name),
+    FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE
+);
+
+-- user_sessions already has idx_session_dates (start_time, end_time)
+ALTER TABLE app_error_logs
+ADD INDEX idx_created (created_at);
+
+ALTER TABLE update_history
+ADD INDEX idx_updated (updated_at);
+
+-- Monthly partitioning is a separate, one-off step because it drops the
+-- foreign keys on the table (MySQL does not allow them on partitioned tables):
+--   python retention.py --partition user_sessions            (prints the DDL)
+--   python retention.py --partition user_sessions --execute
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_retention_policies');
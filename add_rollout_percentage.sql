@@ -0,0 +1,18 @@
+-- =====================================================
+-- Staged rollouts (see rollout.py)
+-- Share of devices, by a stable hash of user_uuid, offered each version by
+-- /api/v2/version/check. Existing versions stay fully released.
+-- =====================================================
+
+ALTER TABLE app_versions
+ADD COLUMN rollout_percentage TINYINT UNSIGNED NOT NULL DEFAULT 100;
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_rollout_percentage');
@@ -0,0 +1,42 @@
+-- =====================================================
+-- Update funnel aggregates (see update_funnel.py)
+-- One row per (app, to_version, platform) with the number of
+-- started/downloaded/installed/failed reports, the most frequent failure
+-- reasons and a time-to-install sketch, folded in from update_history by the
+-- aggregator, so /api/v2/analytics/{app}/updates never scans the history.
+-- aggregation_state holds how far update_history has been folded.
+-- Existing history is folded by the aggregator itself (python update_funnel.py --catch-up)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS update_funnel (
+    app_id INT NOT NULL,
+    to_version VARCHAR(50) NOT NULL,
+    platform VARCHAR(20) NOT NULL,
+    started INT NOT NULL DEFAULT 0,
+    downloaded INT NOT NULL DEFAULT 0,
+    installed INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    failure_reasons JSON,
+    install_seconds JSON,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (app_id, to_version, platform),
+    FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS aggregation_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO aggregation_state (name, last_id) VALUES ('update_funnel', 0);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_update_funnel');
@@ -0,0 +1,37 @@
+-- =====================================================
+-- Installed-version counters (see install_counts.py)
+-- One row per (app, platform, version) with the number of active
+-- installations on it, adjusted in the same transaction as every
+-- user_app_installations change, so version distributions are a primary-key
+-- range read instead of a GROUP BY over all installations.
+-- NULL platforms/versions are counted under ''.
+-- Drift is corrected by the periodic reconciliation (python install_counts.py --reconcile)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS version_install_counts (
+    app_id INT NOT NULL,
+    platform VARCHAR(20) NOT NULL,
+    version VARCHAR(50) NOT NULL,
+    installed_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (app_id, platform, version),
+    FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE
+);
+
+-- Initial counts
+INSERT INTO version_install_counts (app_id, platform, version, installed_count)
+SELECT app_id, COALESCE(platform, ''), COALESCE(current_version, ''), COUNT(*)
+FROM user_app_installations
+WHERE is_active = true
+GROUP BY app_id, COALESCE(platform, ''), COALESCE(current_version, '')
+ON DUPLICATE KEY UPDATE installed_count = VALUES(installed_count);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_version_install_counts');
@@ -0,0 +1,28 @@
+-- =====================================================
+-- Sortable version keys (see versioning.py)
+-- Integer encoding of the version strings so comparisons, MIN/MAX and range
+-- filters are indexed integer operations ("0.10.0" sorts after "0.9.0").
+-- Existing rows: python versioning.py --backfill
+-- =====================================================
+
+ALTER TABLE app_versions
+ADD COLUMN version_key BIGINT NULL AFTER version,
+ADD INDEX idx_app_platform_version_key (app_id, platform, version_key);
+
+ALTER TABLE user_app_installations
+ADD COLUMN current_version_key BIGINT NULL AFTER current_version,
+ADD INDEX idx_app_current_version_key (app_id, current_version_key);
+
+ALTER TABLE app_error_logs
+ADD COLUMN app_version_key BIGINT NULL AFTER app_version,
+ADD INDEX idx_app_version_key (app_id, app_version_key);
+
+-- Log the migration
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    migration_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (migration_name)
+VALUES ('add_version_keys');
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: version-check latency while a large build is being saved
+A probe calls check_version every few milliseconds on the event loop while
+a build is written to a temporary storage directory, either with the
+blocking FileStorageManager.save_file called from the handler (the old
+upload path) or with AsyncFileStorageManager. Latency is measured from when
+the probe was due, so time spent waiting for a stalled loop counts.
+The database is replaced by an in-memory cursor.
+
+Usage: python benchmark_storage_io.py [size_mb] [interval_ms]
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import multi_app_api
+from file_storage_api import AsyncFileStorageManager, FileStorageManager
+
+VERSION_ROW = {
+    "app_id": 1, "version": "2.0.0", "version_code": 20, "is_mandatory": 0, "file_size": 1000,
+    "changelog": '["Fix"]', "release_date": datetime(2025, 1, 1), "platform": "android", "row_num": 1,
+}
+
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if "FROM apps WHERE app_identifier" in query:
+            self.rows = [(1,)]
+        elif "ROW_NUMBER" in query:
+            self.rows = [dict(VERSION_ROW)]
+        else:
+            self.rows = []
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def cursor(self, *args):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+
+@contextmanager
+def fake_db():
+    yield FakeConnection()
+
+
+async def probe(stop: asyncio.Event, interval: float, latencies: list):
+    check = multi_app_api.VersionCheck(app_identifier="bench", current_version="1.0.0", platform="android")
+    due = time.perf_counter()
+    while not stop.is_set():
+        await multi_app_api.check_version(check)
+        latencies.append((time.perf_counter() - due) * 1000)
+        # After a stall, carry on from now rather than replaying the missed probes
+        due = max(due + interval, time.perf_counter())
+        await asyncio.sleep(due - time.perf_counter())
+
+
+async def scenario(name: str, save, interval: float) -> dict:
+    latencies = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, interval, latencies))
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    if save:
+        await save()
+    else:
+        await asyncio.sleep(1)
+    save_seconds = time.perf_counter() - started
+    await asyncio.sleep(0.2)
+    stop.set()
+    await probe_task
+    latencies.sort()
+    return {
+        "scenario": name,
+        "save_seconds": round(save_seconds, 2),
+        "checks": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+async def run(size_mb: int, interval: float):
+    content = os.urandom(1024 * 1024) * size_mb
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        storage = FileStorageManager(root)
+        async_storage = AsyncFileStorageManager(storage)
+
+        async def blocking_save():
+            # What the upload handlers did: a sync call inside an async def
+            storage.save_file(1, "1.0.0", "android", "blocking.apk", content)
+
+        async def offloaded_save():
+            await async_storage.save_file(1, "1.0.0", "android", "async.apk", content)
+
+        results.append(await scenario("idle", None, interval))
+        results.append(await scenario("blocking_save", blocking_save, interval))
+        results.append(await scenario("async_save", offloaded_save, interval))
+    return results
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    interval = (float(sys.argv[2]) if len(sys.argv) > 2 else 5) / 1000
+    multi_app_api.get_db = fake_db
+    results = asyncio.run(run(size_mb, interval))
+    print(json.dumps({"size_mb": size_mb, "interval_ms": interval * 1000, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: /api/v2/versions serialization with 5,000 rows
+Compares the legacy path (json.loads of every changelog + jsonable_encoder +
+stdlib JSONResponse) with the fast path (raw JSON fragments + orjson).
+The database is replaced by an in-memory cursor so only the Python side
+of the endpoint is measured.
+
+Usage: python benchmark_versions_serialization.py [rows] [repeats]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import multi_app_api
+from fast_json import HAS_FRAGMENTS, orjson
+
+
+def make_rows(count: int):
+    """Rows shaped like the DictCursor result of get_all_versions"""
+    base = datetime(2025, 1, 1, 8, 30)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "id": count - i,
+            "version": f"1.{i // 100}.{i % 100}",
+            "platform": "android" if i % 2 else "ios",
+            "version_code": count - i,
+            "file_name": f"app-{i}.apk",
+            "file_size": 30_000_000 + i,
+            "file_hash": f"{i:064x}",
+            "changelog": json.dumps([f"Fix #{i}", "Performance improvements", "Updated translations"]),
+            "is_active": 1,
+            "is_mandatory": i % 10 == 0,
+            "download_count": i * 3,
+            "release_date": base - timedelta(hours=i),
+            "created_at": base - timedelta(hours=i),
+            "app_identifier": "nexa-timesheet",
+            "app_name": "Nexa Timesheet",
+        })
+    return rows
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        # DictCursor hands out fresh dicts on every call
+        return [dict(row) for row in self.rows]
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, *args):
+        return FakeCursor(self.rows)
+
+
+def legacy_versions(rows):
+    """The pre-fast-path handler body and FastAPI response pipeline"""
+    versions = [dict(row) for row in rows]
+    for version in versions:
+        if version['changelog']:
+            try:
+                version['changelog'] = json.loads(version['changelog'])
+            except:
+                version['changelog'] = []
+    return JSONResponse(content=jsonable_encoder({"versions": versions})).body
+
+
+def fast_versions(rows, loop):
+    response = loop.run_until_complete(
+        multi_app_api.get_all_versions(
+            app_identifier=None, platform=None, is_active=None,
+            limit=len(rows), cursor=None
+        )
+    )
+    return response.body
+
+
+def measure(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = make_rows(count)
+
+    @contextmanager
+    def fake_db():
+        yield FakeConnection(rows)
+
+    multi_app_api.get_db = fake_db
+    loop = asyncio.new_event_loop()
+
+    legacy_body = legacy_versions(rows)
+    fast_body = fast_versions(rows, loop)
+    assert json.loads(legacy_body)["versions"] == json.loads(fast_body)["versions"], "payload mismatch"
+
+    results = {
+        "rows": count,
+        "repeats": repeats,
+        "orjson": orjson is not None,
+        "fragments": HAS_FRAGMENTS,
+        "payload_bytes": len(fast_body),
+    }
+    for name, func in (("legacy", lambda: legacy_versions(rows)),
+                       ("fast", lambda: fast_versions(rows, loop))):
+        timings = measure(func, repeats)
+        results[name] = {
+            "median_ms": round(statistics.median(timings), 2),
+            "min_ms": round(min(timings), 2),
+            "max_ms": round(max(timings), 2),
+        }
+    results["speedup"] = round(results["legacy"]["median_ms"] / results["fast"]["median_ms"], 2)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Local disk cache for builds stored as MySQL BLOBs
+Builds without a file on the volume live in app_versions.app_file, and every
+download used to pull the whole BLOB over the network from MySQL. The first
+download of a build now writes it to a local directory; later downloads are
+served from that file.
+
+- Entries are keyed by (version id, file_hash): a re-uploaded build has a new
+  hash, so a stale entry is never served, it just ages out
+- A build is only cached once its content matches file_hash (sha256), so a
+  corrupt or mismatched BLOB is served as is but never pinned on disk
+- Total size is capped (BLOB_CACHE_MAX_MB); the least recently used builds
+  are evicted first
+- Concurrent misses for the same build are coalesced: one request loads the
+  BLOB, the others wait for it and then read the cached file
+- Hits are returned as open file handles, taken under the cache lock, so a
+  build evicted while it is being sent keeps streaming from the unlinked file
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+from metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+blob_cache_requests_total = REGISTRY.register(Counter(
+    "blob_cache_requests_total", "BLOB cache lookups", ("result",)))
+blob_cache_evictions_total = REGISTRY.register(Counter(
+    "blob_cache_evictions_total", "Builds evicted from the BLOB cache"))
+blob_cache_bytes = REGISTRY.register(Gauge(
+    "blob_cache_bytes", "Bytes held by the BLOB cache"))
+
+# sha256 hex digests, what uploads store; anything else cannot be verified
+_HASH_RE = re.compile(r"^[0-9a-fA-F]{64}$")
+
+
+class _Flight:
+    """A BLOB load in progress; waiters share its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.cached = False
+        self.content: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class BlobDiskCache:
+    def __init__(self, root, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Adopt the files left by a previous run, oldest first in LRU order"""
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".part"):
+                # Interrupted write
+                os.unlink(entry.path)
+            elif entry.name.endswith(".bin") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _name(version_id: int, file_hash: str) -> str:
+        return f"{int(version_id)}-{file_hash.lower()}.bin"
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop LRU entries until under max_bytes (caller holds the lock)"""
+        for name in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._bytes -= self._entries.pop(name)
+            try:
+                os.unlink(self.root / name)
+            except FileNotFoundError:
+                pass
+            blob_cache_evictions_total.inc()
+        blob_cache_bytes.set(self._bytes)
+
+    def _open_cached(self, name: str) -> Optional[BinaryIO]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            try:
+                handle = open(self.root / name, "rb")
+            except FileNotFoundError:
+                # Removed behind our back
+                self._bytes -= self._entries.pop(name)
+                blob_cache_bytes.set(self._bytes)
+                return None
+            self._entries.move_to_end(name)
+            return handle
+
+    def _store(self, name: str, file_hash: str, content: bytes) -> Optional[BinaryIO]:
+        """Write a build into the cache and open it; None if it cannot be cached"""
+        if len(content) > self.max_bytes:
+            return None
+        if hashlib.sha256(content).hexdigest() != file_hash.lower():
+            blob_cache_requests_total.inc(result="hash_mismatch")
+            logger.warning(f"BLOB cache: content of {name} does not match its file_hash, not cached")
+            return None
+        temp_path = self.root / f"{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, self.root / name)
+        except OSError as e:
+            # A full or read-only disk must not break downloads
+            temp_path.unlink(missing_ok=True)
+            logger.warning(f"BLOB cache write failed for {name}: {e}")
+            return None
+        with self._lock:
+            self._bytes += len(content) - self._entries.pop(name, 0)
+            self._entries[name] = len(content)
+            self._evict(keep=name)
+            return open(self.root / name, "rb")
+
+    def open(self, version_id: int, file_hash: Optional[str],
+             loader: Callable[[], Optional[bytes]]) -> Union[BinaryIO, bytes, None]:
+        """
+        An open handle on the cached build, loading it with loader() on a miss
+        Returns the content itself when the build cannot be cached (too large,
+        no sha256 file_hash or one the content does not match, disk error) and
+        None when loader() found nothing
+        """
+        if not file_hash or not _HASH_RE.match(file_hash) or self.max_bytes <= 0:
+            blob_cache_requests_total.inc(result="bypass")
+            return loader()
+        name = self._name(version_id, file_hash)
+        handle = self._open_cached(name)
+        if handle is not None:
+            blob_cache_requests_total.inc(result="hit")
+            return handle
+
+        with self._lock:
+            flight = self._flights.get(name)
+            leader = flight is None
+            if leader:
+                flight = self._flights[name] = _Flight()
+
+        if not leader:
+            blob_cache_requests_total.inc(result="coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            if not flight.cached:
+                return flight.content
+            handle = self._open_cached(name)
+            # Evicted before we got to it (cache far too small): load again
+            return handle if handle is not None else self.open(version_id, file_hash, loader)
+
+        blob_cache_requests_total.inc(result="miss")
+        try:
+            content = loader()
+            handle = self._store(name, file_hash, content) if content else None
+            flight.cached = handle is not None
+            if handle is None:
+                flight.content = content
+                return content
+            return handle
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[name]
+            flight.done.set()
+
+    def discard_version(self, version_id: int):
+        """Remove the cached builds of a deleted version"""
+        prefix = f"{int(version_id)}-"
+        with self._lock:
+            for name in [name for name in self._entries if name.startswith(prefix)]:
+                self._bytes -= self._entries.pop(name)
+                try:
+                    os.unlink(self.root / name)
+                except FileNotFoundError:
+                    pass
+            blob_cache_bytes.set(self._bytes)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"builds": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "loading": len(self._flights)}
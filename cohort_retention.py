@@ -0,0 +1,213 @@
+"""
+Incremental cohort retention (D1/D7/D30...)
+A user's cohort in an app is the day of their first session in it. Two tables
+are kept up to date as sessions start:
+
+- retention_members: (app_id, user_id) -> cohort_day and active_days, a
+  bitmap of the day offsets (0..MAX_DAY_OFFSET) on which the user had a session
+- retention_activity: (app_id, cohort_day, day_offset) -> active_count, the
+  retention matrix; offset 0 is the cohort size
+
+record_activity() sets the session's bit and, only when it was not set yet,
+adds one to the matrix cell, so repeated sessions on a day are counted once
+and the matrix is a primary-key range read instead of self-joins over
+user_sessions. backfill() rebuilds both from the sessions still in MySQL
+(merged with what is already recorded, so days whose sessions retention has
+since removed are kept), then recomputes the matrix one cohort at a time.
+
+Run the backfill right after add_cohort_retention.sql: until then every
+existing user starting a session is filed under that day's cohort. The
+backfill moves them back to their first session day.
+
+Usage:
+    python cohort_retention.py --backfill            # every app
+    python cohort_retention.py --backfill --app 3
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_TABLE = "retention_members"
+ACTIVITY_TABLE = "retention_activity"
+# active_days is a BIGINT UNSIGNED: one bit per day since the cohort day
+MAX_DAY_OFFSET = 63
+BATCH_SIZE = 1000
+
+
+def record_activity(cursor, app_id: int, user_id: int, day: Optional[date] = None):
+    """Count a session of user_id on day (default: today) inside the caller's transaction"""
+    day_sql, day_params = ("%s", [day]) if day else ("CURDATE()", [])
+    cursor.execute(
+        f"INSERT IGNORE INTO {MEMBERS_TABLE} (app_id, user_id, cohort_day, active_days) VALUES (%s, %s, {day_sql}, 0)",
+        [app_id, user_id, *day_params]
+    )
+    cursor.execute(
+        f"""SELECT cohort_day, DATEDIFF({day_sql}, cohort_day), active_days FROM {MEMBERS_TABLE}
+           WHERE app_id = %s AND user_id = %s FOR UPDATE""",
+        [*day_params, app_id, user_id]
+    )
+    cohort_day, offset, active_days = cursor.fetchone()
+    if not 0 <= offset <= MAX_DAY_OFFSET or active_days & (1 << offset):
+        return
+    cursor.execute(
+        f"UPDATE {MEMBERS_TABLE} SET active_days = active_days | %s WHERE app_id = %s AND user_id = %s",
+        (1 << offset, app_id, user_id)
+    )
+    cursor.execute(
+        f"""INSERT INTO {ACTIVITY_TABLE} (app_id, cohort_day, day_offset, active_count)
+           VALUES (%s, %s, %s, 1)
+           ON DUPLICATE KEY UPDATE active_count = active_count + 1""",
+        (app_id, cohort_day, offset)
+    )
+
+
+def _bits_to_cells(members) -> Dict[tuple, int]:
+    cells: Dict[tuple, int] = defaultdict(int)
+    for cohort_day, active_days in members:
+        offset = 0
+        while active_days:
+            if active_days & 1:
+                cells[(cohort_day, offset)] += 1
+            active_days >>= 1
+            offset += 1
+    return cells
+
+
+def backfill_app(connection, app_id: int) -> Dict[str, int]:
+    """Rebuild one app's members and matrix from user_sessions"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT user_id, DATE(start_time) as day
+               FROM user_sessions
+               WHERE app_id = %s
+               GROUP BY user_id, DATE(start_time)
+               ORDER BY user_id, day""",
+            (app_id,)
+        )
+        members: Dict[int, list] = {}
+        for user_id, day in cursor.fetchall():
+            member = members.setdefault(user_id, [day, 0])
+            offset = (day - member[0]).days
+            if offset <= MAX_DAY_OFFSET:
+                member[1] |= 1 << offset
+        connection.commit()
+
+        rows = sorted((user_id, cohort_day, active_days) for user_id, (cohort_day, active_days) in members.items())
+        for start in range(0, len(rows), BATCH_SIZE):
+            chunk = rows[start:start + BATCH_SIZE]
+            # Same cohort: keep the days recorded live too. An older cohort in the
+            # sessions wins; a newer one means its first sessions were already purged
+            cursor.execute(
+                f"""INSERT INTO {MEMBERS_TABLE} (app_id, user_id, cohort_day, active_days)
+                   VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}
+                   ON DUPLICATE KEY UPDATE
+                       active_days = IF(cohort_day = VALUES(cohort_day), active_days | VALUES(active_days),
+                                        IF(VALUES(cohort_day) < cohort_day, VALUES(active_days), active_days)),
+                       cohort_day = LEAST(cohort_day, VALUES(cohort_day))""",
+                [value for user_id, cohort_day, active_days in chunk
+                 for value in (app_id, user_id, cohort_day, active_days)]
+            )
+            connection.commit()
+
+        # Cohorts with members, and cohorts left with cells only (their members moved to an older one)
+        cursor.execute(
+            f"""SELECT cohort_day FROM {MEMBERS_TABLE} WHERE app_id = %s
+               UNION SELECT cohort_day FROM {ACTIVITY_TABLE} WHERE app_id = %s""",
+            (app_id, app_id)
+        )
+        cohort_days = sorted(row[0] for row in cursor.fetchall())
+        cells = 0
+        for cohort_day in cohort_days:
+            cells += _rebuild_cohort(connection, cursor, app_id, cohort_day)
+    return {"app_id": app_id, "users": len(members), "cells": cells}
+
+
+def _rebuild_cohort(connection, cursor, app_id: int, cohort_day: date) -> int:
+    """Recompute one cohort's cells from its members' bitmaps"""
+    # Only this cohort's members are locked (idx_app_cohort), for one short transaction:
+    # record_activity() for them waits, every other session start goes through
+    cursor.execute(
+        f"SELECT cohort_day, active_days FROM {MEMBERS_TABLE} WHERE app_id = %s AND cohort_day = %s FOR UPDATE",
+        (app_id, cohort_day)
+    )
+    cells = sorted(_bits_to_cells(cursor.fetchall()).items())
+    cursor.execute(f"DELETE FROM {ACTIVITY_TABLE} WHERE app_id = %s AND cohort_day = %s", (app_id, cohort_day))
+    if cells:
+        cursor.execute(
+            f"""INSERT INTO {ACTIVITY_TABLE} (app_id, cohort_day, day_offset, active_count)
+               VALUES {', '.join(['(%s, %s, %s, %s)'] * len(cells))}""",
+            [value for (day, offset), count in cells for value in (app_id, day, offset, count)]
+        )
+    connection.commit()
+    return len(cells)
+
+
+def backfill(connection, app_ids: Optional[List[int]] = None) -> List[Dict[str, int]]:
+    if app_ids is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM apps ORDER BY id")
+            app_ids = [row[0] for row in cursor.fetchall()]
+    reports = []
+    for app_id in app_ids:
+        reports.append(backfill_app(connection, app_id))
+        logger.info(f"Cohort retention: app {app_id} backfilled ({reports[-1]['users']} users)")
+    return reports
+
+
+def retention_matrix(cursor, app_id: int, from_day: date, to_day: date, max_day: int = 30,
+                     today: Optional[date] = None) -> Dict[str, Any]:
+    """Cohorts from_day..to_day with active users and rates per day offset (DictCursor)"""
+    today = today or date.today()
+    cursor.execute(
+        f"""SELECT cohort_day, day_offset, active_count FROM {ACTIVITY_TABLE}
+           WHERE app_id = %s AND cohort_day BETWEEN %s AND %s AND day_offset <= %s
+           ORDER BY cohort_day, day_offset""",
+        (app_id, from_day, to_day, max_day)
+    )
+    matrix: Dict[date, Dict[int, int]] = defaultdict(dict)
+    for row in cursor.fetchall():
+        matrix[row['cohort_day']][row['day_offset']] = row['active_count']
+
+    cohorts = []
+    totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    for cohort_day in sorted(matrix):
+        size = matrix[cohort_day].get(0, 0)
+        # Offsets whose day is over; today's is still filling up
+        complete = min(max_day, (today - cohort_day).days - 1)
+        active = [matrix[cohort_day].get(offset, 0) for offset in range(complete + 1)]
+        cohorts.append({
+            "cohort_day": cohort_day.isoformat(),
+            "size": size,
+            "active": active,
+            "rates": [round(count / size, 4) if size else None for count in active],
+        })
+        for offset, count in enumerate(active):
+            totals[offset][0] += count
+            totals[offset][1] += size
+
+    summary = {f"d{offset}": round(active / size, 4) if size else None
+               for offset, (active, size) in sorted(totals.items()) if offset in (1, 7, 30)}
+    return {"cohorts": cohorts, "summary": summary}
+
+
+def main():
+    from multi_app_api import get_db
+
+    parser = argparse.ArgumentParser(description="Cohort retention matrix")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild the matrix from user_sessions")
+    parser.add_argument("--app", type=int, action="append", help="App id (repeatable, default: all)")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do (pass --backfill)")
+    logging.basicConfig(level=logging.INFO)
+    with get_db() as connection:
+        for report in backfill(connection, args.app):
+            print(report)
+
+
+if __name__ == "__main__":
+    main()
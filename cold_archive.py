@@ -0,0 +1,351 @@
+"""
+Cold archive of expired telemetry
+Rows leaving MySQL through retention (dropped partitions, rotated months,
+per-app purges) are streamed in keyset batches into zstd-compressed Parquet
+files, laid out as:
+
+    <root>/<table>/app_id=<id>/month=<YYYY-MM>/part.parquet
+
+One file per (table, app, month): an export is written to a temporary file
+and then merged into part.parquet, keeping one copy of each id. A retention
+run retried after a crash, or a month exported from the live table and
+later from {table}_archive_YYYYMM, therefore never archives a row twice.
+Files named <source>-<first id>-<last id>.parquet by earlier versions are
+folded in on the next export of their month, or with --compact.
+
+ColdArchiveReader answers the daily session and error summary aggregations
+from those files with pyarrow's vectorised scans.
+
+Usage:
+    python cold_archive.py --table user_sessions --before 2025-01-01
+    python cold_archive.py --from-archive-tables
+    python cold_archive.py --compact
+"""
+import argparse
+import fcntl
+import logging
+import os
+import uuid
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymysql.constants import FIELD_TYPE
+
+from versioning import version_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = "zstd"
+
+# MySQL ENUM order, so the archive sorts severities like ORDER BY severity DESC
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+
+INTEGER_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG,
+                 FIELD_TYPE.INT24, FIELD_TYPE.YEAR}
+FLOAT_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+DATETIME_TYPES = {FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP}
+
+
+def require_pyarrow():
+    if not HAS_PYARROW:
+        raise RuntimeError("pyarrow is required for the cold archive (pip install pyarrow)")
+
+
+def _arrow_field(name: str, type_code: int):
+    if type_code in INTEGER_TYPES:
+        return pa.field(name, pa.int64()), None
+    if type_code in FLOAT_TYPES:
+        return pa.field(name, pa.float64()), lambda v: float(v) if isinstance(v, Decimal) else v
+    if type_code in DATETIME_TYPES:
+        return pa.field(name, pa.timestamp("us")), None
+    if type_code == FIELD_TYPE.DATE:
+        return pa.field(name, pa.date32()), None
+    # VARCHAR, TEXT, ENUM, JSON, ...
+    return pa.field(name, pa.string()), lambda v: v.decode("utf-8", "replace") if isinstance(v, bytes) else str(v)
+
+
+def version_range(versions: List[Optional[str]]) -> Dict[str, Optional[str]]:
+    """first/last version ordered like semver (unparseable strings sort first, as text)"""
+    versions = [version for version in versions if version is not None]
+    if not versions:
+        return {"first_version": None, "last_version": None}
+    keys = {version: version_key(version) for version in versions}
+    ordered = sorted(versions, key=lambda version: (-1 if keys[version] is None else keys[version], version))
+    return {"first_version": ordered[0], "last_version": ordered[-1]}
+
+
+MONTH_FILE = "part.parquet"
+
+
+def _dedupe_ids(table):
+    """First row of each id"""
+    seen, keep = set(), []
+    for index, row_id in enumerate(table.column("id").to_pylist()):
+        if row_id not in seen:
+            seen.add(row_id)
+            keep.append(index)
+    return table if len(keep) == table.num_rows else table.take(keep)
+
+
+class _BatchSchema:
+    """Arrow schema and per-column converters derived from cursor.description"""
+
+    def __init__(self, description):
+        fields, self.converters = [], []
+        for column in description:
+            field, converter = _arrow_field(column[0], column[1])
+            fields.append(field)
+            self.converters.append((column[0], converter))
+        self.schema = pa.schema(fields)
+
+    def to_table(self, rows: List[Dict[str, Any]]):
+        columns = {}
+        for name, converter in self.converters:
+            values = [row[name] for row in rows]
+            if converter:
+                values = [None if value is None else converter(value) for value in values]
+            columns[name] = values
+        return pa.Table.from_pydict(columns, schema=self.schema)
+
+
+class ColdArchiver:
+    """Streams rows out of MySQL into partitioned Parquet files"""
+
+    def __init__(self, root, batch_size: int = 10000, compression: str = COMPRESSION):
+        self.root = Path(root)
+        self.batch_size = batch_size
+        self.compression = compression
+
+    def export(self, cursor, table: str, column: str, source: str,
+               start: Optional[date], end: date, app_id: Optional[int] = None) -> int:
+        """Archive rows of `source` with start <= column < end (optionally one app).
+
+        Matches the RetentionManager exporter signature; `cursor` must be a DictCursor.
+        Rows are merged into the month files by id, so retries are safe.
+        """
+        require_pyarrow()
+        conditions, params = [f"{column} < %s"], [end]
+        if start is not None:
+            conditions.append(f"{column} >= %s")
+            params.append(start)
+        if app_id is not None:
+            conditions.append("app_id = %s")
+            params.append(app_id)
+
+        writers: Dict[Tuple[int, str], list] = {}
+        batch_schema = None
+        last_key = None
+        exported = 0
+        try:
+            while True:
+                keyset, keyset_params = "", []
+                if last_key:
+                    keyset = f" AND ({column} > %s OR ({column} = %s AND id > %s))"
+                    keyset_params = [last_key[0], last_key[0], last_key[1]]
+                cursor.execute(
+                    f"SELECT * FROM {source} WHERE {' AND '.join(conditions)}{keyset} "
+                    f"ORDER BY {column}, id LIMIT %s",
+                    params + keyset_params + [self.batch_size]
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                if batch_schema is None:
+                    batch_schema = _BatchSchema(cursor.description)
+
+                groups: Dict[Tuple[int, str], list] = {}
+                for row in rows:
+                    groups.setdefault((row["app_id"], f"{row[column]:%Y-%m}"), []).append(row)
+                for key, group in groups.items():
+                    self._write(writers, table, source, key, batch_schema, group)
+
+                exported += len(rows)
+                last_key = (rows[-1][column], rows[-1]["id"])
+                if len(rows) < self.batch_size:
+                    break
+        except Exception:
+            for writer, temp_path in writers.values():
+                writer.close()
+                temp_path.unlink(missing_ok=True)
+            raise
+
+        for writer, temp_path in writers.values():
+            writer.close()
+            self._merge(temp_path.parent, temp_path)
+        if exported:
+            logger.info(f"Cold archive: {exported} rows of {source} exported ({len(writers)} files)")
+        return exported
+
+    def _write(self, writers, table, source, key, batch_schema, rows):
+        state = writers.get(key)
+        if state is None:
+            directory = self.root / table / f"app_id={key[0]}" / f"month={key[1]}"
+            directory.mkdir(parents=True, exist_ok=True)
+            temp_path = directory / f".{source}-{uuid.uuid4().hex}.tmp"
+            writer = pq.ParquetWriter(temp_path, batch_schema.schema, compression=self.compression)
+            state = writers[key] = [writer, temp_path]
+        # Each batch becomes a row group
+        state[0].write_table(batch_schema.to_table(rows))
+
+    def _merge(self, directory: Path, new_path: Optional[Path] = None):
+        """Fold new_path and any other Parquet file of a month directory into part.parquet"""
+        target = directory / MONTH_FILE
+        with open(directory / ".lock", "w") as lock:
+            # Concurrent exports of the same month must not drop each other's rows
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            existing = sorted(directory.glob("*.parquet"))
+            if new_path is None and existing == [target]:
+                return
+            if new_path is not None and not existing:
+                os.replace(new_path, target)
+                return
+            # Existing rows first: the copy already archived is the one kept
+            paths = existing + ([new_path] if new_path is not None else [])
+            merged = _dedupe_ids(pa.concat_tables([pq.read_table(path, partitioning=None) for path in paths],
+                                                  promote_options="default"))
+            merged_path = directory / f".merge-{uuid.uuid4().hex}.tmp"
+            pq.write_table(merged, merged_path, compression=self.compression)
+            os.replace(merged_path, target)
+            for path in paths:
+                if path != target:
+                    path.unlink(missing_ok=True)
+
+    def compact(self) -> int:
+        """Merge month directories holding several files (earlier naming, interrupted merges)"""
+        require_pyarrow()
+        compacted = 0
+        for directory in sorted(self.root.glob("*/app_id=*/month=*")):
+            files = list(directory.glob("*.parquet"))
+            if len(files) > 1 or (files and files[0].name != MONTH_FILE):
+                self._merge(directory)
+                compacted += 1
+        return compacted
+
+
+class ColdArchiveReader:
+    """Aggregations over the Parquet archive, mirroring the live analytics endpoints"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _scan(self, table: str, column: str, app_id: int, start: date, end: date,
+              columns: List[str], extra_filter=None):
+        require_pyarrow()
+        path = self.root / table / f"app_id={app_id}"
+        if not path.exists():
+            return None
+        dataset = ds.dataset(path, format="parquet", partitioning="hive",
+                             ignore_prefixes=[".", "_"])
+        start_at = datetime.combine(start, dt_time.min)
+        end_at = datetime.combine(end, dt_time.min)
+        # month= directories prune whole files before the row-level predicate
+        expression = (
+            (ds.field("month") >= f"{start:%Y-%m}") & (ds.field("month") <= f"{end:%Y-%m}")
+            & (ds.field(column) >= pa.scalar(start_at, pa.timestamp("us")))
+            & (ds.field(column) < pa.scalar(end_at, pa.timestamp("us")))
+        )
+        if extra_filter is not None:
+            expression = expression & extra_filter
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def daily_session_stats(self, app_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        """Same shape as get_daily_session_stats, for start <= day < end"""
+        sessions = self._scan("user_sessions", "start_time", app_id, start, end,
+                              ["start_time", "user_id", "id", "duration_seconds"])
+        if sessions is None or sessions.num_rows == 0:
+            return []
+        days = pc.cast(pc.floor_temporal(sessions["start_time"], unit="day"), pa.date32())
+        sessions = sessions.append_column("date", days)
+        stats = sessions.group_by("date").aggregate([
+            ("user_id", "count_distinct"),
+            ("id", "count"),
+            ("duration_seconds", "mean"),
+        ]).sort_by([("date", "descending")])
+        return [
+            {
+                "date": row["date"],
+                "unique_users": row["user_id_count_distinct"],
+                "total_sessions": row["id_count"],
+                "avg_duration": row["duration_seconds_mean"],
+            }
+            for row in stats.to_pylist()
+        ]
+
+    def error_summary(self, app_id: int, start: date, end: date,
+                      severity: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Same shape as get_error_summary, for start <= day < end"""
+        extra = ds.field("severity") == severity if severity else None
+        errors = self._scan("app_error_logs", "created_at", app_id, start, end,
+                            ["error_type", "severity", "created_at", "user_id", "app_version"], extra)
+        if errors is None or errors.num_rows == 0:
+            return []
+        summary = errors.group_by(["error_type", "severity"]).aggregate([
+            ("created_at", "count"),
+            ("created_at", "max"),
+            ("user_id", "count_distinct"),
+            ("app_version", "distinct"),
+        ])
+        rows = [
+            {
+                "error_type": row["error_type"],
+                "severity": row["severity"],
+                "error_count": row["created_at_count"],
+                "last_occurrence": row["created_at_max"],
+                "affected_users": row["user_id_count_distinct"],
+                **version_range(row["app_version_distinct"]),
+            }
+            for row in summary.to_pylist()
+        ]
+        rows.sort(key=lambda row: (SEVERITY_RANK.get(row["severity"], 0), row["error_count"]), reverse=True)
+        return rows[:limit]
+
+
+def main():
+    from multi_app_api import cold_archiver, get_db
+    from retention import TELEMETRY_TABLES, RetentionManager, month_of, add_months
+    import pymysql.cursors
+
+    parser = argparse.ArgumentParser(description="Export old telemetry to the Parquet cold archive")
+    parser.add_argument("--table", choices=sorted(TELEMETRY_TABLES), action="append",
+                        help="Table to export (repeatable, default: all)")
+    parser.add_argument("--before", type=date.fromisoformat, help="Export live rows older than this date")
+    parser.add_argument("--from-archive-tables", action="store_true",
+                        help="Export the {table}_archive_YYYYMM tables left by retention")
+    parser.add_argument("--compact", action="store_true",
+                        help="Merge month directories still holding several files")
+    args = parser.parse_args()
+    if not args.before and not args.from_archive_tables and not args.compact:
+        parser.error("pass --before, --from-archive-tables and/or --compact")
+    if args.compact:
+        print({"compacted_months": cold_archiver.compact()})
+        if not args.before and not args.from_archive_tables:
+            return
+
+    tables = args.table or list(TELEMETRY_TABLES)
+    retention = RetentionManager(get_db)
+    with get_db() as connection:
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            for table in tables:
+                column = TELEMETRY_TABLES[table]
+                if args.before:
+                    cold_archiver.export(cursor, table, column, table, None, args.before)
+                if args.from_archive_tables:
+                    for archive in retention.archive_tables(cursor, table):
+                        month = month_of(archive)
+                        if month is not None:
+                            cold_archiver.export(cursor, table, column, archive, month, add_months(month, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Download admission control
+Release day sends every device to /api/v2/download/ at once. Each download
+holds a whole build in memory and a slice of the volume bandwidth, so the
+number running concurrently is capped globally and per client IP. Requests
+over the cap wait briefly in a bounded queue; when the queue is full or the
+wait times out they get 503 (or 429 for the per-IP cap) with a jittered
+Retry-After, so retries spread out instead of arriving together.
+
+A slot is held until the response body has been sent or the client went
+away (AdmittedStreamingResponse and AdmittedFileResponse release it), not
+just until the handler returns.
+"""
+import asyncio
+import os
+import random
+import time
+from functools import partial
+from typing import BinaryIO, Dict, Optional
+
+import anyio
+import anyio.to_thread
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+download_admissions_total = REGISTRY.register(Counter(
+    "download_admissions_total", "Download admission decisions", ("outcome",)))
+downloads_active = REGISTRY.register(Gauge(
+    "downloads_active", "Downloads currently holding an admission slot"))
+downloads_queued = REGISTRY.register(Gauge(
+    "downloads_queued", "Downloads waiting for an admission slot"))
+download_queue_wait_seconds = REGISTRY.register(Histogram(
+    "download_queue_wait_seconds", "Time downloads waited for a slot",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+
+
+def client_ip(request: Request, trusted_hops: int = 1) -> str:
+    """
+    Client address as seen by the trusted proxies in front of the app
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so only the last trusted_hops entries can be believed:
+    the one added by the outermost trusted proxy is the client. Earlier
+    entries are whatever the client sent. Without enough hops (or with
+    trusted_hops=0) the peer address is used.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and trusted_hops > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return request.client.host if request.client else "unknown"
+
+
+class DownloadTicket:
+    """An admitted download; release() is idempotent"""
+
+    def __init__(self, admission: "DownloadAdmission", ip: str):
+        self._admission = admission
+        self._ip = ip
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._admission._release(self._ip)
+
+
+class DownloadAdmission:
+    def __init__(self, max_concurrent: int = 20, max_per_ip: int = 0, max_queue: int = 100,
+                 queue_timeout: float = 10, retry_after: int = 30):
+        """max_per_ip=0 disables the per-IP cap (devices behind carrier NAT share an address)"""
+        self.max_concurrent = max_concurrent
+        self.max_per_ip = max_per_ip
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._per_ip: Dict[str, int] = {}
+        self._queued = 0
+
+    def _reject(self, outcome: str, status_code: int, detail: str):
+        download_admissions_total.inc(outcome=outcome)
+        # Jitter so rejected clients do not come back in lockstep
+        retry_after = max(1, int(self.retry_after * random.uniform(0.5, 1.5)))
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(retry_after)})
+
+    async def admit(self, ip: str) -> DownloadTicket:
+        """Wait for a slot or raise HTTPException(429/503) with Retry-After"""
+        if self.max_per_ip > 0 and self._per_ip.get(ip, 0) >= self.max_per_ip:
+            self._reject("rejected_per_ip", 429, "Too many concurrent downloads from this address")
+        if self._slots.locked() and self._queued >= self.max_queue:
+            self._reject("rejected_queue_full", 503, "Download capacity saturated, retry later")
+
+        # Count the IP while it waits too, so one client cannot fill the queue
+        self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+        self._queued += 1
+        downloads_queued.inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_ip(ip)
+            self._reject("rejected_timeout", 503, "Download capacity saturated, retry later")
+        except BaseException:
+            self._release_ip(ip)
+            raise
+        finally:
+            self._queued -= 1
+            downloads_queued.dec()
+        download_queue_wait_seconds.observe(time.perf_counter() - started)
+        download_admissions_total.inc(outcome="admitted")
+        downloads_active.inc()
+        return DownloadTicket(self, ip)
+
+    def _release_ip(self, ip: str):
+        count = self._per_ip.get(ip, 0) - 1
+        if count > 0:
+            self._per_ip[ip] = count
+        else:
+            self._per_ip.pop(ip, None)
+
+    def _release(self, ip: str):
+        self._release_ip(ip)
+        self._slots.release()
+        downloads_active.dec()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.max_concurrent - self._slots._value,
+            "queued": self._queued,
+            "clients": len(self._per_ip),
+        }
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that releases its admission ticket once sending ends, however it ends"""
+
+    def __init__(self, content, ticket: Optional[DownloadTicket] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.ticket.release()
+
+
+class AdmittedFileResponse(Response):
+    """
+    Sends an already open file, then closes it and releases the ticket
+    Uses the ASGI zero-copy extension (sendfile) when the server offers it,
+    otherwise reads chunk_size blocks in a worker thread. Like
+    StreamingResponse it listens for http.disconnect meanwhile, so a client
+    that goes away stops the reads and frees the slot at once.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, handle: BinaryIO, ticket: Optional[DownloadTicket] = None, **kwargs):
+        super().__init__(None, **kwargs)
+        self.handle = handle
+        self.ticket = ticket
+        self.size = os.fstat(handle.fileno()).st_size
+        self.headers["content-length"] = str(self.size)
+
+    async def _send_file(self, scope, send):
+        await send({"type": "http.response.start", "status": self.status_code,
+                    "headers": self.raw_headers})
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            await send({"type": "http.response.zerocopy", "file": self.handle.fileno(),
+                        "offset": 0, "count": self.size, "more_body": False})
+        else:
+            more_body = True
+            while more_body:
+                # Not cancellable: a disconnect waits for the read in flight, then the file is closed
+                chunk = await anyio.to_thread.run_sync(self.handle.read, self.chunk_size)
+                more_body = len(chunk) == self.chunk_size
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    @staticmethod
+    async def _listen_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def __call__(self, scope, receive, send):
+        try:
+            # Whichever finishes first (file sent, client gone) cancels the other
+            async with anyio.create_task_group() as task_group:
+                async def wrap(func):
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._send_file, scope, send))
+                await wrap(partial(self._listen_for_disconnect, receive))
+        finally:
+            self.handle.close()
+            if self.ticket is not None:
+                self.ticket.release()
@@ -0,0 +1,91 @@
+"""
+Fast JSON response layer
+Serializes endpoint results with orjson (when installed) and lets JSON
+columns read from MySQL go straight into the response without a
+json.loads / re-encode round trip
+"""
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.Fragment embeds an already-encoded JSON document verbatim (orjson >= 3.10)
+HAS_FRAGMENTS = orjson is not None and hasattr(orjson, "Fragment")
+
+
+def _default(value: Any) -> Any:
+    """Encode the column types DictCursor returns that orjson/json don't handle"""
+    if isinstance(value, Decimal):
+        # Same convention as jsonable_encoder: integral decimals become ints
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def raw_json(value: Any, default: Any = None, decode: bool = False) -> Any:
+    """
+    Wrap a JSON column value so it is emitted without being re-encoded.
+    Empty or malformed values are replaced with default, like the old
+    json.loads fallbacks: a bad row must not make the whole body invalid JSON.
+    The text is only passed through as a fragment when it is going straight
+    into a json_response (orjson with Fragment support and decode=False);
+    otherwise the decoded value is returned.
+    """
+    if value is None or value == "":
+        return default
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8", errors="replace")
+    if not isinstance(value, str):
+        return value
+    passthrough = HAS_FRAGMENTS and not decode
+    try:
+        # Validating is a parse without the re-encode, still well under json.loads + dumps
+        decoded = orjson.loads(value) if orjson is not None else json.loads(value)
+    except ValueError:
+        return default
+    return orjson.Fragment(value) if passthrough else decoded
+
+
+def raw_json_fields(rows: Iterable[Dict[str, Any]], fields: Dict[str, Any], decode: bool = False) -> None:
+    """Wrap JSON columns of DictCursor rows in place; fields maps column -> default"""
+    for row in rows:
+        for field, default in fields.items():
+            if field in row:
+                row[field] = raw_json(row[field], default, decode)
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize content to UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson and native datetime/Decimal handling"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """
+    Build the response directly so FastAPI skips jsonable_encoder.
+    Required when content holds raw JSON fragments.
+    """
+    return FastJSONResponse(content=content, status_code=status_code, headers=headers)
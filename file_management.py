@@ -12,6 +12,8 @@ from datetime import datetime
 import mimetypes
 from pathlib import Path
 
+from storage_index import StorageIndex, file_sha256
+
 # Configurazione
 UPLOAD_DIR = "uploads"
 APK_DIR = os.path.join(UPLOAD_DIR, "android")
@@ -29,21 +31,20 @@ ALLOWED_EXTENSIONS = {
 
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500 MB
 
+# Indice persistente (size, mtime, inode, hash): l'hash si ricalcola solo se il file cambia
+file_index = StorageIndex(UPLOAD_DIR)
+
 def get_file_hash(file_path):
     """Calcola hash SHA256 del file"""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(chunk)
-    return sha256_hash.hexdigest()
+    return file_sha256(file_path)
 
 def get_file_info(file_path):
-    """Ottieni informazioni del file"""
-    stat = os.stat(file_path)
+    """Ottieni informazioni del file (dall'indice, ri-hash solo se modificato)"""
+    entry = file_index.lookup(file_path)
     return {
-        'size': stat.st_size,
-        'modified': datetime.fromtimestamp(stat.st_mtime),
-        'hash': get_file_hash(file_path)
+        'size': entry['size'],
+        'modified': datetime.fromtimestamp(entry['mtime_ns'] / 1e9),
+        'hash': entry['hash']
     }
 
 async def upload_app_file(
@@ -91,6 +92,7 @@ async def upload_app_file(
             buffer.write(content)
         
         # Ottieni info file
+        file_index.record(upload_path, hashlib.sha256(content).hexdigest())
         file_info = get_file_info(upload_path)
         
         # URL di download
@@ -153,6 +155,7 @@ async def upload_app_file(
         # Rimuovi file se c'è stato un errore
         if os.path.exists(upload_path):
             os.remove(upload_path)
+        file_index.remove(upload_path)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 def get_app_file(platform: str, filename: str):
@@ -187,22 +190,24 @@ def list_uploaded_files():
     """
     files = []
     
+    # Prima lettura: costruisce l'indice (poi lo aggiorna reconcile_file_index)
+    if file_index.last_reconciled is None:
+        file_index.reconcile()
+    
     for platform in ['android', 'ios']:
-        file_dir = APK_DIR if platform == 'android' else IPA_DIR
-        
-        for filename in os.listdir(file_dir):
-            file_path = os.path.join(file_dir, filename)
-            if os.path.isfile(file_path):
-                file_info = get_file_info(file_path)
-                files.append({
-                    "filename": filename,
-                    "platform": platform,
-                    "size": file_info['size'],
-                    "size_mb": round(file_info['size'] / (1024*1024), 2),
-                    "modified": file_info['modified'].isoformat(),
-                    "hash": file_info['hash'],
-                    "download_url": f"/download/{platform}/{filename}"
-                })
+        for entry in file_index.entries(f"{platform}/"):
+            filename = entry['path'].split('/', 1)[1]
+            if '/' in filename:
+                continue
+            files.append({
+                "filename": filename,
+                "platform": platform,
+                "size": entry['size'],
+                "size_mb": round(entry['size'] / (1024*1024), 2),
+                "modified": datetime.fromtimestamp(entry['mtime_ns'] / 1e9).isoformat(),
+                "hash": entry['hash'],
+                "download_url": f"/download/{platform}/{filename}"
+            })
     
     return {"files": sorted(files, key=lambda x: x['modified'], reverse=True)}
 
@@ -221,6 +226,7 @@ def delete_app_file(platform: str, filename: str):
     
     try:
         os.remove(file_path)
+        file_index.remove(file_path)
         
         # Rimuovi anche dal database
         conn = pymysql.connect(
@@ -242,4 +248,11 @@ def delete_app_file(platform: str, filename: str):
         return {"success": True, "message": f"File {filename} deleted successfully"}
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+def reconcile_file_index():
+    """
+    Allinea l'indice ai file su disco (da chiamare periodicamente)
+    Ricalcola l'hash solo dei file con size/mtime/inode cambiati
+    """
+    return file_index.reconcile()
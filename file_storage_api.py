@@ -5,26 +5,108 @@ Uses Railway persistent volume instead of MySQL BLOB
 import os
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
 import hashlib
 import json
+import uuid
 from datetime import datetime
 
+import anyio
+import anyio.to_thread
+
+from storage_index import StorageIndex
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
 class FileStorageManager:
-    def __init__(self, base_path: str = "/app/storage"):
+    def __init__(self, base_path: str = "/app/storage", buffer_size: int = DEFAULT_BUFFER_SIZE):
         """
         Initialize file storage manager
         On Railway, use persistent volume mounted at /app/storage
+        buffer_size: chunk size for reads and writes
         """
+        self.buffer_size = buffer_size
+        self._index = None
         self.base_path = Path(base_path)
         self.ensure_directories()
     
+    @property
+    def base_path(self) -> Path:
+        return self._base_path
+    
+    @base_path.setter
+    def base_path(self, value):
+        # The index lives in the storage root, so it follows base_path changes
+        self._base_path = Path(value)
+        if self._index is not None and self._index.root != self._base_path:
+            self._index.close()
+            self._index = None
+    
+    @property
+    def index(self) -> StorageIndex:
+        """Size/mtime/inode/hash of every stored file (metadata sidecars excluded)"""
+        if self._index is None:
+            self._base_path.mkdir(parents=True, exist_ok=True)
+            self._index = StorageIndex(self._base_path, ignore=self._not_indexed)
+        return self._index
+    
+    @staticmethod
+    def _not_indexed(relative_path: str) -> bool:
+        # Metadata sidecars, in-flight writes and quarantined files
+        return (relative_path.endswith('.json')
+                or relative_path.startswith(('temp/', 'quarantine/')))
+    
+    # Writes go to temp/ + fsync + rename, so a crash never leaves a truncated
+    # file at the final path (temp/ is on the same volume, rename is atomic)
+    
+    def begin_write(self):
+        """Open a temp file for a streamed write; finish with commit_write or abort_write"""
+        temp_path = self.base_path / "temp" / f"{uuid.uuid4().hex}.part"
+        temp_path.parent.mkdir(parents=True, exist_ok=True)
+        return open(temp_path, 'wb'), temp_path
+    
+    def write_chunk(self, handle, data: Union[bytes, memoryview]):
+        """Write data in buffer_size slices"""
+        view = memoryview(data)
+        for offset in range(0, len(view), self.buffer_size):
+            handle.write(view[offset:offset + self.buffer_size])
+    
+    def commit_write(self, handle, temp_path: Path, target: Path):
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+        os.replace(temp_path, target)
+        self._fsync_directory(target.parent)
+    
+    def abort_write(self, handle, temp_path: Path):
+        handle.close()
+        temp_path.unlink(missing_ok=True)
+    
+    def _atomic_write(self, target: Path, content: bytes):
+        handle, temp_path = self.begin_write()
+        try:
+            self.write_chunk(handle, content)
+            self.commit_write(handle, temp_path, target)
+        except BaseException:
+            self.abort_write(handle, temp_path)
+            raise
+    
+    @staticmethod
+    def _fsync_directory(directory: Path):
+        # Persist the rename itself
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+    
     def ensure_directories(self):
         """Create necessary directory structure"""
         dirs = [
             self.base_path / "versions",
             self.base_path / "temp",
-            self.base_path / "backups"
+            self.base_path / "backups",
+            self.base_path / "quarantine"
         ]
         for dir_path in dirs:
             dir_path.mkdir(parents=True, exist_ok=True)
@@ -41,27 +123,30 @@ class FileStorageManager:
         """Save file to disk and return metadata"""
         file_path = self.get_file_path(app_id, version, platform, filename)
         
-        # Write file
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        # Write file (atomically: readers see the old file or the complete new one)
+        self._atomic_write(file_path, file_content)
         
         # Calculate hash
         file_hash = hashlib.sha256(file_content).hexdigest()
         
+        return self.finish_save(file_path, len(file_content), file_hash)
+    
+    def finish_save(self, file_path: Path, size: int, file_hash: str) -> dict:
+        """Write the metadata sidecar and index a file now in place"""
         # Create metadata
         metadata = {
             "file_path": str(file_path),
             "relative_path": str(file_path.relative_to(self.base_path)),
-            "size": len(file_content),
+            "size": size,
             "hash": file_hash,
             "created_at": datetime.now().isoformat()
         }
         
         # Save metadata
         metadata_path = file_path.with_suffix('.json')
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        self._atomic_write(metadata_path, json.dumps(metadata, indent=2).encode())
         
+        self.index.record(file_path, file_hash)
         return metadata
     
     def read_file(self, relative_path: str) -> bytes:
@@ -73,6 +158,19 @@ class FileStorageManager:
         with open(file_path, 'rb') as f:
             return f.read()
     
+    def iter_file(self, relative_path: str) -> Iterator[bytes]:
+        """Read a stored file in buffer_size chunks"""
+        file_path = self.base_path / relative_path
+        if not file_path.exists():
+            raise FileNotFoundError(f"File not found: {relative_path}")
+        
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.buffer_size), b""):
+                yield chunk
+    
+    def file_size(self, relative_path: str) -> int:
+        return (self.base_path / relative_path).stat().st_size
+    
     def delete_file(self, relative_path: str) -> bool:
         """Delete file and its metadata"""
         file_path = self.base_path / relative_path
@@ -82,6 +180,7 @@ class FileStorageManager:
             file_path.unlink()
         if metadata_path.exists():
             metadata_path.unlink()
+        self.index.remove(relative_path)
         
         # Remove empty directories
         try:
@@ -92,15 +191,42 @@ class FileStorageManager:
         
         return True
     
+    def quarantine(self, relative_path: str, reason: str) -> str:
+        """Move a file (and its sidecar) out of the served tree; returns its new relative path"""
+        source = self.base_path / relative_path
+        target = self.base_path / "quarantine" / reason / datetime.now().strftime("%Y%m%d-%H%M%S") / relative_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, target)
+        metadata_path = source.with_suffix('.json')
+        if metadata_path.exists():
+            os.replace(metadata_path, target.with_suffix('.json'))
+        self.index.remove(relative_path)
+        return str(target.relative_to(self.base_path))
+    
+    def list_files(self, prefix: str = "versions/") -> list:
+        """Indexed files under prefix (relative path, size, mtime, hash)"""
+        return [
+            {
+                "relative_path": entry["path"],
+                "size": entry["size"],
+                "modified": datetime.fromtimestamp(entry["mtime_ns"] / 1e9).isoformat(),
+                "hash": entry["hash"]
+            }
+            for entry in self.index.entries(prefix)
+        ]
+    
+    def reconcile_index(self) -> dict:
+        """Re-index files changed outside save_file/delete_file (background scanner)"""
+        return self.index.reconcile()
+    
     def get_storage_stats(self) -> dict:
-        """Get storage usage statistics"""
-        total_size = 0
-        file_count = 0
-        
-        for file_path in self.base_path.rglob("*"):
-            if file_path.is_file() and not file_path.suffix == '.json':
-                total_size += file_path.stat().st_size
-                file_count += 1
+        """Get storage usage statistics (from the index)"""
+        if self.index.last_reconciled is None:
+            # First use on an existing volume: build the index once
+            self.index.reconcile()
+        stats = self.index.stats()
+        total_size = stats["bytes"]
+        file_count = stats["files"]
         
         return {
             "total_files": file_count,
@@ -109,6 +235,113 @@ class FileStorageManager:
             "total_size_gb": round(total_size / (1024 * 1024 * 1024), 2)
         }
 
+class AsyncFileStorageManager:
+    """
+    Awaitable FileStorageManager with the same API surface
+    Blocking disk work runs in worker threads, at most max_concurrency at a
+    time, so a large save or read never stalls the event loop; bulk data moves
+    in buffer_size chunks.
+    """
+    def __init__(self, storage: FileStorageManager, max_concurrency: int = 4):
+        self.storage = storage
+        self.max_concurrency = max_concurrency
+        self._limiter = None
+    
+    @property
+    def base_path(self) -> Path:
+        return self.storage.base_path
+    
+    @property
+    def buffer_size(self) -> int:
+        return self.storage.buffer_size
+    
+    async def _run(self, func, *args):
+        if self._limiter is None:
+            # Needs a running event loop, so created on first use
+            self._limiter = anyio.CapacityLimiter(self.max_concurrency)
+        return await anyio.to_thread.run_sync(func, *args, limiter=self._limiter)
+    
+    async def save_file(self, app_id: int, version: str, platform: str,
+                        filename: str, file_content: bytes) -> dict:
+        return await self._run(self.storage.save_file, app_id, version, platform, filename, file_content)
+    
+    async def save_stream(self, app_id: int, version: str, platform: str,
+                          filename: str, chunks: AsyncIterable[bytes]) -> dict:
+        """Save a file from an async chunk source (e.g. UploadFile) without holding it in memory"""
+        file_path = await self._run(self.storage.get_file_path, app_id, version, platform, filename)
+        handle, temp_path = await self._run(self.storage.begin_write)
+        sha256_hash = hashlib.sha256()
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                await self._run(self._write_hashed, handle, chunk, sha256_hash)
+            await self._run(self.storage.commit_write, handle, temp_path, file_path)
+        except BaseException:
+            await anyio.to_thread.run_sync(self.storage.abort_write, handle, temp_path)
+            raise
+        return await self._run(self.storage.finish_save, file_path, size, sha256_hash.hexdigest())
+    
+    async def save_upload(self, app_id: int, version: str, platform: str, filename: str, upload) -> dict:
+        """Save a starlette UploadFile, read buffer_size at a time"""
+        async def chunks():
+            while True:
+                chunk = await upload.read(self.storage.buffer_size)
+                if not chunk:
+                    break
+                yield chunk
+        return await self.save_stream(app_id, version, platform, filename, chunks())
+    
+    async def save_chunks(self, app_id: int, version: str, platform: str, filename: str,
+                          chunks: Iterable[bytes]) -> dict:
+        """Save a file held as separate chunks without joining them into one buffer"""
+        async def source():
+            for chunk in chunks:
+                yield chunk
+        return await self.save_stream(app_id, version, platform, filename, source())
+    
+    def _write_hashed(self, handle, chunk: bytes, sha256_hash):
+        # Hashing a MB-sized chunk is CPU work too, keep it off the loop
+        sha256_hash.update(chunk)
+        self.storage.write_chunk(handle, chunk)
+    
+    async def read_file(self, relative_path: str) -> bytes:
+        return await self._run(self.storage.read_file, relative_path)
+    
+    async def iter_file(self, relative_path: str) -> AsyncIterator[bytes]:
+        """Stream a stored file in buffer_size chunks, one thread hop per chunk"""
+        file_path = self.storage.base_path / relative_path
+        try:
+            handle = await self._run(open, file_path, 'rb')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found: {relative_path}")
+        try:
+            while True:
+                chunk = await self._run(handle.read, self.storage.buffer_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            handle.close()
+    
+    async def file_size(self, relative_path: str) -> int:
+        return await self._run(self.storage.file_size, relative_path)
+    
+    async def delete_file(self, relative_path: str) -> bool:
+        return await self._run(self.storage.delete_file, relative_path)
+    
+    async def quarantine(self, relative_path: str, reason: str) -> str:
+        return await self._run(self.storage.quarantine, relative_path, reason)
+    
+    async def list_files(self, prefix: str = "versions/") -> list:
+        return await self._run(self.storage.list_files, prefix)
+    
+    async def reconcile_index(self) -> dict:
+        return await self._run(self.storage.reconcile_index)
+    
+    async def get_storage_stats(self) -> dict:
+        return await self._run(self.storage.get_storage_stats)
+
 # Initialize global storage manager
 # Use local path for development, /app/storage for production
 if os.environ.get('ENVIRONMENT', 'local') == 'local':
@@ -117,5 +350,10 @@ else:
     default_path = '/app/storage'
 
 storage_manager = FileStorageManager(
-    base_path=os.environ.get('STORAGE_PATH', default_path)
-)
\ No newline at end of file
+    base_path=os.environ.get('STORAGE_PATH', default_path),
+    buffer_size=int(os.environ.get('STORAGE_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+)
+async_storage_manager = AsyncFileStorageManager(
+    storage_manager,
+    max_concurrency=int(os.environ.get('STORAGE_IO_CONCURRENCY', 4))
+)
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import styled from 'styled-components';
 import { AlertCircle, AlertTriangle, XCircle, Info, TrendingUp, Users, Clock, RefreshCw } from 'lucide-react';
-import api from '../services/api';
+import api, { openAppStream } from '../services/api';
 
 interface ErrorSummary {
   error_type: string;
@@ -42,6 +42,23 @@ const ErrorDashboard: React.FC<Props> = ({ appIdentifier }) => {
     fetchErrors();
   }, [appIdentifier, selectedSeverity, timeRange]);
 
+  // Nuovi errori in tempo reale; il riepilogo aggregato si aggiorna con i delta
+  useEffect(() => {
+    const close = openAppStream(appIdentifier, {
+      error_reported: (error: ErrorDetail) => {
+        setRecentErrors((current) => [error, ...current].slice(0, 10));
+        if (selectedSeverity !== 'all' && error.severity !== selectedSeverity) return;
+        setErrors((current) => current.map((summary) =>
+          summary.error_type === error.error_type && summary.severity === error.severity
+            ? { ...summary, error_count: summary.error_count + 1, last_occurrence: error.created_at }
+            : summary
+        ));
+      },
+      evicted: () => fetchErrors()
+    });
+    return close;
+  }, [appIdentifier, selectedSeverity]);
+
   const fetchErrors = async () => {
     try {
       setLoading(true);
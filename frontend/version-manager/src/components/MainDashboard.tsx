@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import styled from 'styled-components';
 import { Package, Users, AlertCircle, Download, TrendingUp, Activity, Smartphone, Globe, Database, Clock, User, Mail, Calendar } from 'lucide-react';
-import api from '../services/api';
+import api, { openAppStream } from '../services/api';
 import { useNavigate } from 'react-router-dom';
 
 const Container = styled.div`
@@ -408,85 +408,106 @@ const MainDashboard: React.FC = () => {
     loadDashboardData();
   }, []);
 
+  // Stream unico per tutte le app: sessioni, errori critici e contatori senza rifare le query
+  useEffect(() => {
+    const appName = (identifier: string) =>
+      apps.find((app) => app.app_identifier === identifier)?.app_name || identifier;
+    
+    const close = openAppStream('all', {
+      session_started: (session: any) => {
+        setRecentSessions((current) => [{
+          ...session,
+          app_name: appName(session.app_identifier),
+          user_email: session.email
+        }, ...current].slice(0, 5));
+      },
+      error_reported: (error: any) => {
+        if (error.severity !== 'critical') return;
+        setCriticalErrors((current) => {
+          const existing = current.find((item) =>
+            item.app_identifier === error.app_identifier && item.error_type === error.error_type
+          );
+          if (existing) {
+            return current.map((item) => item === existing ? { ...item, count: item.count + 1 } : item);
+          }
+          return [{
+            app_name: appName(error.app_identifier),
+            app_identifier: error.app_identifier,
+            severity: error.severity,
+            count: 1,
+            error_type: error.error_type
+          }, ...current].slice(0, 6);
+        });
+      },
+      counters: ({ app_identifier, deltas }: { app_identifier: string; deltas: Record<string, number> }) => {
+        const errors = deltas.errors || 0;
+        const versions = deltas.versions_uploaded || 0;
+        if (!errors && !versions) return;
+        setSystemStats((current) => ({
+          ...current,
+          total_errors: current.total_errors + errors,
+          total_versions: current.total_versions + versions
+        }));
+        setApps((current) => current.map((app) => app.app_identifier === app_identifier
+          ? {
+              ...app,
+              error_count: (app.error_count || 0) + errors,
+              total_versions: (app.total_versions || 0) + versions
+            }
+          : app
+        ));
+      },
+      evicted: () => loadDashboardData()
+    });
+    return close;
+  }, [apps.length]);
+
   const loadDashboardData = async () => {
     try {
       setLoading(true);
       
-      // Load apps
-      const appsResponse = await api.get('/api/v2/apps');
-      const appsData = appsResponse.data.apps;
+      // Load apps, stats, critical errors and recent sessions in a single request
+      const summaryResponse = await api.get('/api/v2/dashboard/summary');
+      const summary = summaryResponse.data;
+      const appsData = summary.apps;
       
-      // For each app, load basic stats (in a real app, this would be a single endpoint)
-      const appsWithStats = await Promise.all(
-        appsData.map(async (app: any) => {
-          try {
-            const analyticsResponse = await api.get(`/api/v2/analytics/${app.app_identifier}/overview`);
-            const analytics = analyticsResponse.data;
-            
-            return {
-              ...app,
-              total_users: analytics.user_stats?.total_users || 0,
-              active_users: analytics.user_stats?.daily_active_users || 0,
-              error_count: analytics.error_stats?.unresolved_errors || 0,
-              total_versions: analytics.version_distribution?.length || 0,
-              latest_version: analytics.version_distribution?.[0]?.current_version || 'N/A'
-            };
-          } catch (error) {
-            return app;
-          }
-        })
-      );
+      const appsWithStats = appsData.map((app: any) => ({
+        ...app,
+        total_users: app.user_stats?.total_users || 0,
+        active_users: app.user_stats?.daily_active_users || 0,
+        error_count: app.error_stats?.total_errors || 0,
+        total_versions: app.total_versions || 0,
+        latest_version: app.latest_version || 'N/A'
+      }));
       
       setApps(appsWithStats);
       
-      // Calculate system stats
-      const stats = appsWithStats.reduce((acc: SystemStats, app: any) => ({
-        total_apps: acc.total_apps + 1,
-        total_users: acc.total_users + (app.total_users || 0),
-        total_errors: acc.total_errors + (app.error_count || 0),
-        active_users_today: acc.active_users_today + (app.active_users || 0),
-        total_versions: acc.total_versions + (app.total_versions || 0),
-        total_downloads: acc.total_downloads + 0 // Would need to sum from versions
-      }), {
-        total_apps: 0,
-        total_users: 0,
-        total_errors: 0,
-        active_users_today: 0,
-        total_versions: 0,
-        total_downloads: 0
+      setSystemStats({
+        total_apps: summary.totals.total_apps,
+        total_users: summary.totals.total_users,
+        total_errors: summary.totals.total_errors,
+        active_users_today: summary.totals.active_users_today,
+        total_versions: summary.totals.total_versions,
+        total_downloads: summary.totals.total_downloads
       });
       
-      setSystemStats(stats);
-      
-      // Load critical errors from all apps
-      const errorsPromises = appsData.map((app: any) => 
-        api.get(`/api/v2/analytics/${app.app_identifier}/errors?severity=critical&limit=5`)
-          .then((res: any) => res.data.errors.map((err: any) => ({
-            ...err,
-            app_name: app.app_name,
-            app_identifier: app.app_identifier
-          })))
-          .catch(() => [])
-      );
-      
-      const allErrors = await Promise.all(errorsPromises);
-      const flatErrors = allErrors.flat().slice(0, 6);
+      // Critical errors and recent sessions come pre-grouped per app
+      const flatErrors = appsData
+        .flatMap((app: any) => app.critical_errors.map((err: any) => ({
+          ...err,
+          app_name: app.app_name,
+          app_identifier: app.app_identifier
+        })))
+        .slice(0, 6);
       setCriticalErrors(flatErrors);
       
-      // Load recent sessions from all apps
-      const sessionsPromises = appsData.map((app: any) => 
-        api.get(`/api/v2/sessions/recent/${app.app_identifier}?limit=3`)
-          .then((res: any) => res.data.sessions.map((session: any) => ({
-            ...session,
-            app_name: app.app_name,
-            app_identifier: app.app_identifier
-          })))
-          .catch(() => [])
-      );
-      
-      const allSessions = await Promise.all(sessionsPromises);
-      const flatSessions = allSessions.flat()
-        .sort((a, b) => new Date(b.session_start).getTime() - new Date(a.session_start).getTime())
+      const flatSessions = appsData
+        .flatMap((app: any) => app.recent_sessions.map((session: any) => ({
+          ...session,
+          app_name: app.app_name,
+          app_identifier: app.app_identifier
+        })))
+        .sort((a: any, b: any) => new Date(b.session_start).getTime() - new Date(a.session_start).getTime())
         .slice(0, 5);
       setRecentSessions(flatSessions);
       
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import styled from 'styled-components';
 import { Users, Clock, TrendingUp, Calendar, Activity, Smartphone, Globe, RefreshCw, User } from 'lucide-react';
-import api from '../services/api';
+import api, { openAppStream } from '../services/api';
 import UsersDashboard from './UsersDashboard';
 
 interface SessionStats {
@@ -49,6 +49,31 @@ const SessionsDashboard: React.FC<Props> = ({ appIdentifier }) => {
     fetchSessionData();
   }, [appIdentifier, timeRange]);
 
+  // Aggiornamenti live invece del polling: nuove sessioni e delta dei contatori
+  useEffect(() => {
+    const close = openAppStream(appIdentifier, {
+      session_started: (session: UserSession) => {
+        setRecentSessions((sessions) => [session, ...sessions].slice(0, 20));
+      },
+      session_ended: (ended: { id: number; session_end: string; duration_seconds?: number }) => {
+        setRecentSessions((sessions) => sessions.map((session) =>
+          session.id === ended.id
+            ? { ...session, session_end: ended.session_end, duration_seconds: ended.duration_seconds }
+            : session
+        ));
+      },
+      counters: ({ deltas }: { deltas: Record<string, number> }) => {
+        if (!deltas.sessions_started) return;
+        setStats((current) => current && {
+          ...current,
+          total_sessions: current.total_sessions + deltas.sessions_started
+        });
+      },
+      evicted: () => fetchSessionData()
+    });
+    return close;
+  }, [appIdentifier]);
+
   const fetchSessionData = async () => {
     try {
       setLoading(true);
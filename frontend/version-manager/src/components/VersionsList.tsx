@@ -394,9 +394,16 @@ export const VersionsList: React.FC<Props> = ({ refreshTrigger, appIdentifier })
   const loadFiles = async () => {
     try {
       setLoading(true);
-      // Usa il nuovo endpoint v2
-      const response = await api.get('/api/v2/versions');
-      const versions = response.data.versions || [];
+      // Usa il nuovo endpoint v2 (paginato: segue next_cursor fino all'ultima pagina)
+      const versions: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const response: any = await api.get('/api/v2/versions', {
+          params: { limit: 500, ...(cursor ? { cursor } : {}) }
+        });
+        versions.push(...(response.data.versions || []));
+        cursor = response.data.next_cursor || null;
+      } while (cursor);
       
       // Trasforma i dati per compatibilità con FileInfo
       const files: FileInfo[] = versions.map((v: any) => ({
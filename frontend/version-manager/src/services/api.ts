@@ -168,5 +168,62 @@ export const createChangelog = (changes: string[]): string => {
   return JSON.stringify({ changes });
 };
 
+// ======================================================
+// LIVE STREAM (Server-Sent Events)
+// ======================================================
+
+export type LiveEventHandlers = { [event: string]: (data: any) => void };
+
+// Apre lo stream live di un'app ('all' per tutte). EventSource non invia header,
+// quindi la API key viaggia come query parameter. Restituisce la funzione di chiusura.
+export const openAppStream = (appIdentifier: string, handlers: LiveEventHandlers): (() => void) => {
+  const url = `${API_BASE_URL}/api/v2/stream/${encodeURIComponent(appIdentifier)}?api_key=${encodeURIComponent(API_KEY)}`;
+  let source: EventSource | null = null;
+  let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  let evictions = 0;
+  let stopped = false;
+  
+  const connect = () => {
+    const current = new EventSource(url);
+    source = current;
+    
+    Object.entries(handlers).forEach(([event, handler]) => {
+      if (event === 'evicted') return; // gestito sotto, una volta sola
+      current.addEventListener(event, (message) => {
+        try {
+          handler(JSON.parse((message as MessageEvent).data));
+        } catch (error) {
+          console.error(`Live event ${event} non valido`, error);
+        }
+      });
+    });
+    
+    // Il server chiude i client troppo lenti: ricarica i dati tramite handler e riconnetti
+    // con backoff (1s, 2s, 4s... fino a 30s; si azzera dopo un minuto di stream regolare)
+    current.addEventListener('evicted', () => {
+      current.close();
+      handlers.evicted?.({});
+      if (stopped) return;
+      const delay = Math.min(30000, 1000 * 2 ** evictions);
+      evictions += 1;
+      reconnectTimer = setTimeout(connect, delay);
+    });
+    current.addEventListener('open', () => {
+      const opened = current;
+      setTimeout(() => {
+        if (source === opened && opened.readyState === EventSource.OPEN) evictions = 0;
+      }, 60000);
+    });
+  };
+  
+  connect();
+  
+  return () => {
+    stopped = true;
+    if (reconnectTimer) clearTimeout(reconnectTimer);
+    source?.close();
+  };
+};
+
 // Export default per retrocompatibilità
 export default api;
\ No newline at end of file
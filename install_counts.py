@@ -0,0 +1,122 @@
+"""
+Pre-aggregated installed-version counters
+version_install_counts holds (app_id, platform, version) -> installed_count,
+the number of active user_app_installations on that build. check_version and
+the bulk check adjust it in the same transaction as the installation row, so
+version distributions are a primary-key range read instead of a GROUP BY over
+every installation of the app.
+
+Counters can drift (rows changed outside the API, users deleted); reconcile()
+recomputes them app by app and applies the difference.
+
+Usage:
+    python install_counts.py --reconcile     # correct drift now
+"""
+import argparse
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TABLE = "version_install_counts"
+
+InstallKey = Tuple[int, str, str]
+
+
+def install_key(app_id: int, platform: Optional[str], version: Optional[str]) -> InstallKey:
+    # NULL platforms/versions are counted under '' (primary key columns)
+    return app_id, platform or "", version or ""
+
+
+def record_move(deltas: Dict[InstallKey, int], old: Optional[InstallKey], new: Optional[InstallKey]):
+    """An installation moved from old to new (None: not counted, e.g. inactive or absent)"""
+    if old == new:
+        return
+    if old is not None:
+        deltas[old] = deltas.get(old, 0) - 1
+    if new is not None:
+        deltas[new] = deltas.get(new, 0) + 1
+
+
+def apply_deltas(cursor, deltas: Dict[InstallKey, int]):
+    """Adjust counters inside the caller's transaction"""
+    # Sorted: concurrent writers lock counter rows in the same order
+    changes = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not changes:
+        return
+    cursor.execute(
+        f"""INSERT INTO {TABLE} (app_id, platform, version, installed_count)
+           VALUES {', '.join(['(%s, %s, %s, %s)'] * len(changes))}
+           ON DUPLICATE KEY UPDATE installed_count = installed_count + VALUES(installed_count)""",
+        [value for key, delta in changes for value in (*key, delta)]
+    )
+
+
+def distribution(cursor, app_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Installed versions per app, most installed first (DictCursor rows shaped like the GROUP BY they replace)"""
+    app_ids = list(app_ids)
+    result = {app_id: [] for app_id in app_ids}
+    if not app_ids:
+        return result
+    cursor.execute(
+        f"""SELECT app_id, version as current_version, platform, installed_count as user_count
+           FROM {TABLE}
+           WHERE app_id IN ({', '.join(['%s'] * len(app_ids))}) AND installed_count > 0
+           ORDER BY user_count DESC""",
+        app_ids
+    )
+    for row in cursor.fetchall():
+        result[row.pop('app_id')].append(row)
+    return result
+
+
+def reconcile(connection) -> Dict[str, Any]:
+    """Recompute the counters from user_app_installations, one app per transaction"""
+    report = {"apps": 0, "corrected": 0, "drift": 0, "corrected_apps": []}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM apps ORDER BY id")
+        app_ids = [row[0] for row in cursor.fetchall()]
+        for app_id in app_ids:
+            # One snapshot for both reads: the difference is exact even while
+            # installs keep changing, and applying it as a delta keeps theirs
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            cursor.execute(
+                """SELECT COALESCE(platform, ''), COALESCE(current_version, ''), COUNT(*)
+                   FROM user_app_installations
+                   WHERE app_id = %s AND is_active = true
+                   GROUP BY COALESCE(platform, ''), COALESCE(current_version, '')""",
+                (app_id,)
+            )
+            actual = {(app_id, platform, version): count for platform, version, count in cursor.fetchall()}
+            cursor.execute(f"SELECT platform, version, installed_count FROM {TABLE} WHERE app_id = %s", (app_id,))
+            counted = {(app_id, platform, version): count for platform, version, count in cursor.fetchall()}
+            drift = {key: actual.get(key, 0) - counted.get(key, 0) for key in actual.keys() | counted.keys()}
+            drift = {key: delta for key, delta in drift.items() if delta}
+            apply_deltas(cursor, drift)
+            cursor.execute(f"DELETE FROM {TABLE} WHERE app_id = %s AND installed_count = 0", (app_id,))
+            connection.commit()
+            report["apps"] += 1
+            report["corrected"] += len(drift)
+            report["drift"] += sum(abs(delta) for delta in drift.values())
+            if drift:
+                report["corrected_apps"].append(app_id)
+    if report["drift"]:
+        logger.warning(f"Install counters: {report['corrected']} counters off by {report['drift']} in total, corrected")
+    return report
+
+
+def main():
+    from multi_app_api import get_db
+
+    parser = argparse.ArgumentParser(description="Installed-version counters")
+    parser.add_argument("--reconcile", action="store_true", help="Recompute the counters and correct drift")
+    args = parser.parse_args()
+    if not args.reconcile:
+        parser.error("nothing to do (pass --reconcile)")
+    logging.basicConfig(level=logging.INFO)
+    with get_db() as connection:
+        print(reconcile(connection))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Live event fan-out for dashboards (Server-Sent Events)
+Ingestion endpoints publish sessions, errors, uploads and update statuses once;
+every event is encoded a single time and pushed to all subscribers of the app
+channel (and of the "all" channel). Counter deltas are accumulated and
+flushed as one "counters" event per app per interval.
+
+Each subscriber has a bounded queue: a consumer that falls that far behind is
+evicted (it receives an "evicted" event and the browser's EventSource
+reconnects and reloads), so one slow tab never holds memory or blocks others.
+"""
+import asyncio
+import itertools
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fast_json import dumps
+from metrics import REGISTRY, Counter, Gauge
+
+ALL_APPS = "all"
+RETRY_MS = 3000
+
+sse_events_total = REGISTRY.register(Counter(
+    "sse_events_total", "Live events published by type", ("event",)))
+sse_evictions_total = REGISTRY.register(Counter(
+    "sse_evictions_total", "Live stream subscribers evicted for falling behind"))
+sse_subscribers = REGISTRY.register(Gauge(
+    "sse_subscribers", "Connected live stream subscribers"))
+
+
+def encode_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    frame = b""
+    if event_id is not None:
+        frame += f"id: {event_id}\n".encode()
+    return frame + f"event: {event}\n".encode() + b"data: " + dumps(data) + b"\n\n"
+
+
+_EVICTED = encode_event("evicted", {"reason": "slow consumer"})
+_PING = b": ping\n\n"
+
+
+class Subscriber:
+    def __init__(self, channel: str, max_queue: int):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.evicted = False
+
+
+class EventBroker:
+    """One computation per event, fanned out to every subscriber of its channel"""
+
+    def __init__(self, max_queue: int = 100, counter_interval: float = 2.0,
+                 heartbeat_interval: float = 15.0):
+        self.max_queue = max_queue
+        self.counter_interval = counter_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._channels: Dict[str, Set[Subscriber]] = {}
+        self._pending_counters: Dict[str, Dict[str, int]] = {}
+        self._counter_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # Lifecycle
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._flush_task = self._loop.create_task(self._flush_counters_forever())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    # Subscribers
+
+    def subscribe(self, channel: str) -> Subscriber:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(channel, self.max_queue)
+        self._channels.setdefault(channel, set()).add(subscriber)
+        sse_subscribers.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._channels.get(subscriber.channel)
+        if subscribers and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            sse_subscribers.dec()
+            if not subscribers:
+                del self._channels[subscriber.channel]
+
+    def has_subscribers(self, app_identifier: str) -> bool:
+        return bool(self._channels.get(app_identifier) or self._channels.get(ALL_APPS))
+
+    def backlog(self) -> int:
+        return sum(s.queue.qsize() for subscribers in self._channels.values() for s in subscribers)
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """SSE body for one subscriber; heartbeats keep proxies from closing idle streams"""
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield _PING
+                    continue
+                yield frame
+                if frame is _EVICTED:
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    # Publishing (safe to call from the event loop or from worker threads)
+
+    def publish(self, app_identifier: str, event: str, data: Dict[str, Any]):
+        if self._loop is None or not self.has_subscribers(app_identifier):
+            return
+        payload = dict(data, app_identifier=app_identifier)
+        frame = encode_event(event, payload, next(self._ids))
+        sse_events_total.inc(event=event)
+        self._call_in_loop(self._dispatch, app_identifier, frame)
+
+    def count(self, app_identifier: str, counter: str, amount: int = 1):
+        """Accumulate a counter delta; flushed as one "counters" event per interval"""
+        if not self.has_subscribers(app_identifier):
+            return
+        with self._counter_lock:
+            counters = self._pending_counters.setdefault(app_identifier, {})
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def _call_in_loop(self, function, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            function(*args)
+        else:
+            self._loop.call_soon_threadsafe(function, *args)
+
+    def _dispatch(self, app_identifier: str, frame: bytes):
+        targets = list(self._channels.get(app_identifier, ()))
+        if app_identifier != ALL_APPS:
+            targets.extend(self._channels.get(ALL_APPS, ()))
+        for subscriber in targets:
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+
+    def _evict(self, subscriber: Subscriber):
+        if subscriber.evicted:
+            return
+        subscriber.evicted = True
+        self.unsubscribe(subscriber)
+        sse_evictions_total.inc()
+        # Drop the backlog; the final frame tells the client to reload and reconnect
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(_EVICTED)
+
+    async def _flush_counters_forever(self):
+        while True:
+            await asyncio.sleep(self.counter_interval)
+            self.flush_counters()
+
+    def flush_counters(self):
+        with self._counter_lock:
+            pending, self._pending_counters = self._pending_counters, {}
+        now = datetime.now().isoformat()
+        for app_identifier, deltas in pending.items():
+            frame = encode_event("counters", {"app_identifier": app_identifier, "deltas": deltas, "at": now},
+                                 next(self._ids))
+            sse_events_total.inc(event="counters")
+            self._dispatch(app_identifier, frame)
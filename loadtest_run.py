@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Mixed-workload load test for the Multi-App Version Management API
+Drives concurrent clients through realistic scenarios and reports
+throughput and latency percentiles per endpoint as JSON, optionally
+comparing against a previous run to catch regressions.
+
+Scenarios (weights configurable with --mix):
+    launch     version check + session start + heartbeat (+ session end)
+    errors     burst of error reports from one device
+    dashboard  admin dashboard loads (summary, analytics, users, recent lists)
+    upload     chunked upload of a small synthetic build
+    download   download of an active build
+
+Usage:
+    python loadtest_run.py --users 100000 --concurrency 50 --duration 60 --output run.json
+    python loadtest_run.py ... --baseline previous.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from loadtest_seed import user_uuid_for
+
+DEFAULT_MIX = "launch=70,errors=8,dashboard=12,upload=1,download=9"
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error collection"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+        self.bytes_received = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, elapsed_ms: float, status: int, ok: bool, size: int):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            self.status_codes[endpoint][status] += 1
+            self.bytes_received[endpoint] += size
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, duration: float) -> dict:
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            total_errors += self.errors[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors[endpoint],
+                "throughput_rps": round(len(values) / duration, 2),
+                "bytes_received": self.bytes_received[endpoint],
+                "status_codes": {str(code): count for code, count in sorted(self.status_codes[endpoint].items())},
+                "latency_ms": {
+                    "mean": round(sum(values) / len(values), 2),
+                    "p50": round(percentile(values, 0.50), 2),
+                    "p90": round(percentile(values, 0.90), 2),
+                    "p95": round(percentile(values, 0.95), 2),
+                    "p99": round(percentile(values, 0.99), 2),
+                    "max": round(values[-1], 2),
+                },
+            }
+        all_latencies.sort()
+        overall = {
+            "requests": len(all_latencies),
+            "errors": total_errors,
+            "throughput_rps": round(len(all_latencies) / duration, 2),
+            "latency_ms": {
+                "p50": round(percentile(all_latencies, 0.50), 2),
+                "p95": round(percentile(all_latencies, 0.95), 2),
+                "p99": round(percentile(all_latencies, 0.99), 2),
+            },
+        }
+        return {"endpoints": endpoints, "overall": overall}
+
+
+class Client:
+    """One simulated client with its own HTTP connection pool"""
+
+    def __init__(self, args, catalogue, recorder: Recorder, rng: random.Random):
+        self.args = args
+        self.catalogue = catalogue
+        self.recorder = recorder
+        self.rng = rng
+        self.session = requests.Session()
+        self.session.headers.update({"X-API-Key": args.api_key})
+
+    def call(self, endpoint: str, method: str, path: str, stream: bool = False, **kwargs):
+        url = self.args.base_url.rstrip("/") + path
+        started = time.perf_counter()
+        status, size, ok = 0, 0, False
+        try:
+            response = self.session.request(method, url, timeout=self.args.timeout, stream=stream, **kwargs)
+            if stream:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+            else:
+                size = len(response.content)
+            status = response.status_code
+            ok = response.status_code < 400
+            return response
+        except requests.RequestException:
+            return None
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.recorder.record(endpoint, elapsed_ms, status, ok, size)
+
+    def pick_app(self):
+        return self.rng.choice(self.catalogue["apps"])
+
+    def pick_user(self) -> str:
+        # Mostly returning users, some brand new installs
+        if self.rng.random() < 0.05:
+            return str(uuid.uuid4())
+        return user_uuid_for(self.rng.randrange(self.args.users))
+
+    def scenario_launch(self):
+        app = self.pick_app()
+        platform = self.rng.choice(["android", "ios"])
+        versions = self.catalogue["versions"].get((app, platform)) or ["1.0.0"]
+        current_version = self.rng.choice(versions)
+        user_uuid = self.pick_user()
+        device_info = {"os": platform, "model": "LoadTest Device"}
+        self.call("POST /api/v2/version/check", "POST", "/api/v2/version/check", json={
+            "app_identifier": app, "current_version": current_version, "platform": platform,
+            "user_uuid": user_uuid, "device_info": device_info,
+        })
+        response = self.call("POST /api/v2/session/start", "POST", "/api/v2/session/start", json={
+            "app_identifier": app, "user_uuid": user_uuid, "app_version": current_version,
+            "device_info": device_info,
+        })
+        if response is not None and response.ok:
+            session_id = response.json().get("session_id")
+            self.call("POST /api/v2/session/{id}/heartbeat", "POST", f"/api/v2/session/{session_id}/heartbeat")
+            if self.rng.random() < 0.5:
+                self.call("POST /api/v2/session/{id}/end", "POST", f"/api/v2/session/{session_id}/end")
+
+    def scenario_errors(self):
+        app = self.pick_app()
+        platform = self.rng.choice(["android", "ios"])
+        user_uuid = self.pick_user()
+        for index in range(self.rng.randint(3, self.args.error_burst)):
+            self.call("POST /api/v2/errors/report", "POST", "/api/v2/errors/report", json={
+                "app_identifier": app, "user_uuid": user_uuid, "error_type": "network_error",
+                "error_message": f"Load test failure #{index}", "app_version": "1.0.0",
+                "platform": platform, "severity": self.rng.choice(["low", "medium", "high", "critical"]),
+                "metadata": {"screen": "loadtest"},
+            })
+
+    def scenario_dashboard(self):
+        app = self.pick_app()
+        self.call("GET /api/v2/dashboard/summary", "GET", "/api/v2/dashboard/summary")
+        self.call("GET /api/v2/analytics/{app}/overview", "GET", f"/api/v2/analytics/{app}/overview?days=30")
+        self.call("GET /api/v2/analytics/{app}/errors", "GET", f"/api/v2/analytics/{app}/errors")
+        self.call("GET /api/v2/sessions/recent/{app}", "GET", f"/api/v2/sessions/recent/{app}?limit=50")
+        self.call("GET /api/v2/errors/recent/{app}", "GET", f"/api/v2/errors/recent/{app}?limit=50")
+        self.call("GET /api/v2/users", "GET", "/api/v2/users?limit=50")
+
+    def scenario_upload(self):
+        app = self.pick_app()
+        content = os.urandom(self.args.upload_size)
+        version = f"9.{self.rng.randrange(1000)}.{uuid.uuid4().int % 100000}"
+        response = self.call("POST /api/v2/version/upload-chunked/start", "POST",
+                             "/api/v2/version/upload-chunked/start", data={
+                                 "app_identifier": app, "version": version,
+                                 "version_code": 900000 + self.rng.randrange(100000),
+                                 "platform": "android", "file_size": len(content),
+                                 "file_name": f"loadtest-{version}.apk", "is_mandatory": "false",
+                             })
+        if response is None or not response.ok:
+            return
+        start = response.json()
+        upload_id, chunk_size = start["upload_id"], start["chunk_size"]
+        for number, offset in enumerate(range(0, len(content), chunk_size)):
+            self.call("POST /api/v2/version/upload-chunked/{id}/chunk/{n}", "POST",
+                      f"/api/v2/version/upload-chunked/{upload_id}/chunk/{number}",
+                      files={"chunk": ("chunk", content[offset:offset + chunk_size])})
+        self.call("POST /api/v2/version/upload-chunked/{id}/complete", "POST",
+                  f"/api/v2/version/upload-chunked/{upload_id}/complete")
+
+    def scenario_download(self):
+        app = self.pick_app()
+        platform = self.rng.choice(["android", "ios"])
+        versions = self.catalogue["active"].get((app, platform))
+        if not versions:
+            return
+        version = self.rng.choice(versions)
+        self.call("GET /api/v2/download/{app}/{platform}/{version}", "GET",
+                  f"/api/v2/download/{app}/{platform}/{version}", stream=True)
+
+
+def load_catalogue(args) -> dict:
+    """Discover apps and versions from the running API"""
+    headers = {"X-API-Key": args.api_key}
+    base = args.base_url.rstrip("/")
+    apps = requests.get(f"{base}/api/v2/apps", headers=headers, timeout=args.timeout).json()["apps"]
+    identifiers = [app["app_identifier"] for app in apps]
+    if args.apps:
+        identifiers = [identifier for identifier in identifiers if identifier in args.apps.split(",")]
+    if not identifiers:
+        sys.exit("No apps available, run loadtest_seed.py first")
+
+    versions = defaultdict(list)
+    active = defaultdict(list)
+    cursor = None
+    while True:
+        params = {"limit": 500}
+        if cursor:
+            params["cursor"] = cursor
+        page = requests.get(f"{base}/api/v2/versions", headers=headers, params=params,
+                            timeout=args.timeout).json()
+        for version in page["versions"]:
+            key = (version["app_identifier"], version["platform"])
+            versions[key].append(version["version"])
+            if version["is_active"]:
+                active[key].append(version["version"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    return {"apps": identifiers, "versions": dict(versions), "active": dict(active)}
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def run_worker(worker_id: int, args, catalogue, recorder: Recorder, deadline: float, weights: dict):
+    rng = random.Random(args.seed * 1000 + worker_id)
+    client = Client(args, catalogue, recorder, rng)
+    names = list(weights)
+    scenario_weights = [weights[name] for name in names]
+    while time.time() < deadline:
+        scenario = rng.choices(names, weights=scenario_weights)[0]
+        getattr(client, f"scenario_{scenario}")()
+        if args.think_time:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Return the endpoints whose p95 latency regressed beyond max_regression"""
+    regressions = []
+    print(f"\n{'endpoint':<60} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        before = previous["latency_ms"]["p95"]
+        after = current["latency_ms"]["p95"]
+        change = (after - before) / before if before else 0.0
+        flag = " ⚠️" if change > max_regression else ""
+        print(f"{endpoint:<60} {before:>10.1f} {after:>10.1f} {change:>+7.0%}{flag}")
+        if change > max_regression:
+            regressions.append({"endpoint": endpoint, "baseline_p95": before, "p95": after,
+                                "change": round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mixed-workload load test")
+    parser.add_argument("--base-url", default=os.environ.get("LOADTEST_BASE_URL", "http://localhost:8000"))
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "nexa_internal_app_key_2025"))
+    parser.add_argument("--users", type=int, default=100_000, help="Users seeded by loadtest_seed.py")
+    parser.add_argument("--apps", default="", help="Comma separated app identifiers (default: all)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between scenarios (s)")
+    parser.add_argument("--error-burst", type=int, default=20, help="Maximum errors per burst")
+    parser.add_argument("--upload-size", type=int, default=1024 * 1024)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative p95 increase before failing (0.2 = +20%%)")
+    args = parser.parse_args(argv)
+
+    weights = parse_mix(args.mix)
+    unknown = [name for name in weights if not hasattr(Client, f"scenario_{name}")]
+    if unknown:
+        parser.error(f"Unknown scenarios in --mix: {', '.join(unknown)}")
+
+    catalogue = load_catalogue(args)
+    print(f"🚀 {args.concurrency} clients for {args.duration:.0f}s against {args.base_url} "
+          f"({len(catalogue['apps'])} apps, mix {args.mix})")
+
+    recorder = Recorder()
+    started = time.time()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_worker, worker_id, args, catalogue, recorder, deadline, weights)
+                   for worker_id in range(args.concurrency)]
+        for future in futures:
+            future.result()
+    elapsed = time.time() - started
+
+    results = {
+        "meta": {
+            "started_at": datetime.fromtimestamp(started).isoformat(),
+            "duration_s": round(elapsed, 2),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "mix": weights,
+            "users": args.users,
+            "seed": args.seed,
+        },
+        **recorder.summary(elapsed),
+    }
+
+    overall = results["overall"]
+    print(f"\n📊 {overall['requests']:,} requests, {overall['errors']:,} errors, "
+          f"{overall['throughput_rps']} req/s, p95 {overall['latency_ms']['p95']}ms")
+    for endpoint, stats in results["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(f"   {endpoint:<60} {stats['requests']:>7} req  p50 {latency['p50']:>8.1f}  "
+              f"p95 {latency['p95']:>8.1f}  p99 {latency['p99']:>8.1f}  err {stats['errors']}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["regressions"] = compare(results, baseline, args.max_regression)
+        if results["regressions"]:
+            print(f"\n❌ {len(results['regressions'])} endpoint(s) regressed more than {args.max_regression:.0%}")
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
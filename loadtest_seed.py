@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Seed the local MySQL stand-in with synthetic data for load testing
+Creates the schema used by multi_app_api.py and bulk-loads apps, versions,
+users, installations, sessions, errors and update history at a
+configurable scale. Generation is deterministic for a given --seed.
+The baseline schema is loaded first, then the add_*.sql migrations (so the
+API runs with every optional feature on) and their derived data.
+
+Usage:
+    docker compose -f docker-compose.loadtest.yml up -d
+    python loadtest_seed.py --users 1000000 --sessions-per-user 5
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pymysql
+
+import cohort_retention
+import update_funnel
+import versioning
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = [
+    """CREATE TABLE apps (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        app_identifier VARCHAR(100) NOT NULL UNIQUE,
+        app_name VARCHAR(255) NOT NULL,
+        description TEXT,
+        platform_support JSON,
+        is_active BOOLEAN DEFAULT true,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE app_versions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        app_id INT NOT NULL,
+        version VARCHAR(20) NOT NULL,
+        platform ENUM('android', 'ios', 'web', 'all') NOT NULL,
+        version_code INT NOT NULL,
+        app_file LONGBLOB,
+        file_name VARCHAR(255),
+        file_size BIGINT,
+        file_hash VARCHAR(64),
+        file_path VARCHAR(500),
+        changelog JSON,
+        is_active BOOLEAN DEFAULT true,
+        is_mandatory BOOLEAN DEFAULT false,
+        release_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        download_count INT DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+        UNIQUE KEY unique_app_platform_version (app_id, platform, version),
+        INDEX idx_active_versions (app_id, is_active, version_code),
+        INDEX idx_created_id (created_at, id),
+        INDEX idx_app_created_id (app_id, created_at, id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE app_users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_uuid VARCHAR(36) NOT NULL UNIQUE,
+        email VARCHAR(255),
+        name VARCHAR(255),
+        app_id INT,
+        device_id VARCHAR(255),
+        device_info JSON,
+        first_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_email (email),
+        INDEX idx_last_seen_id (last_seen_at, id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE user_app_installations (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        app_id INT NOT NULL,
+        current_version VARCHAR(20),
+        platform VARCHAR(20),
+        app_version_id INT,
+        install_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_update_date DATETIME,
+        is_active BOOLEAN DEFAULT true,
+        FOREIGN KEY (user_id) REFERENCES app_users(id) ON DELETE CASCADE,
+        FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+        UNIQUE KEY unique_user_app (user_id, app_id),
+        INDEX idx_app_version (app_id, current_version)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE user_sessions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        app_id INT NOT NULL,
+        session_id VARCHAR(255),
+        session_uuid VARCHAR(255) NOT NULL,
+        start_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        end_time DATETIME,
+        duration_seconds INT,
+        app_version VARCHAR(20) NOT NULL,
+        platform ENUM('android', 'ios', 'web') NOT NULL,
+        device_info JSON,
+        ip_address VARCHAR(45),
+        end_reason VARCHAR(50),
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES app_users(id) ON DELETE CASCADE,
+        FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+        INDEX idx_user_sessions (user_id, start_time),
+        INDEX idx_app_start_id (app_id, start_time, id),
+        INDEX idx_active_sessions (is_active, start_time)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE app_error_logs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        app_id INT NOT NULL,
+        user_id INT,
+        session_id INT,
+        error_type VARCHAR(100) NOT NULL,
+        error_message TEXT NOT NULL,
+        error_stack TEXT,
+        metadata JSON,
+        severity ENUM('low', 'medium', 'high', 'critical') NOT NULL DEFAULT 'medium',
+        app_version VARCHAR(20) NOT NULL,
+        platform ENUM('android', 'ios', 'web') NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES app_users(id) ON DELETE SET NULL,
+        INDEX idx_app_created_id (app_id, created_at, id),
+        INDEX idx_app_severity_created_id (app_id, severity, created_at, id),
+        INDEX idx_error_type (error_type, severity),
+        INDEX idx_user_errors (user_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE update_history (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        app_id INT NOT NULL,
+        from_version VARCHAR(20),
+        to_version VARCHAR(20),
+        update_status ENUM('started', 'downloaded', 'installed', 'failed') NOT NULL,
+        failure_reason TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES app_users(id) ON DELETE CASCADE,
+        FOREIGN KEY (app_id) REFERENCES apps(id) ON DELETE CASCADE,
+        INDEX idx_user_updates (user_id, updated_at),
+        INDEX idx_app_updates (app_id, updated_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+]
+
+# Applied in order after the bulk load, as on a deployed database. The baseline
+# above already has add_file_path_column.sql and add_pagination_indexes.sql
+MIGRATIONS = [
+    'add_rollout_percentage.sql',
+    'add_version_keys.sql',
+    'add_retention_policies.sql',
+    'add_cold_archive_indexes.sql',
+    'add_version_install_counts.sql',
+    'add_update_funnel.sql',
+    'add_cohort_retention.sql',
+]
+
+TABLES = [
+    'update_history', 'app_error_logs', 'user_sessions', 'user_app_installations',
+    'app_users', 'app_versions', 'apps',
+    # Created by MIGRATIONS
+    'app_retention_policies', 'version_install_counts', 'update_funnel', 'aggregation_state',
+    'retention_members', 'retention_activity', 'schema_migrations'
+]
+
+ERROR_TYPES = ['crash', 'api_error', 'js_error', 'network_error', 'render_error', 'auth_error']
+SEVERITIES = ['low', 'medium', 'medium', 'high', 'critical']
+PLATFORMS = ['android', 'ios']
+DEVICE_MODELS = {
+    'android': ['Pixel 7', 'Galaxy S23', 'Redmi Note 12', 'Moto G54'],
+    'ios': ['iPhone 13', 'iPhone 14', 'iPhone 15 Pro', 'iPad Air'],
+}
+
+
+def user_uuid_for(index: int) -> str:
+    """Deterministic user UUID, shared with loadtest_run.py"""
+    return str(uuid.UUID(int=index + 1))
+
+
+def version_name(index: int) -> str:
+    return f"1.{index // 10}.{index % 10}"
+
+
+def insert_batches(connection, sql: str, rows, batch_size: int, label: str):
+    """Insert rows (an iterable of tuples) with multi-row INSERTs"""
+    started = time.time()
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                connection.commit()
+                total += len(batch)
+                batch = []
+                rate = total / max(time.time() - started, 1e-6)
+                print(f"\r   {label}: {total:,} rows ({rate:,.0f}/s)", end="", flush=True)
+        if batch:
+            cursor.executemany(sql, batch)
+            connection.commit()
+            total += len(batch)
+    print(f"\r   {label}: {total:,} rows in {time.time() - started:.1f}s" + " " * 20)
+    return total
+
+
+def sql_statements(path: str):
+    """Statements of a migration file (comment lines dropped, split on ';')"""
+    with open(path, encoding='utf-8') as f:
+        text = "\n".join(line for line in f if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in text.split(';') if statement.strip()]
+
+
+def apply_migrations(connection):
+    with connection.cursor() as cursor:
+        for name in MIGRATIONS:
+            print(f"   {name}")
+            for statement in sql_statements(os.path.join(BASE_DIR, name)):
+                cursor.execute(statement)
+            connection.commit()
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    history_start = now - timedelta(days=args.days)
+
+    connection = pymysql.connect(
+        host=args.host, port=args.port, user=args.user, password=args.password,
+        database=args.database, charset='utf8mb4', autocommit=False
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        print("🗑️  Recreating schema...")
+        for table in TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SCHEMA:
+            cursor.execute(statement)
+    connection.commit()
+
+    # Apps and versions
+    print("📦 Seeding apps and versions...")
+    app_ids = list(range(1, args.apps + 1))
+    insert_batches(connection, """INSERT INTO apps (id, app_identifier, app_name, description, platform_support)
+                                  VALUES (%s, %s, %s, %s, %s)""",
+                   ((app_id, f"loadtest-app-{app_id}", f"Load Test App {app_id}",
+                     "Synthetic app for load testing", json.dumps(PLATFORMS)) for app_id in app_ids),
+                   args.batch_size, "apps")
+
+    build = os.urandom(args.build_size)
+    build_hash = hashlib.sha256(build).hexdigest()
+    versions = []
+    for app_id in app_ids:
+        for platform in PLATFORMS:
+            for index in range(args.versions_per_app):
+                released = history_start + timedelta(days=args.days * index / max(args.versions_per_app, 1))
+                versions.append((
+                    app_id, version_name(index), platform, index + 1, build,
+                    f"loadtest-{app_id}-{version_name(index)}.{'apk' if platform == 'android' else 'ipa'}",
+                    len(build), build_hash, 'BLOB_STORAGE',
+                    json.dumps([f"Release {version_name(index)}", "Bug fixes"]),
+                    index >= args.versions_per_app - 3, index % 5 == 0, released, released
+                ))
+    insert_batches(connection, """INSERT INTO app_versions
+                                  (app_id, version, platform, version_code, app_file, file_name, file_size,
+                                   file_hash, file_path, changelog, is_active, is_mandatory, release_date, created_at)
+                                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                   versions, max(1, min(args.batch_size, (64 * 1024 * 1024) // max(len(build), 1))), "versions")
+
+    # Users and installations
+    print("👥 Seeding users...")
+
+    def user_rows():
+        for index in range(args.users):
+            platform = PLATFORMS[index % 2]
+            first_seen = history_start + timedelta(seconds=rng.randrange(args.days * 86400))
+            last_seen = first_seen + timedelta(seconds=rng.randrange(max(int((now - first_seen).total_seconds()), 1)))
+            device_info = {"os": platform, "model": rng.choice(DEVICE_MODELS[platform])}
+            yield (index + 1, user_uuid_for(index), f"user{index}@loadtest.local", f"User {index}",
+                   app_ids[index % len(app_ids)], f"device-{index}", json.dumps(device_info),
+                   first_seen, last_seen)
+
+    insert_batches(connection, """INSERT INTO app_users
+                                  (id, user_uuid, email, name, app_id, device_id, device_info, first_seen_at, last_seen_at)
+                                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                   user_rows(), args.batch_size, "users")
+
+    def installation_rows():
+        for index in range(args.users):
+            platform = PLATFORMS[index % 2]
+            installed_apps = rng.sample(app_ids, k=min(len(app_ids), 1 + int(rng.random() < 0.3)))
+            for app_id in installed_apps:
+                # Skew the installed base towards recent versions
+                version_index = max(0, args.versions_per_app - 1 - int(rng.expovariate(0.7)))
+                install_date = history_start + timedelta(seconds=rng.randrange(args.days * 86400))
+                yield (index + 1, app_id, version_name(version_index), platform, install_date, install_date)
+
+    insert_batches(connection, """INSERT INTO user_app_installations
+                                  (user_id, app_id, current_version, platform, install_date, last_update_date)
+                                  VALUES (%s, %s, %s, %s, %s, %s)""",
+                   installation_rows(), args.batch_size, "installations")
+
+    # Sessions, errors and update history
+    print("📈 Seeding telemetry...")
+    total_sessions = int(args.users * args.sessions_per_user)
+
+    def session_rows():
+        for _ in range(total_sessions):
+            # Skewed towards a core of heavy users
+            user_index = int(args.users * rng.random() ** 2)
+            platform = PLATFORMS[user_index % 2]
+            start = history_start + timedelta(seconds=rng.randrange(args.days * 86400))
+            ended = rng.random() < 0.9
+            duration = int(rng.expovariate(1 / 300)) if ended else None
+            session_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+            yield (user_index + 1, app_ids[user_index % len(app_ids)], session_uuid, session_uuid, start,
+                   start + timedelta(seconds=duration) if ended else None, duration,
+                   version_name(rng.randrange(args.versions_per_app)), platform, 0 if ended else 1)
+
+    insert_batches(connection, """INSERT INTO user_sessions
+                                  (user_id, app_id, session_id, session_uuid, start_time, end_time,
+                                   duration_seconds, app_version, platform, is_active)
+                                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                   session_rows(), args.batch_size, "sessions")
+
+    def error_rows():
+        for _ in range(args.errors):
+            user_index = rng.randrange(args.users)
+            platform = PLATFORMS[user_index % 2]
+            error_type = rng.choice(ERROR_TYPES)
+            yield (app_ids[user_index % len(app_ids)], user_index + 1, error_type,
+                   f"Synthetic {error_type} #{rng.randrange(1000)}", "at main (app.js:1:1)",
+                   json.dumps({"screen": rng.choice(["home", "timesheet", "settings"])}),
+                   rng.choice(SEVERITIES), version_name(rng.randrange(args.versions_per_app)), platform,
+                   history_start + timedelta(seconds=rng.randrange(args.days * 86400)))
+
+    insert_batches(connection, """INSERT INTO app_error_logs
+                                  (app_id, user_id, error_type, error_message, error_stack, metadata,
+                                   severity, app_version, platform, created_at)
+                                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                   error_rows(), args.batch_size, "errors")
+
+    def update_rows():
+        statuses = ['started', 'downloaded', 'installed', 'failed']
+        for _ in range(args.updates):
+            user_index = rng.randrange(args.users)
+            to_index = rng.randrange(1, args.versions_per_app) if args.versions_per_app > 1 else 0
+            status = rng.choices(statuses, weights=[10, 8, 7, 1])[0]
+            yield (user_index + 1, app_ids[user_index % len(app_ids)], version_name(max(to_index - 1, 0)),
+                   version_name(to_index), status, "Insufficient storage" if status == 'failed' else None,
+                   history_start + timedelta(seconds=rng.randrange(args.days * 86400)))
+
+    insert_batches(connection, """INSERT INTO update_history
+                                  (user_id, app_id, from_version, to_version, update_status, failure_reason, updated_at)
+                                  VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                   update_rows(), args.batch_size, "update history")
+
+    print("🧱 Applying migrations...")
+    apply_migrations(connection)
+    print("🔢 Filling version keys, update funnel and retention matrix...")
+    versioning.backfill(connection, args.batch_size)
+    update_funnel.aggregate(connection, args.batch_size, max_batches=None)
+    cohort_retention.backfill(connection)
+
+    with connection.cursor() as cursor:
+        print("📊 Analyzing tables...")
+        for table in TABLES:
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+    connection.close()
+
+    print("\n✅ Seed completed")
+    print(f"   Point the API at it with: DB_HOST={args.host} DB_PORT={args.port} "
+          f"DB_USER={args.user} DB_PASSWORD={args.password} DB_NAME={args.database}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the load-test database with synthetic data")
+    parser.add_argument("--host", default=os.environ.get("LOADTEST_DB_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("LOADTEST_DB_PORT", 3307)))
+    parser.add_argument("--user", default=os.environ.get("LOADTEST_DB_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("LOADTEST_DB_PASSWORD", "loadtest"))
+    parser.add_argument("--database", default=os.environ.get("LOADTEST_DB_NAME", "loadtest"))
+    parser.add_argument("--apps", type=int, default=5)
+    parser.add_argument("--versions-per-app", type=int, default=20)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--sessions-per-user", type=float, default=5.0)
+    parser.add_argument("--errors", type=int, default=200_000)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=90, help="Length of the synthetic history")
+    parser.add_argument("--build-size", type=int, default=256 * 1024, help="Size in bytes of each BLOB build")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.apps < 1 or arguments.users < 1 or arguments.versions_per_app < 1:
+        sys.exit("--apps, --users and --versions-per-app must be at least 1")
+    seed(arguments)
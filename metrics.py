@@ -0,0 +1,389 @@
+"""
+Prometheus-style metrics for the API
+Minimal in-process registry (counters, gauges, histograms) rendered in the
+Prometheus text exposition format. Instrumentation is central:
+MetricsMiddleware times every request, and InstrumentedConnection (used by
+get_db) times connection setup and every query.
+"""
+import re
+import threading
+from contextvars import ContextVar
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pymysql
+import pymysql.cursors
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+MAX_FINGERPRINT_LENGTH = 200
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Compute the value lazily at scrape time (e.g. a queue length)"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                items.append((key, float(function())))
+            except Exception:
+                continue
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# HTTP
+http_requests_total = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_request_duration_seconds = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_requests_in_flight = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ("method",)))
+download_bytes_total = REGISTRY.register(Counter(
+    "download_bytes_total", "Bytes streamed by build downloads"))
+upload_bytes_total = REGISTRY.register(Counter(
+    "upload_bytes_total", "Request body bytes received by upload endpoints"))
+
+# Database
+db_connection_acquire_seconds = REGISTRY.register(Histogram(
+    "db_connection_acquire_seconds", "Time to open and prepare a database connection"))
+db_connections_open = REGISTRY.register(Gauge(
+    "db_connections_open", "Database connections currently open"))
+db_query_duration_seconds = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Query latency by normalised statement", ("query",)))
+db_query_rows = REGISTRY.register(Histogram(
+    "db_query_rows", "Rows returned or affected by normalised statement", ("query",), buckets=ROW_BUCKETS))
+db_query_errors_total = REGISTRY.register(Counter(
+    "db_query_errors_total", "Queries that raised by normalised statement", ("query",)))
+
+# Background work
+background_queue_depth = REGISTRY.register(Gauge(
+    "background_queue_depth", "Items waiting in in-process background queues", ("queue",)))
+
+
+def register_queue_depth(queue: str, function: Callable[[], float]):
+    """Expose the current length of a background queue at scrape time"""
+    background_queue_depth.set_function(function, queue=queue)
+
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalise a statement: literals and placeholders become ?, IN lists collapse"""
+    normalised = _COMMENTS.sub(" ", sql)
+    normalised = _STRINGS.sub("?", normalised)
+    normalised = normalised.replace("%s", "?")
+    normalised = _NUMBERS.sub("?", normalised)
+    normalised = _PLACEHOLDER_LISTS.sub("(?+)", normalised)
+    normalised = _WHITESPACE.sub(" ", normalised).strip()
+    return normalised[:MAX_FINGERPRINT_LENGTH]
+
+
+# Called as observer(cursor, query, args, elapsed_seconds) after every successful statement
+QueryObserver = Callable[[object, str, object, float], None]
+_query_observers: List[QueryObserver] = []
+
+
+def add_query_observer(observer: QueryObserver):
+    """Hook extra per-query processing (e.g. the slow-query profiler) into timed cursors"""
+    if observer not in _query_observers:
+        _query_observers.append(observer)
+
+
+class TimedCursorMixin:
+    """Records latency and row counts of every statement"""
+
+    def execute(self, query, args=None):
+        label = fingerprint(query if isinstance(query, str) else query.decode("utf-8", "replace"))
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, args)
+        except Exception:
+            db_query_errors_total.inc(query=label)
+            db_query_duration_seconds.observe(time.perf_counter() - started, query=label)
+            raise
+        elapsed = time.perf_counter() - started
+        db_query_duration_seconds.observe(elapsed, query=label)
+        db_query_rows.observe(max(self.rowcount, 0), query=label)
+        for observer in _query_observers:
+            try:
+                observer(self, query, args, elapsed)
+            except Exception:
+                pass
+        return result
+
+
+class TimedCursor(TimedCursorMixin, pymysql.cursors.Cursor):
+    pass
+
+
+class TimedDictCursor(TimedCursorMixin, pymysql.cursors.DictCursor):
+    pass
+
+
+class TimedSSCursor(TimedCursorMixin, pymysql.cursors.SSCursor):
+    pass
+
+
+class TimedSSDictCursor(TimedCursorMixin, pymysql.cursors.SSDictCursor):
+    pass
+
+
+_TIMED_CURSORS = {
+    pymysql.cursors.Cursor: TimedCursor,
+    pymysql.cursors.DictCursor: TimedDictCursor,
+    pymysql.cursors.SSCursor: TimedSSCursor,
+    pymysql.cursors.SSDictCursor: TimedSSDictCursor,
+}
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """pymysql connection whose cursors are timed"""
+
+    def __init__(self, *args, **kwargs):
+        started = time.perf_counter()
+        super().__init__(*args, **kwargs)
+        self._acquire_started = started
+        db_connections_open.inc()
+        self._counted_open = True
+
+    def cursor(self, cursor=None):
+        cursor_class = cursor or self.cursorclass
+        return super().cursor(_TIMED_CURSORS.get(cursor_class, cursor_class))
+
+    def mark_ready(self):
+        """Record acquisition time once session setup is done"""
+        db_connection_acquire_seconds.observe(time.perf_counter() - self._acquire_started)
+
+    def close(self):
+        if getattr(self, "_counted_open", False):
+            self._counted_open = False
+            db_connections_open.dec()
+        super().close()
+
+
+class MetricsMiddleware:
+    """Per-route request counts, latency, in-flight requests and transfer volume"""
+
+    def __init__(self, app, download_prefix: str = "/api/v2/download/",
+                 upload_marker: str = "/upload"):
+        self.app = app
+        self.download_prefix = download_prefix
+        self.upload_marker = upload_marker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        is_download = path.startswith(self.download_prefix)
+        is_upload = self.upload_marker in path
+        status = [500]
+
+        async def receive_wrapper():
+            message = await receive()
+            if is_upload and message["type"] == "http.request":
+                upload_bytes_total.inc(len(message.get("body", b"")))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif is_download and message["type"] == "http.response.body":
+                download_bytes_total.inc(len(message.get("body", b"")))
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _current_scope.reset(token)
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec(method=method)
+            route = route_template(scope)
+            http_requests_total.inc(method=method, route=route, status=str(status[0]))
+            http_request_duration_seconds.observe(elapsed, method=method, route=route)
+
+
+_current_scope: ContextVar[Optional[dict]] = ContextVar("current_request_scope", default=None)
+
+
+def current_endpoint() -> Optional[str]:
+    """"METHOD /route/template" of the request being served, if any"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return f"{scope['method']} {route_template(scope)}"
+
+
+def current_path() -> Optional[str]:
+    scope = _current_scope.get()
+    return scope["path"] if scope is not None else None
+
+
+def route_template(scope) -> str:
+    """Matched route path (e.g. /api/v2/download/{app_identifier}/...) to keep label cardinality bounded"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
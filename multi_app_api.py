@@ -3,15 +3,16 @@ Multi-App Version Management API with User Tracking and Error Reporting
 Supports multiple applications, user analytics, and error monitoring
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request, Body, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request, Body, Depends, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date, timedelta
 from pydantic import BaseModel, Field
 import pymysql
 import os
 import hashlib
+import hmac
 import json
 import uuid
 from contextlib import contextmanager
@@ -20,7 +21,31 @@ import io
 from dotenv import load_dotenv
 from pathlib import Path
 import sys
+import asyncio
+import time
+import tempfile
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from response_cache import TTLCache, result_cache_from_url
+from request_coalescing import coalesce
+from pagination import decode_cursor, keyset_condition, next_cursor_for, null_last
+from fast_json import FastJSONResponse, json_response, raw_json, raw_json_fields
+from response_compression import CompressionMiddleware
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedConnection, MetricsMiddleware, add_query_observer, register_queue_depth, render_metrics
+from query_profiler import SlowQueryLog
+from retention import RetentionManager, TELEMETRY_TABLES
+from cold_archive import ColdArchiver, ColdArchiveReader, HAS_PYARROW
+from live_events import ALL_APPS, EventBroker
+from update_notifier import PLATFORMS, UpdateNotifier
+from download_admission import AdmittedFileResponse, AdmittedStreamingResponse, DownloadAdmission, client_ip
+from blob_cache import BlobDiskCache
+from rollout import pick_version
+from storage_scrubber import StorageScrubber
+from versioning import is_newer, version_key
+import install_counts
+import update_funnel
+import cohort_retention
+from session_tracker import SessionTracker, close_sessions, is_active as session_is_active, sweep_abandoned
+from starlette.concurrency import run_in_threadpool
 
 # Load environment variables based on environment
 env = os.environ.get('ENVIRONMENT', 'local')
@@ -36,7 +61,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Multi-App Version Management API with Authentication",
     description="Gestione versioni per multiple applicazioni con tracking utenti, errori e autenticazione 2FA",
-    version="3.0.0"
+    version="3.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS configuration
@@ -48,6 +74,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response compression: gzip always, Brotli when installed. Binary downloads are excluded.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    exclude_paths=("/api/v2/download/",),
+    precompressed_paths=("/api/v2/apps", "/api/v2/app-version/latest")
+)
+
 # Security configuration
 API_KEY = os.environ.get('API_KEY', 'nexa_internal_app_key_2025')
 
@@ -72,6 +106,7 @@ async def verify_api_key_middleware(request: Request, call_next):
         "/api/v2/session/",  # All session endpoints
         "/api/v2/errors/report",  # Error reporting from mobile app
         "/api/v2/update/status",  # Update status tracking
+        "/api/v2/updates/",  # Update notification channel (long-poll)
         "/api/v2/auth/login",  # Auth endpoints need API key but not auth token
         "/api/v2/auth/verify-2fa"  # 2FA verification
     ]
@@ -82,6 +117,9 @@ async def verify_api_key_middleware(request: Request, call_next):
         
         if not is_public:
             api_key = request.headers.get("X-API-Key")
+            # EventSource cannot send headers, so live streams may pass the key as a query parameter
+            if api_key is None and request.url.path.startswith("/api/v2/stream/"):
+                api_key = request.query_params.get("api_key")
             if api_key != API_KEY:
                 return JSONResponse(
                     status_code=401,
@@ -91,6 +129,52 @@ async def verify_api_key_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
+# Prometheus metrics: outermost so rejected and failed requests are counted too
+app.add_middleware(MetricsMiddleware)
+# /metrics shows per-route traffic and SQL fingerprints: Bearer METRICS_TOKEN is required,
+# without a token it is closed unless METRICS_PUBLIC=true opts out explicitly
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
+
+# Slow-query profiler: statements over the threshold land in a ring buffer (admin endpoint below)
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500)),
+    capacity=int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 200)),
+    explain_sample_rate=float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.2)),
+    explain_interval=float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300))
+)
+add_query_observer(slow_query_log.observe)
+
+# Live dashboard events (SSE), published from the ingestion endpoints
+event_broker = EventBroker(
+    max_queue=int(os.environ.get('SSE_MAX_QUEUE', 100)),
+    counter_interval=float(os.environ.get('SSE_COUNTER_INTERVAL', 2))
+)
+register_queue_depth("sse_subscriber_backlog", event_broker.backlog)
+
+# Push channel telling mobile clients a new build is out (WebSocket or long-poll)
+update_notifier = UpdateNotifier(
+    heartbeat_timeout=float(os.environ.get('UPDATE_CHANNEL_HEARTBEAT_TIMEOUT', 90)),
+    sweep_interval=float(os.environ.get('UPDATE_CHANNEL_SWEEP_INTERVAL', 30))
+)
+
+# Download admission: global cap (and optional per-IP cap), short queue, then 503/429 with Retry-After
+download_admission = DownloadAdmission(
+    max_concurrent=int(os.environ.get('DOWNLOAD_MAX_CONCURRENT', 20)),
+    max_per_ip=int(os.environ.get('DOWNLOAD_MAX_PER_IP', 0)),
+    max_queue=int(os.environ.get('DOWNLOAD_MAX_QUEUE', 100)),
+    queue_timeout=float(os.environ.get('DOWNLOAD_QUEUE_TIMEOUT', 10)),
+    retry_after=int(os.environ.get('DOWNLOAD_RETRY_AFTER', 30))
+)
+# Proxies in front of the app that append to X-Forwarded-For (Railway: 1; 0 = use the peer address)
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+
+# Local disk copy of BLOB-stored builds, so repeated downloads skip MySQL (0 disables)
+blob_cache = BlobDiskCache(
+    os.environ.get('BLOB_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'blob_cache')),
+    max_bytes=int(os.environ.get('BLOB_CACHE_MAX_MB', 2048)) * 1024 * 1024
+)
+
 # Database configuration
 DB_CONFIG = {
     'host': os.environ.get('DB_HOST', os.environ.get('MYSQL_HOST', 'tramway.proxy.rlwy.net')),
@@ -118,6 +202,16 @@ class VersionCheck(BaseModel):
     user_uuid: Optional[str] = None
     device_info: Optional[Dict[str, Any]] = None
 
+class BulkVersionCheckItem(BaseModel):
+    app_identifier: str
+    platform: str
+    current_version: str
+
+class BulkVersionCheck(BaseModel):
+    checks: List[BulkVersionCheckItem] = Field(..., min_length=1, max_length=50)
+    user_uuid: Optional[str] = None
+    device_info: Optional[Dict[str, Any]] = None
+
 class UserSession(BaseModel):
     app_identifier: str
     user_uuid: str
@@ -146,11 +240,20 @@ class UpdateStatus(BaseModel):
     status: str  # started, downloaded, installed, failed
     failure_reason: Optional[str] = None
 
+class RolloutUpdate(BaseModel):
+    rollout_percentage: int = Field(..., ge=0, le=100)
+
+class RetentionPolicy(BaseModel):
+    # Days to keep per table; None restores the RETENTION_*_DAYS default
+    user_sessions: Optional[int] = Field(None, ge=1)
+    app_error_logs: Optional[int] = Field(None, ge=1)
+    update_history: Optional[int] = Field(None, ge=1)
+
 # Database connection manager
 @contextmanager
 def get_db():
     """Database connection with increased limits for large files"""
-    connection = pymysql.connect(
+    connection = InstrumentedConnection(
         **DB_CONFIG,
         connect_timeout=300,  # 5 minutes
         read_timeout=300,
@@ -167,6 +270,7 @@ def get_db():
                 cursor.execute("SET SESSION interactive_timeout = 300")
             except Exception as e:
                 logger.warning(f"Could not set session variables: {e}")
+        connection.mark_ready()
         yield connection
     finally:
         connection.close()
@@ -182,6 +286,63 @@ def get_app_id(app_identifier: str, connection) -> Optional[int]:
         result = cursor.fetchone()
         return result[0] if result else None
 
+# Optional columns added by migrations; re-checked every minute so a migration needs no restart
+schema_columns_cache = TTLCache(ttl_seconds=60)
+
+def has_column(connection, table: str, column: str) -> bool:
+    """Whether an optional migration column exists (cached)"""
+    key = (table, column)
+    cached = schema_columns_cache.get(key)
+    if cached is None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
+            cached = cursor.fetchone() is not None
+        schema_columns_cache.set(key, cached)
+    return cached
+
+def has_table(connection, table: str) -> bool:
+    """Whether an optional migration table exists (cached)"""
+    key = (table, None)
+    cached = schema_columns_cache.get(key)
+    if cached is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW TABLES LIKE %s", (table,))
+            cached = cursor.fetchone() is not None
+        schema_columns_cache.set(key, cached)
+    return cached
+
+# Rendered analytics results, tagged "<domain>:<app_id>" (sessions, errors, installs, versions).
+# Ingestion ages the tags (stale results are served while one call refreshes them);
+# uploads and deletions invalidate them. RESULT_CACHE_URL=redis://... shares it between workers.
+result_cache = result_cache_from_url(os.environ.get('RESULT_CACHE_URL'))
+
+# Active sessions of this worker, kept open by heartbeats (see session_tracker.py)
+session_tracker = SessionTracker(timeout_seconds=float(os.environ.get('SESSION_TIMEOUT_SECONDS', 300)),
+                                 max_sessions=int(os.environ.get('SESSION_TABLE_MAX', 200000)))
+app_ids_cache = TTLCache(ttl_seconds=300, max_entries=1024)
+
+def cached_app_id(app_identifier: str) -> Optional[int]:
+    app_id = app_ids_cache.get(app_identifier)
+    if app_id is None:
+        with get_db() as connection:
+            app_id = get_app_id(app_identifier, connection)
+        if app_id:
+            app_ids_cache.set(app_identifier, app_id)
+    return app_id
+
+def analytics_tags(*domains: str):
+    """tags function for coalesce(): the domains of the requested app (not cached if it does not exist)"""
+    def tags(app_identifier: str, **_):
+        app_id = cached_app_id(app_identifier)
+        return [f"{domain}:{app_id}" for domain in domains] if app_id else None
+    return tags
+
+def age_analytics(app_id: int, *domains: str):
+    result_cache.age_tags(*(f"{domain}:{app_id}" for domain in domains))
+
+def invalidate_analytics(app_id: int, *domains: str):
+    result_cache.invalidate_tags(*(f"{domain}:{app_id}" for domain in domains))
+
 def get_or_create_user(user_uuid: str, email: Optional[str], name: Optional[str], device_info: Optional[Dict], connection, app_id: Optional[int] = None) -> int:
     """Get or create user and return user ID"""
     with connection.cursor() as cursor:
@@ -226,6 +387,16 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "version": "2.0.0", "multi_app": True}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint (Bearer METRICS_TOKEN, or METRICS_PUBLIC=true)"""
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Token metriche non valido")
+    elif not METRICS_PUBLIC:
+        raise HTTPException(status_code=403, detail="Metriche disattivate: impostare METRICS_TOKEN")
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 # App Management Endpoints
 @app.post("/api/v2/apps")
 async def create_app(app_data: App):
@@ -245,7 +416,8 @@ async def create_app(app_data: App):
             raise HTTPException(status_code=400, detail="App identifier already exists")
 
 @app.get("/api/v2/apps")
-async def list_apps():
+@coalesce("apps")
+def list_apps():
     """List all registered apps"""
     with get_db() as connection:
         with connection.cursor(pymysql.cursors.DictCursor) as cursor:
@@ -256,9 +428,8 @@ async def list_apps():
                    ORDER BY app_name"""
             )
             apps = cursor.fetchall()
-            for app in apps:
-                app['platform_support'] = json.loads(app['platform_support'])
-            return {"apps": apps}
+            raw_json_fields(apps, {'platform_support': []})
+            return json_response({"apps": apps})
 
 @app.put("/api/v2/apps/{app_identifier}")
 async def update_app(app_identifier: str, app_data: App):
@@ -312,12 +483,19 @@ async def delete_app(app_identifier: str):
             )
             version_count = cursor.fetchone()[0]
             
+            # Partitioned telemetry tables have no foreign keys, so CASCADE does not reach them
+            for table in TELEMETRY_TABLES:
+                cursor.execute(f"DELETE FROM {table} WHERE app_id = %s", (app_id,))
+            
             # Delete the app (CASCADE will delete all related data)
             cursor.execute(
                 "DELETE FROM apps WHERE id = %s",
                 (app_id,)
             )
             connection.commit()
+            latest_versions_cache.invalidate()
+            invalidate_analytics(app_id, "sessions", "errors", "installs", "versions")
+            app_ids_cache.invalidate(app_identifier)
             
             return {
                 "message": f"App '{app_identifier}' deleted successfully",
@@ -326,14 +504,17 @@ async def delete_app(app_identifier: str):
 
 # Get all versions across all apps
 @app.get("/api/v2/versions")
-async def get_all_versions(
+@coalesce("versions")
+def get_all_versions(
     app_identifier: Optional[str] = Query(None),
     platform: Optional[str] = Query(None),
-    is_active: Optional[bool] = Query(None)
+    is_active: Optional[bool] = Query(None),
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """Get all versions across all apps with optional filtering"""
+    """Get versions across all apps with optional filtering, newest first"""
     with get_db() as connection:
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        with connection.cursor(pymysql.cursors.DictCursor) as db_cursor:
             query = """
                 SELECT 
                     v.id,
@@ -369,20 +550,119 @@ async def get_all_versions(
                 query += " AND v.is_active = %s"
                 params.append(is_active)
             
-            query += " ORDER BY v.created_at DESC"
+            if cursor:
+                condition, condition_params = keyset_condition(
+                    ["v.created_at", "v.id"],
+                    decode_cursor(cursor, (datetime.fromisoformat, int))
+                )
+                query += f" AND {condition}"
+                params.extend(condition_params)
             
-            cursor.execute(query, params)
-            versions = cursor.fetchall()
+            query += " ORDER BY v.created_at DESC, v.id DESC LIMIT %s"
+            params.append(limit)
             
-            # Parse changelog
-            for version in versions:
-                if version['changelog']:
-                    try:
-                        version['changelog'] = json.loads(version['changelog'])
-                    except:
-                        version['changelog'] = []
+            db_cursor.execute(query, params)
+            versions = db_cursor.fetchall()
+            raw_json_fields(versions, {'changelog': []})
             
-            return {"versions": versions}
+            return json_response({
+                "versions": versions,
+                "next_cursor": next_cursor_for(versions, limit, 'created_at', 'id')
+            })
+
+def set_version_key(connection, version_id: int, version: str):
+    """Store the sortable key of a new version (no-op before add_version_keys.sql)"""
+    key = version_key(version)
+    if key is None or not has_column(connection, "app_versions", "version_key"):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE app_versions SET version_key = %s WHERE id = %s", (key, version_id))
+
+def set_rollout_percentage(connection, version_id: int, rollout_percentage: int):
+    """Store a staged rollout for a new version (no-op at 100% or before the migration)"""
+    if rollout_percentage >= 100 or not has_column(connection, "app_versions", "rollout_percentage"):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE app_versions SET rollout_percentage = %s WHERE id = %s",
+            (rollout_percentage, version_id)
+        )
+
+# Newest active builds per (app_id, platform); uploads, deletes and rollout changes
+# invalidate it, other workers pick changes up within the TTL
+latest_versions_cache = TTLCache(ttl_seconds=int(os.environ.get('LATEST_VERSION_CACHE_TTL', 30)), max_entries=1024)
+
+def version_candidates(connection, keys: List[tuple]) -> Dict[tuple, List[Dict[str, Any]]]:
+    """Newest active builds (version_code DESC, 'all' builds included) for each (app_id, platform)"""
+    candidates, missing = {}, []
+    for key in keys:
+        cached = latest_versions_cache.get(key)
+        if cached is None:
+            missing.append(key)
+        else:
+            candidates[key] = cached
+    if not missing:
+        return candidates
+    
+    app_ids = sorted({app_id for app_id, _ in missing})
+    platforms = sorted({platform for _, platform in missing} | {'all'})
+    with_rollout = has_column(connection, "app_versions", "rollout_percentage")
+    rollout_column = ", rollout_percentage" if with_rollout else ""
+    released = "COALESCE(rollout_percentage, 100) >= 100" if with_rollout else "TRUE"
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        # Builds down to the newest fully released one: every staged build above it, however many
+        cursor.execute(
+            f"""SELECT * FROM (
+                SELECT app_id, version, version_code, is_mandatory, file_size,
+                       changelog, release_date, platform{rollout_column},
+                       MAX(CASE WHEN {released} THEN version_code END) OVER (
+                           PARTITION BY app_id, platform
+                       ) as released_code
+                FROM app_versions
+                WHERE app_id IN ({', '.join(['%s'] * len(app_ids))})
+                      AND platform IN ({', '.join(['%s'] * len(platforms))})
+                      AND is_active = true
+            ) ranked
+            WHERE released_code IS NULL OR version_code >= released_code""",
+            app_ids + platforms
+        )
+        builds: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in cursor.fetchall():
+            del row['released_code']
+            builds.setdefault((row.pop('app_id'), row['platform']), []).append(row)
+    
+    for app_id, platform in missing:
+        merged = builds.get((app_id, platform), []) + (builds.get((app_id, 'all'), []) if platform != 'all' else [])
+        merged.sort(key=lambda row: row['version_code'] or 0, reverse=True)
+        # Nothing below the first fully released build can be picked
+        for index, row in enumerate(merged):
+            if row.get('rollout_percentage') is None or row['rollout_percentage'] >= 100:
+                merged = merged[:index + 1]
+                break
+        candidates[(app_id, platform)] = merged
+        latest_versions_cache.set((app_id, platform), candidates[(app_id, platform)])
+    return candidates
+
+def version_check_result(app_identifier: str, current_version: str, latest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """check_version response for one app"""
+    if not latest:
+        return {
+            "current_version": current_version,
+            "is_update_available": False
+        }
+    
+    return {
+        "current_version": current_version,
+        "latest_version": latest['version'],
+        "platform": latest['platform'],  # Include platform in response
+        # Only a newer build is an update, never a downgrade
+        "is_update_available": is_newer(latest['version'], current_version),
+        "is_mandatory": bool(latest['is_mandatory']),
+        "download_url": f"/api/v2/download/{app_identifier}/{latest['platform']}/{latest['version']}",
+        "file_size": latest['file_size'],
+        "release_date": latest['release_date'].isoformat() if latest['release_date'] else None,
+        "changelog": raw_json(latest['changelog'], [])
+    }
 
 # Version Check Endpoint (Multi-App)
 @app.post("/api/v2/version/check")
@@ -410,6 +690,11 @@ async def check_version(version_data: VersionCheck):
             )
             
             # Update user installation info
+            # Sortable key of the installed version, once add_version_keys.sql has run
+            key_params = (version_key(version_data.current_version),) if has_column(connection, "user_app_installations", "current_version_key") else ()
+            key_set = ", current_version_key = %s" if key_params else ""
+            # Installed-version counters, once add_version_install_counts.sql has run
+            counting = has_table(connection, install_counts.TABLE)
             with connection.cursor() as cursor:
                 # First get the version_id if it exists
                 cursor.execute(
@@ -421,90 +706,212 @@ async def check_version(version_data: VersionCheck):
                 version_result = cursor.fetchone()
                 version_id = version_result[0] if version_result else None
                 
-                # Check if user installation exists
+                # Check if user installation exists (locked: its counter moves with it)
                 cursor.execute(
-                    """SELECT id FROM user_app_installations
-                       WHERE user_id = %s AND app_id = %s""",
+                    f"""SELECT id, platform, current_version, is_active FROM user_app_installations
+                       WHERE user_id = %s AND app_id = %s{' FOR UPDATE' if counting else ''}""",
                     (user_id, app_id)
                 )
                 existing = cursor.fetchone()
+                installed = install_counts.install_key(app_id, version_data.platform, version_data.current_version)
+                counter_deltas = {}
                 
                 if existing:
                     # Update existing
                     if version_id:
                         cursor.execute(
-                            """UPDATE user_app_installations 
+                            f"""UPDATE user_app_installations 
                                SET current_version = %s,
                                    platform = %s,
                                    app_version_id = %s,
-                                   last_update_date = NOW()
+                                   last_update_date = NOW(){key_set}
                                WHERE user_id = %s AND app_id = %s""",
                             (version_data.current_version, version_data.platform, 
-                             version_id, user_id, app_id)
+                             version_id) + key_params + (user_id, app_id)
                         )
                     else:
                         # Update without version_id
                         cursor.execute(
-                            """UPDATE user_app_installations 
+                            f"""UPDATE user_app_installations 
                                SET current_version = %s,
                                    platform = %s,
-                                   last_update_date = NOW()
+                                   last_update_date = NOW(){key_set}
                                WHERE user_id = %s AND app_id = %s""",
-                            (version_data.current_version, version_data.platform, 
-                             user_id, app_id)
+                            (version_data.current_version, version_data.platform) + key_params
+                            + (user_id, app_id)
                         )
+                    if existing[3]:
+                        install_counts.record_move(
+                            counter_deltas, install_counts.install_key(app_id, existing[1], existing[2]), installed)
                 else:
                     # Insert new - only if we have a valid version_id
                     if version_id:
                         cursor.execute(
-                            """INSERT INTO user_app_installations 
+                            f"""INSERT INTO user_app_installations 
                                (user_id, app_id, current_version, platform, app_version_id, 
-                                install_date, last_update_date, is_active)
-                               VALUES (%s, %s, %s, %s, %s, NOW(), NOW(), 1)""",
+                                install_date, last_update_date, is_active{', current_version_key' if key_params else ''})
+                               VALUES (%s, %s, %s, %s, %s, NOW(), NOW(), 1{', %s' if key_params else ''})""",
                             (user_id, app_id, version_data.current_version, 
-                             version_data.platform, version_id)
+                             version_data.platform, version_id) + key_params
                         )
+                        install_counts.record_move(counter_deltas, None, installed)
                     else:
                         # If version doesn't exist in database, skip installation tracking
                         logger.warning(f"Version {version_data.current_version} not found in database for platform {version_data.platform}")
+                if counting:
+                    install_counts.apply_deltas(cursor, counter_deltas)
                 connection.commit()
+                age_analytics(app_id, "installs")
         
-        # Get latest version
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        # Get latest version this device is in the rollout of
+        candidates = version_candidates(connection, [(app_id, version_data.platform)])
+        latest = pick_version(version_data.app_identifier, candidates[(app_id, version_data.platform)],
+                              version_data.user_uuid)
+        return json_response(version_check_result(version_data.app_identifier, version_data.current_version, latest))
+
+def track_installations(connection, user_id: int, installs: Dict[int, tuple]):
+    """
+    Record the installed version of several apps for one user in a single transaction
+    installs maps app_id -> (platform, current_version); like check_version, new rows are
+    only created for versions known to the server
+    """
+    app_ids = list(installs)
+    versions = sorted({version for _, version in installs.values()})
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT id, app_id, platform, version FROM app_versions
+               WHERE app_id IN ({', '.join(['%s'] * len(app_ids))})
+                     AND version IN ({', '.join(['%s'] * len(versions))})""",
+            app_ids + versions
+        )
+        version_ids = {(row[1], row[2], row[3]): row[0] for row in cursor.fetchall()}
+        
+        with_keys = has_column(connection, "user_app_installations", "current_version_key")
+        counting = has_table(connection, install_counts.TABLE)
+        previous = {}
+        if counting:
+            # Locked: the counters move with the rows
             cursor.execute(
-                """SELECT version, version_code, is_mandatory, file_size, 
-                          changelog, release_date, platform
-                   FROM app_versions
-                   WHERE app_id = %s AND (platform = %s OR platform = 'all')
-                         AND is_active = true
-                   ORDER BY version_code DESC
-                   LIMIT 1""",
-                (app_id, version_data.platform)
+                f"""SELECT app_id, platform, current_version, is_active FROM user_app_installations
+                   WHERE user_id = %s AND app_id IN ({', '.join(['%s'] * len(app_ids))})
+                   FOR UPDATE""",
+                [user_id] + app_ids
             )
-            latest = cursor.fetchone()
-            
-            if not latest:
-                return {
-                    "current_version": version_data.current_version,
-                    "is_update_available": False
-                }
-            
-            # Compare versions
-            is_update_available = latest['version'] != version_data.current_version
-            
-            response = {
-                "current_version": version_data.current_version,
-                "latest_version": latest['version'],
-                "platform": latest['platform'],  # Include platform in response
-                "is_update_available": is_update_available,
-                "is_mandatory": bool(latest['is_mandatory']),
-                "download_url": f"/api/v2/download/{version_data.app_identifier}/{latest['platform']}/{latest['version']}",
-                "file_size": latest['file_size'],
-                "release_date": latest['release_date'].isoformat() if latest['release_date'] else None,
-                "changelog": json.loads(latest['changelog']) if latest['changelog'] else []
-            }
-            
-            return response
+            previous = {row[0]: row[1:] for row in cursor.fetchall()}
+        counter_deltas = {}
+        known, unknown = [], []
+        for app_id, (platform, version) in installs.items():
+            version_id = version_ids.get((app_id, platform, version))
+            row = (app_id, platform, version, version_id) + ((version_key(version),) if with_keys else ())
+            (known if version_id else unknown).append(row)
+            old = previous.get(app_id)
+            if old is None and version_id:
+                install_counts.record_move(counter_deltas, None, install_counts.install_key(app_id, platform, version))
+            elif old is not None and old[2]:
+                install_counts.record_move(counter_deltas, install_counts.install_key(app_id, old[0], old[1]),
+                                           install_counts.install_key(app_id, platform, version))
+        
+        if known:
+            cursor.execute(
+                f"""INSERT INTO user_app_installations
+                   (user_id, app_id, current_version, platform, app_version_id,
+                    install_date, last_update_date, is_active{', current_version_key' if with_keys else ''})
+                   VALUES {', '.join([f"(%s, %s, %s, %s, %s, NOW(), NOW(), 1{', %s' if with_keys else ''})"] * len(known))}
+                   ON DUPLICATE KEY UPDATE
+                       current_version = VALUES(current_version),
+                       platform = VALUES(platform),
+                       app_version_id = VALUES(app_version_id),
+                       last_update_date = NOW(){', current_version_key = VALUES(current_version_key)' if with_keys else ''}""",
+                [value for app_id, platform, version, version_id, *key in known
+                 for value in (user_id, app_id, version, platform, version_id, *key)]
+            )
+        if unknown:
+            # Versions the server does not know only update existing installations
+            cases = " ".join(["WHEN %s THEN %s"] * len(unknown))
+            params = [value for row in unknown for value in (row[0], row[2])]
+            params += [value for row in unknown for value in (row[0], row[1])]
+            key_set = ""
+            if with_keys:
+                key_set = f", current_version_key = CASE app_id {cases} END"
+                params += [value for row in unknown for value in (row[0], row[4])]
+            cursor.execute(
+                f"""UPDATE user_app_installations
+                   SET current_version = CASE app_id {cases} END,
+                       platform = CASE app_id {cases} END,
+                       last_update_date = NOW(){key_set}
+                   WHERE user_id = %s AND app_id IN ({', '.join(['%s'] * len(unknown))})""",
+                params + [user_id] + [row[0] for row in unknown]
+            )
+        if counting:
+            install_counts.apply_deltas(cursor, counter_deltas)
+    connection.commit()
+
+@app.post("/api/v2/version/check/bulk")
+async def check_versions_bulk(bulk_data: BulkVersionCheck):
+    """
+    Check several apps in one round trip (launchers, MDM agents)
+    Each result has the check_version shape plus app_identifier, or an "error"
+    """
+    identifiers = sorted({check.app_identifier for check in bulk_data.checks})
+    with get_db() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT app_identifier, id FROM apps WHERE app_identifier IN ({', '.join(['%s'] * len(identifiers))})",
+                identifiers
+            )
+            app_ids = dict(cursor.fetchall())
+        
+        valid = [check for check in bulk_data.checks
+                 if check.app_identifier in app_ids and check.platform in PLATFORMS]
+        candidates = version_candidates(connection, list({(app_ids[check.app_identifier], check.platform)
+                                                           for check in valid}))
+        
+        if bulk_data.user_uuid and valid:
+            user_id = get_or_create_user(bulk_data.user_uuid, None, None, bulk_data.device_info,
+                                         connection, app_ids[valid[0].app_identifier])
+            track_installations(connection, user_id, {
+                app_ids[check.app_identifier]: (check.platform, check.current_version) for check in valid
+            })
+            for check in valid:
+                age_analytics(app_ids[check.app_identifier], "installs")
+    
+    results = []
+    for check in bulk_data.checks:
+        if check.app_identifier not in app_ids:
+            results.append({"app_identifier": check.app_identifier, "error": "App not found"})
+        elif check.platform not in PLATFORMS:
+            results.append({"app_identifier": check.app_identifier,
+                            "error": "Invalid platform. Must be 'android', 'ios', or 'web'"})
+        else:
+            latest = pick_version(check.app_identifier,
+                                  candidates[(app_ids[check.app_identifier], check.platform)],
+                                  bulk_data.user_uuid)
+            results.append(dict(app_identifier=check.app_identifier,
+                                **version_check_result(check.app_identifier, check.current_version, latest)))
+    return json_response({"results": results})
+
+def announce_upload(app_identifier: str, version_id: int, platform: str, version: str, version_code: int,
+                    is_mandatory: bool, file_size: int, rollout_percentage: int):
+    """Dashboard event and update notification for a new build (both upload paths)"""
+    event_broker.publish(app_identifier, "version_uploaded", {
+        "id": version_id,
+        "version": version,
+        "platform": platform,
+        "file_size": file_size,
+        "is_mandatory": is_mandatory,
+        "rollout_percentage": rollout_percentage
+    })
+    event_broker.count(app_identifier, "versions_uploaded")
+    if rollout_percentage > 0:
+        update_notifier.notify({
+            "id": version_id,
+            "app_identifier": app_identifier,
+            "platform": platform,
+            "version": version,
+            "version_code": version_code,
+            "is_mandatory": is_mandatory,
+            "rollout_percentage": rollout_percentage
+        })
 
 # File Upload Endpoint (Multi-App)
 @app.post("/api/v2/version/upload")
@@ -515,6 +922,7 @@ async def upload_version(
     version_code: int = Form(...),
     is_mandatory: bool = Form(False),
     changelog: str = Form(None),
+    rollout_percentage: int = Form(100, ge=0, le=100),
     file: UploadFile = File(...)
 ):
     """Upload new version for specific app"""
@@ -544,9 +952,11 @@ async def upload_version(
         elif platform == "ios" and not file.filename.endswith('.ipa'):
             raise HTTPException(status_code=400, detail="iOS requires IPA file")
         
-        # Read file in chunks to handle large files
-        file_content = await file.read()
-        file_size = len(file_content)
+        # Size from the spooled upload; the content is only read into memory for BLOB storage
+        file_size = file.size
+        if file_size is None:
+            file_size = await run_in_threadpool(file.file.seek, 0, os.SEEK_END)
+            await file.seek(0)
         
         # Check file size (max 500MB)
         MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
@@ -558,9 +968,6 @@ async def upload_version(
         
         logger.info(f"Uploading file: {file.filename}, size: {file_size / (1024*1024):.2f}MB")
         
-        # Calculate hash
-        file_hash = hashlib.sha256(file_content).hexdigest()
-        
         # Parse changelog
         changelog_list = []
         if changelog:
@@ -586,14 +993,16 @@ async def upload_version(
                     storage_manager.base_path = Path('./storage')
                     storage_manager.ensure_directories()
                 
-                metadata = storage_manager.save_file(
+                # Streamed from the spooled upload, hashed on the way
+                metadata = await async_storage_manager.save_upload(
                     app_id=app_id,
                     version=version,
                     platform=platform,
                     filename=file.filename,
-                    file_content=file_content
+                    upload=file
                 )
                 file_path = metadata['relative_path']
+                file_hash = metadata['hash']
                 logger.info(f"File saved to: {file_path}")
             except Exception as e:
                 logger.error(f"Failed to save file to storage: {e}")
@@ -604,7 +1013,6 @@ async def upload_version(
         else:
             # Use BLOB storage for smaller files
             logger.info(f"Using BLOB storage for {file.filename} ({file_size / (1024*1024):.2f}MB)")
-            file_blob = file_content
             
             # Check BLOB size limit
             if file_size > 50 * 1024 * 1024:  # 50MB limit for BLOB
@@ -612,6 +1020,8 @@ async def upload_version(
                     status_code=413,
                     detail=f"File too large for database storage ({file_size / (1024*1024):.2f}MB). Maximum is 50MB."
                 )
+            file_blob = await file.read()
+            file_hash = hashlib.sha256(file_blob).hexdigest()
         
         # Save to database with retry logic
         max_retries = 3
@@ -644,7 +1054,12 @@ async def upload_version(
                              file.filename, file_size, file_hash,
                              json.dumps(changelog_list), is_mandatory)
                         )
+                    version_id = cursor.lastrowid
+                    set_version_key(connection, version_id, version)
+                    set_rollout_percentage(connection, version_id, rollout_percentage)
                     connection.commit()
+                    latest_versions_cache.invalidate()
+                    invalidate_analytics(app_id, "versions")
                     logger.info(f"Successfully uploaded version {version} for {app_identifier}")
                     break
             except pymysql.err.OperationalError as e:
@@ -659,13 +1074,17 @@ async def upload_version(
                         detail="Database connection error. The file might be too large for the current database configuration."
                     )
             
+        announce_upload(app_identifier, version_id, platform, version, version_code,
+                        is_mandatory, file_size, rollout_percentage)
+        
         return {
             "message": "Version uploaded successfully",
             "app": app_identifier,
             "version": version,
             "platform": platform,
-            "file_size": len(file_content),
-            "file_hash": file_hash
+            "file_size": file_size,
+            "file_hash": file_hash,
+            "rollout_percentage": rollout_percentage
         }
 
 @app.delete("/api/v2/versions/{app_identifier}/{platform}/{version}")
@@ -683,7 +1102,8 @@ async def delete_version(app_identifier: str, platform: str, version: str):
                    WHERE app_id = %s AND platform = %s AND version = %s""",
                 (app_id, platform, version)
             )
-            if not cursor.fetchone():
+            existing = cursor.fetchone()
+            if not existing:
                 raise HTTPException(status_code=404, detail="Version not found")
             
             # Delete the version
@@ -693,9 +1113,58 @@ async def delete_version(app_identifier: str, platform: str, version: str):
                 (app_id, platform, version)
             )
             connection.commit()
+            latest_versions_cache.invalidate()
+            invalidate_analytics(app_id, "versions")
+            blob_cache.discard_version(existing[0])
             
             return {"message": f"Version {version} for {platform} deleted successfully"}
 
+@app.put("/api/v2/versions/{app_identifier}/{platform}/{version}/rollout")
+async def update_version_rollout(app_identifier: str, platform: str, version: str, rollout: RolloutUpdate):
+    """Set the share of devices (0-100%) offered this version by check_version"""
+    with get_db() as connection:
+        app_id = get_app_id(app_identifier, connection)
+        if not app_id:
+            raise HTTPException(status_code=404, detail="App not found")
+        if not has_column(connection, "app_versions", "rollout_percentage"):
+            raise HTTPException(status_code=409, detail="Run add_rollout_percentage.sql to enable staged rollouts")
+        
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(
+                """SELECT id, version_code, is_mandatory FROM app_versions
+                   WHERE app_id = %s AND platform = %s AND version = %s""",
+                (app_id, platform, version)
+            )
+            existing = cursor.fetchone()
+            if not existing:
+                raise HTTPException(status_code=404, detail="Version not found")
+            
+            cursor.execute(
+                "UPDATE app_versions SET rollout_percentage = %s WHERE id = %s",
+                (rollout.rollout_percentage, existing['id'])
+            )
+            connection.commit()
+            latest_versions_cache.invalidate()
+        
+        if rollout.rollout_percentage > 0:
+            # Listeners that the new percentage brings into the rollout are told now
+            update_notifier.notify({
+                "id": existing['id'],
+                "app_identifier": app_identifier,
+                "platform": platform,
+                "version": version,
+                "version_code": existing['version_code'],
+                "is_mandatory": existing['is_mandatory'],
+                "rollout_percentage": rollout.rollout_percentage
+            })
+        
+        return {
+            "app": app_identifier,
+            "version": version,
+            "platform": platform,
+            "rollout_percentage": rollout.rollout_percentage
+        }
+
 # User Session Tracking
 @app.post("/api/v2/session/start")
 async def start_session(session_data: UserSession):
@@ -734,25 +1203,46 @@ async def start_session(session_data: UserSession):
                  json.dumps(session_data.device_info) if session_data.device_info else None)
             )
             db_session_id = cursor.lastrowid
+            # Cohort retention matrix, once add_cohort_retention.sql has run
+            if has_table(connection, cohort_retention.MEMBERS_TABLE):
+                cohort_retention.record_activity(cursor, app_id, user_id)
             connection.commit()
+        age_analytics(app_id, "sessions")
+        session_tracker.start(db_session_id)
+        
+        event_broker.publish(session_data.app_identifier, "session_started", {
+            "id": db_session_id,
+            "user_id": user_id,
+            "email": session_data.email,
+            "session_start": datetime.now(),
+            "app_version": session_data.app_version,
+            "platform": platform,
+            "device_info": session_data.device_info
+        })
+        event_broker.count(session_data.app_identifier, "sessions_started")
             
         return {"session_id": db_session_id, "user_id": user_id, "session_uuid": session_uuid}
 
+@app.post("/api/v2/session/{session_id}/heartbeat")
+async def session_heartbeat(session_id: int):
+    """Keep a session open (no database write); send every minute or so while the app is in use"""
+    if not session_tracker.heartbeat(session_id):
+        # Not tracked by this worker: adopt it only while it is still open (not a stale id)
+        def still_active():
+            with get_db() as connection:
+                return session_is_active(connection, session_id)
+        if not await run_in_threadpool(still_active):
+            raise HTTPException(status_code=404, detail="Session not found or already ended")
+        if not session_tracker.adopt(session_id):
+            raise HTTPException(status_code=503, detail="Session table full", headers={"Retry-After": "60"})
+    return {"message": "Session alive"}
+
 @app.post("/api/v2/session/{session_id}/end")
 async def end_session(session_id: int):
     """End user session"""
-    with get_db() as connection:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET end_time = NOW(),
-                       is_active = 0,
-                       duration_seconds = TIMESTAMPDIFF(SECOND, start_time, NOW())
-                   WHERE id = %s""",
-                (session_id,)
-            )
-            connection.commit()
-            
+    closed = await run_in_threadpool(write_session_closes, [session_tracker.end(session_id)])
+    if not closed:
+        raise HTTPException(status_code=404, detail="Session not found")
     return {"message": "Session ended"}
 
 # Error Reporting
@@ -768,24 +1258,48 @@ async def report_error(error_data: ErrorReport):
         if error_data.user_uuid:
             user_id = get_or_create_user(error_data.user_uuid, None, None, error_data.device_info, connection, app_id)
         
+        key_params = (version_key(error_data.app_version),) if has_column(connection, "app_error_logs", "app_version_key") else ()
         with connection.cursor() as cursor:
             cursor.execute(
-                """INSERT INTO app_error_logs 
+                f"""INSERT INTO app_error_logs 
                    (app_id, user_id, session_id, error_type, error_message, error_stack,
-                    app_version, platform, metadata, severity)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                    app_version, platform, metadata, severity{', app_version_key' if key_params else ''})
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s{', %s' if key_params else ''})""",
                 (app_id, user_id, error_data.session_id, error_data.error_type, error_data.error_message,
                  error_data.error_stack, error_data.app_version, error_data.platform,
                  json.dumps(error_data.metadata) if error_data.metadata else None,
-                 error_data.severity)
+                 error_data.severity) + key_params
             )
+            error_id = cursor.lastrowid
             connection.commit()
-            
-        return {"message": "Error reported", "error_id": cursor.lastrowid}
+        age_analytics(app_id, "errors")
+        
+        event_broker.publish(error_data.app_identifier, "error_reported", {
+            "id": error_id,
+            "error_type": error_data.error_type,
+            "error_message": error_data.error_message,
+            "severity": error_data.severity,
+            "user_id": user_id,
+            "app_version": error_data.app_version,
+            "platform": error_data.platform,
+            "created_at": datetime.now()
+        })
+        event_broker.count(error_data.app_identifier, "errors")
+        event_broker.count(error_data.app_identifier, f"errors_{error_data.severity}")
+            
+        return {"message": "Error reported", "error_id": error_id}
 
 # Analytics Endpoints
+# Identical concurrent calls share one computation; the result stays fresh for ANALYTICS_CACHE_TTL
+# seconds (or until new data ages its tags), then is served stale for up to ANALYTICS_STALE_SECONDS
+# while one call recomputes it
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 30))
+ANALYTICS_STALE_SECONDS = int(os.environ.get('ANALYTICS_STALE_SECONDS', 300))
+
 @app.get("/api/v2/analytics/{app_identifier}/overview")
-async def get_app_analytics(app_identifier: str, days: int = Query(30, ge=1, le=365)):
+@coalesce("analytics_overview", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("sessions", "errors", "installs"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_app_analytics(app_identifier: str, days: int = Query(30, ge=1, le=365)):
     """Get analytics overview for specific app"""
     with get_db() as connection:
         app_id = get_app_id(app_identifier, connection)
@@ -808,6 +1322,7 @@ async def get_app_analytics(app_identifier: str, days: int = Query(30, ge=1, le=
                 FROM apps a
                 LEFT JOIN user_app_installations uai ON a.id = uai.app_id
                 LEFT JOIN user_sessions us ON a.id = us.app_id
+                    AND us.start_time >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
                 WHERE a.id = %s""",
                 (app_id,)
             )
@@ -826,19 +1341,22 @@ async def get_app_analytics(app_identifier: str, days: int = Query(30, ge=1, le=
             )
             error_stats = cursor.fetchone()
             
-            # Get version distribution
-            cursor.execute(
-                """SELECT 
-                    current_version,
-                    platform,
-                    COUNT(*) as user_count
-                FROM user_app_installations
-                WHERE app_id = %s AND is_active = true
-                GROUP BY current_version, platform
-                ORDER BY user_count DESC""",
-                (app_id,)
-            )
-            version_distribution = cursor.fetchall()
+            # Get version distribution (maintained counters when available)
+            if has_table(connection, install_counts.TABLE):
+                version_distribution = install_counts.distribution(cursor, [app_id])[app_id]
+            else:
+                cursor.execute(
+                    """SELECT 
+                        current_version,
+                        platform,
+                        COUNT(*) as user_count
+                    FROM user_app_installations
+                    WHERE app_id = %s AND is_active = true
+                    GROUP BY current_version, platform
+                    ORDER BY user_count DESC""",
+                    (app_id,)
+                )
+                version_distribution = cursor.fetchall()
             
             return {
                 "app_identifier": app_identifier,
@@ -848,11 +1366,61 @@ async def get_app_analytics(app_identifier: str, days: int = Query(30, ge=1, le=
                 "period_days": days
             }
 
+# first/last version of a group: integer keys order like semver, the strings do not
+# The stored strings at the lowest/highest key (NULL keys sort last either way)
+# Error groups: version range on the integer key; the strings are MIN/MAX as text, used for groups without keys
+VERSION_RANGE_COLUMNS = """MIN(app_version_key) as first_version_key,
+                    MAX(app_version_key) as last_version_key,
+                    MIN(app_version) as first_version,
+                    MAX(app_version) as last_version"""
+LEGACY_VERSION_RANGE_COLUMNS = """MIN(app_version) as first_version,
+                    MAX(app_version) as last_version"""
+
+def version_range_rows(cursor, rows: List[Dict[str, Any]], app_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Replace text MIN/MAX versions with the stored versions at each group's key range (DictCursor)
+    The strings come from one batched lookup, a single idx_app_version_key seek per distinct key
+    """
+    keys = sorted({(app_id or row['app_id'], row[column]) for row in rows
+                   for column in ('first_version_key', 'last_version_key') if row.get(column) is not None})
+    versions = {}
+    if keys:
+        cursor.execute(
+            " UNION ALL ".join(["""(SELECT app_id, app_version_key, app_version FROM app_error_logs
+                                    WHERE app_id = %s AND app_version_key = %s LIMIT 1)"""] * len(keys)),
+            [value for key in keys for value in key]
+        )
+        versions = {(row['app_id'], row['app_version_key']): row['app_version'] for row in cursor.fetchall()}
+    for row in rows:
+        owner = app_id or row['app_id']
+        first_key, last_key = row.pop('first_version_key', None), row.pop('last_version_key', None)
+        if first_key is not None:
+            row['first_version'] = versions.get((owner, first_key), row['first_version'])
+            row['last_version'] = versions.get((owner, last_key), row['last_version'])
+    return rows
+
+def version_range_condition(column: str, min_version: Optional[str], max_version: Optional[str]):
+    """SQL fragment and params for an inclusive version range on a key column"""
+    condition, params = "", []
+    for value, operator in ((min_version, ">="), (max_version, "<=")):
+        if value:
+            key = version_key(value)
+            if key is None:
+                raise HTTPException(status_code=400, detail=f"Invalid version '{value}'")
+            condition += f" AND {column} {operator} %s"
+            params.append(key)
+    return condition, params
+
 @app.get("/api/v2/analytics/{app_identifier}/errors")
-async def get_error_summary(
+@coalesce("analytics_errors", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("errors"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_error_summary(
     app_identifier: str,
     severity: Optional[str] = None,
-    limit: int = Query(50, ge=1, le=200)
+    limit: int = Query(50, ge=1, le=200),
+    days: Optional[int] = Query(None, ge=1, le=3650, description="Only errors from the last N days"),
+    min_version: Optional[str] = Query(None, description="Only errors from this app version or later"),
+    max_version: Optional[str] = Query(None, description="Only errors up to this app version")
 ):
     """Get error summary for specific app"""
     with get_db() as connection:
@@ -860,16 +1428,16 @@ async def get_error_summary(
         if not app_id:
             raise HTTPException(status_code=404, detail="App not found")
         
+        has_version_keys = has_column(connection, "app_error_logs", "app_version_key")
         with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            query = """
+            query = f"""
                 SELECT 
                     error_type,
                     severity,
                     COUNT(*) as error_count,
                     MAX(created_at) as last_occurrence,
                     COUNT(DISTINCT user_id) as affected_users,
-                    MIN(app_version) as first_version,
-                    MAX(app_version) as last_version
+                    {VERSION_RANGE_COLUMNS if has_version_keys else LEGACY_VERSION_RANGE_COLUMNS}
                 FROM app_error_logs
                 WHERE app_id = %s
             """
@@ -879,6 +1447,17 @@ async def get_error_summary(
                 query += " AND severity = %s"
                 params.append(severity)
             
+            if days:
+                query += " AND created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)"
+                params.append(days)
+            
+            if min_version or max_version:
+                if not has_version_keys:
+                    raise HTTPException(status_code=409, detail="Run add_version_keys.sql to filter by version")
+                condition, condition_params = version_range_condition("app_version_key", min_version, max_version)
+                query += condition
+                params.extend(condition_params)
+            
             query += """
                 GROUP BY error_type, severity
                 ORDER BY severity DESC, error_count DESC
@@ -887,14 +1466,313 @@ async def get_error_summary(
             params.append(limit)
             
             cursor.execute(query, params)
-            errors = cursor.fetchall()
+            errors = version_range_rows(cursor, cursor.fetchall(), app_id)
             
             return {"app_identifier": app_identifier, "errors": errors}
 
+@app.get("/api/v2/analytics/{app_identifier}/updates")
+@coalesce("analytics_updates", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("updates"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_update_funnel(
+    app_identifier: str,
+    to_version: Optional[str] = None,
+    platform: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200, description="Most recent releases to return"),
+    top_reasons: int = Query(5, ge=1, le=50)
+):
+    """Update funnel per release: stage counts, success/failure rates, top failure reasons, time to install"""
+    with get_db() as connection:
+        app_id = get_app_id(app_identifier, connection)
+        if not app_id:
+            raise HTTPException(status_code=404, detail="App not found")
+        if not has_table(connection, update_funnel.TABLE):
+            raise HTTPException(status_code=409, detail="Run add_update_funnel.sql to enable update analytics")
+
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            releases = update_funnel.release_funnels(cursor, app_id, to_version, platform, limit, top_reasons)
+            last_id = update_funnel.last_aggregated_id(cursor)
+
+        return {"app_identifier": app_identifier, "releases": releases, "aggregated_through_id": last_id}
+
+# Aggregated dashboard summary
+def summary_identifiers(app_identifier: Optional[List[str]]) -> List[str]:
+    """app_identifier values of the summary (repeated or comma separated), sorted"""
+    return sorted({
+        identifier.strip()
+        for value in (app_identifier or [])
+        for identifier in value.split(',')
+        if identifier.strip()
+    })
+
+def dashboard_tags(app_identifier: Optional[List[str]] = None, **_):
+    """tags function for the summary: the analytics domains of every app it covers"""
+    identifiers = summary_identifiers(app_identifier)
+    if identifiers:
+        app_ids = [app_id for app_id in map(cached_app_id, identifiers) if app_id]
+    else:
+        with get_db() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id FROM apps")
+                app_ids = [row[0] for row in cursor.fetchall()]
+    return [f"{domain}:{app_id}" for app_id in app_ids
+            for domain in ("sessions", "errors", "installs", "versions")]
+
+@app.get("/api/v2/dashboard/summary")
+@coalesce("dashboard_summary", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=dashboard_tags, stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_dashboard_summary(
+    app_identifier: Optional[List[str]] = Query(None),
+    days: int = Query(30, ge=1, le=365),
+    errors_per_app: int = Query(5, ge=0, le=50),
+    sessions_per_app: int = Query(3, ge=0, le=50)
+):
+    """
+    Get overview, critical errors and recent sessions for all apps in one call.
+    Figures are computed with set-based queries grouped by app_id instead of
+    one request per app. Pass app_identifier (repeated or comma separated)
+    to restrict the summary to a subset of apps.
+    """
+    identifiers = summary_identifiers(app_identifier)
+
+    with get_db() as connection:
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            query = """
+                SELECT id, app_identifier, app_name, description, platform_support,
+                       is_active, created_at
+                FROM apps
+            """
+            params = []
+            if identifiers:
+                query += f" WHERE app_identifier IN ({', '.join(['%s'] * len(identifiers))})"
+                params.extend(identifiers)
+            query += " ORDER BY app_name"
+            cursor.execute(query, params)
+            apps = cursor.fetchall()
+
+            app_ids = [app_row['id'] for app_row in apps]
+            in_clause = ', '.join(['%s'] * len(app_ids))
+
+            installs = {}
+            activity = {}
+            error_stats = {}
+            catalogue = {}
+            distribution = {app_id: [] for app_id in app_ids}
+            critical_errors = {app_id: [] for app_id in app_ids}
+            recent_sessions = {app_id: [] for app_id in app_ids}
+
+            if app_ids:
+                # Installed base per app
+                cursor.execute(
+                    f"""SELECT
+                        app_id,
+                        COUNT(DISTINCT user_id) as total_users,
+                        COUNT(DISTINCT CASE WHEN install_date >= CURDATE()
+                              THEN user_id END) as new_users_today
+                    FROM user_app_installations
+                    WHERE app_id IN ({in_clause})
+                    GROUP BY app_id""",
+                    app_ids
+                )
+                installs = {row['app_id']: row for row in cursor.fetchall()}
+
+                # Active users per app, only the last 30 days of sessions are scanned
+                cursor.execute(
+                    f"""SELECT
+                        app_id,
+                        COUNT(DISTINCT CASE WHEN start_time >= CURDATE()
+                              THEN user_id END) as daily_active_users,
+                        COUNT(DISTINCT CASE WHEN start_time >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+                              THEN user_id END) as weekly_active_users,
+                        COUNT(DISTINCT user_id) as monthly_active_users
+                    FROM user_sessions
+                    WHERE app_id IN ({in_clause})
+                        AND start_time >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+                    GROUP BY app_id""",
+                    app_ids
+                )
+                activity = {row['app_id']: row for row in cursor.fetchall()}
+
+                # Error stats per app for the requested period
+                cursor.execute(
+                    f"""SELECT
+                        app_id,
+                        COUNT(*) as total_errors,
+                        COUNT(DISTINCT user_id) as affected_users,
+                        COUNT(CASE WHEN severity = 'critical' THEN 1 END) as critical_errors
+                    FROM app_error_logs
+                    WHERE app_id IN ({in_clause})
+                        AND created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+                    GROUP BY app_id""",
+                    app_ids + [days]
+                )
+                error_stats = {row['app_id']: row for row in cursor.fetchall()}
+
+                # Version catalogue: counts, downloads and latest active build per app
+                cursor.execute(
+                    f"""SELECT
+                        app_id,
+                        COUNT(*) as total_versions,
+                        SUM(download_count) as total_downloads,
+                        SUBSTRING_INDEX(
+                            GROUP_CONCAT(CASE WHEN is_active THEN version END
+                                         ORDER BY version_code DESC SEPARATOR ','),
+                            ',', 1) as latest_version
+                    FROM app_versions
+                    WHERE app_id IN ({in_clause})
+                    GROUP BY app_id""",
+                    app_ids
+                )
+                catalogue = {row['app_id']: row for row in cursor.fetchall()}
+
+                # Installed version distribution (maintained counters when available)
+                if has_table(connection, install_counts.TABLE):
+                    distribution = install_counts.distribution(cursor, app_ids)
+                else:
+                    cursor.execute(
+                        f"""SELECT
+                            app_id,
+                            current_version,
+                            platform,
+                            COUNT(*) as user_count
+                        FROM user_app_installations
+                        WHERE app_id IN ({in_clause}) AND is_active = true
+                        GROUP BY app_id, current_version, platform
+                        ORDER BY user_count DESC""",
+                        app_ids
+                    )
+                    for row in cursor.fetchall():
+                        distribution[row.pop('app_id')].append(row)
+
+                if errors_per_app:
+                    version_columns = (VERSION_RANGE_COLUMNS if has_column(connection, "app_error_logs", "app_version_key")
+                                       else LEGACY_VERSION_RANGE_COLUMNS)
+                    cursor.execute(
+                        f"""SELECT
+                            app_id,
+                            error_type,
+                            severity,
+                            COUNT(*) as error_count,
+                            MAX(created_at) as last_occurrence,
+                            COUNT(DISTINCT user_id) as affected_users,
+                            {version_columns}
+                        FROM app_error_logs
+                        WHERE app_id IN ({in_clause}) AND severity = 'critical'
+                        GROUP BY app_id, error_type, severity
+                        ORDER BY error_count DESC""",
+                        app_ids
+                    )
+                    top_errors = []
+                    for row in cursor.fetchall():
+                        bucket = critical_errors[row['app_id']]
+                        if len(bucket) < errors_per_app:
+                            bucket.append(row)
+                            top_errors.append(row)
+                    version_range_rows(cursor, top_errors)
+                    for row in top_errors:
+                        del row['app_id']
+
+                if sessions_per_app:
+                    cursor.execute(
+                        f"""SELECT * FROM (
+                            SELECT
+                                s.app_id,
+                                s.id,
+                                s.user_id,
+                                u.email,
+                                s.start_time as session_start,
+                                s.end_time as session_end,
+                                s.duration_seconds,
+                                s.app_version,
+                                s.platform,
+                                ROW_NUMBER() OVER (
+                                    PARTITION BY s.app_id ORDER BY s.start_time DESC
+                                ) as row_num
+                            FROM user_sessions s
+                            JOIN app_users u ON s.user_id = u.id
+                            WHERE s.app_id IN ({in_clause})
+                                AND s.start_time >= DATE_SUB(NOW(), INTERVAL %s DAY)
+                        ) ranked
+                        WHERE row_num <= %s
+                        ORDER BY session_start DESC""",
+                        app_ids + [days, sessions_per_app]
+                    )
+                    for row in cursor.fetchall():
+                        row.pop('row_num')
+                        recent_sessions[row.pop('app_id')].append(row)
+
+    totals = {
+        "total_apps": len(apps),
+        "total_users": 0,
+        "active_users_today": 0,
+        "total_errors": 0,
+        "critical_errors": 0,
+        "total_versions": 0,
+        "total_downloads": 0
+    }
+    summaries = []
+    for app_row in apps:
+        app_id = app_row['id']
+        app_installs = installs.get(app_id, {})
+        app_activity = activity.get(app_id, {})
+        app_errors = error_stats.get(app_id, {})
+        app_catalogue = catalogue.get(app_id, {})
+
+        user_stats = {
+            "total_users": app_installs.get('total_users', 0),
+            "daily_active_users": app_activity.get('daily_active_users', 0),
+            "weekly_active_users": app_activity.get('weekly_active_users', 0),
+            "monthly_active_users": app_activity.get('monthly_active_users', 0),
+            "new_users_today": app_installs.get('new_users_today', 0)
+        }
+        app_error_stats = {
+            "total_errors": app_errors.get('total_errors', 0),
+            "affected_users": app_errors.get('affected_users', 0),
+            "critical_errors": app_errors.get('critical_errors', 0)
+        }
+        total_versions = app_catalogue.get('total_versions', 0)
+        total_downloads = int(app_catalogue.get('total_downloads') or 0)
+
+        summaries.append({
+            **app_row,
+            "platform_support": raw_json(app_row['platform_support'], []),
+            "user_stats": user_stats,
+            "error_stats": app_error_stats,
+            "version_distribution": distribution[app_id],
+            "total_versions": total_versions,
+            "total_downloads": total_downloads,
+            "latest_version": app_catalogue.get('latest_version'),
+            "critical_errors": critical_errors[app_id],
+            "recent_sessions": recent_sessions[app_id]
+        })
+
+        totals["total_users"] += user_stats["total_users"]
+        totals["active_users_today"] += user_stats["daily_active_users"]
+        totals["total_errors"] += app_error_stats["total_errors"]
+        totals["critical_errors"] += app_error_stats["critical_errors"]
+        totals["total_versions"] += total_versions
+        totals["total_downloads"] += total_downloads
+
+    summary = {
+        "apps": summaries,
+        "totals": totals,
+        "period_days": days,
+        "generated_at": datetime.now().isoformat()
+    }
+    return json_response(summary)
+
 # Download endpoint (updated for multi-app)
 @app.get("/api/v2/download/{app_identifier}/{platform}/{version}")
-async def download_version(app_identifier: str, platform: str, version: str):
+async def download_version(app_identifier: str, platform: str, version: str, request: Request):
     """Download specific version"""
+    # Admit before loading the build into memory; the slot is held until the body is sent
+    ticket = await download_admission.admit(client_ip(request, TRUSTED_PROXY_HOPS))
+    try:
+        return await run_in_threadpool(prepare_download, app_identifier, platform, version, ticket)
+    except BaseException:
+        ticket.release()
+        raise
+
+def prepare_download(app_identifier: str, platform: str, version: str, ticket) -> Response:
     with get_db() as connection:
         app_id = get_app_id(app_identifier, connection)
         if not app_id:
@@ -904,10 +1782,12 @@ async def download_version(app_identifier: str, platform: str, version: str):
             # Check if file_path column exists
             cursor.execute("SHOW COLUMNS FROM app_versions LIKE 'file_path'")
             has_file_path = cursor.fetchone() is not None
+            cached_file = None
             
             if has_file_path:
+                # The BLOB is only fetched on a cache miss
                 cursor.execute(
-                    """SELECT app_file, file_name, file_size, file_path
+                    """SELECT id, file_hash, file_name, file_size, file_path
                        FROM app_versions
                        WHERE app_id = %s AND platform = %s AND version = %s""",
                     (app_id, platform, version)
@@ -917,21 +1797,35 @@ async def download_version(app_identifier: str, platform: str, version: str):
                 if not result:
                     raise HTTPException(status_code=404, detail="Version not found")
                 
-                file_blob, file_name, file_size, file_path = result
+                version_id, file_hash, file_name, file_size, file_path = result
                 
                 # Get file content from appropriate storage
                 if file_path and file_path != 'BLOB_STORAGE' and storage_manager:
-                    # Read from file storage
+                    # Stream from file storage in buffer_size chunks, off the event loop
                     try:
-                        file_content = storage_manager.read_file(file_path)
+                        stored_size = storage_manager.file_size(file_path)
                     except Exception as e:
                         logger.error(f"Failed to read file from storage: {e}")
                         raise HTTPException(status_code=500, detail="Failed to read file from storage")
+                    if file_size is not None and stored_size != file_size:
+                        # Never serve a truncated build
+                        logger.error(f"Stored file {file_path} is {stored_size} bytes, expected {file_size}")
+                        raise HTTPException(status_code=500, detail="Stored file is incomplete")
+                    body = async_storage_manager.iter_file(file_path)
                 else:
-                    # Use BLOB content
-                    file_content = file_blob
-                    if not file_content:
+                    # Use BLOB content, through the local disk cache
+                    def load_blob():
+                        cursor.execute("SELECT app_file FROM app_versions WHERE id = %s", (version_id,))
+                        row = cursor.fetchone()
+                        return row[0] if row else None
+                    
+                    cached = blob_cache.open(version_id, file_hash, load_blob)
+                    if not cached:
                         raise HTTPException(status_code=404, detail="File content not found")
+                    if isinstance(cached, bytes):
+                        body = io.BytesIO(cached)
+                    else:
+                        cached_file = cached
             else:
                 # Old schema without file_path
                 cursor.execute(
@@ -946,23 +1840,33 @@ async def download_version(app_identifier: str, platform: str, version: str):
                     raise HTTPException(status_code=404, detail="Version not found")
                 
                 file_content, file_name, file_size = result
+                body = io.BytesIO(file_content)
             
-            # Update download count
-            cursor.execute(
-                """UPDATE app_versions 
-                   SET download_count = download_count + 1
-                   WHERE app_id = %s AND platform = %s AND version = %s""",
-                (app_id, platform, version)
-            )
-            connection.commit()
-            
-            return StreamingResponse(
-                io.BytesIO(file_content),
+            try:
+                # Update download count
+                cursor.execute(
+                    """UPDATE app_versions 
+                       SET download_count = download_count + 1
+                       WHERE app_id = %s AND platform = %s AND version = %s""",
+                    (app_id, platform, version)
+                )
+                connection.commit()
+            except BaseException:
+                if cached_file:
+                    cached_file.close()
+                raise
+            
+            headers = {"Content-Disposition": f"attachment; filename={file_name}"}
+            if cached_file:
+                # Sent straight from the cached file
+                return AdmittedFileResponse(cached_file, ticket=ticket, media_type="application/octet-stream",
+                                            headers=headers)
+            headers["Content-Length"] = str(file_size)
+            return AdmittedStreamingResponse(
+                body,
+                ticket=ticket,
                 media_type="application/octet-stream",
-                headers={
-                    "Content-Disposition": f"attachment; filename={file_name}",
-                    "Content-Length": str(file_size)
-                }
+                headers=headers
             )
 
 # Update status tracking
@@ -985,6 +1889,15 @@ async def track_update_status(update_data: UpdateStatus):
                  update_data.status, update_data.failure_reason)
             )
             connection.commit()
+        
+        event_broker.publish(update_data.app_identifier, "update_status", {
+            "user_id": user_id,
+            "from_version": update_data.from_version,
+            "to_version": update_data.to_version,
+            "status": update_data.status,
+            "failure_reason": update_data.failure_reason
+        })
+        event_broker.count(update_data.app_identifier, f"updates_{update_data.status}")
             
         return {"message": "Update status tracked"}
 
@@ -995,7 +1908,8 @@ async def track_update_status(update_data: UpdateStatus):
 async def get_recent_errors(
     app_identifier: str,
     limit: int = Query(10, ge=1, le=50),
-    severity: Optional[str] = Query(None)
+    severity: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
     """Get recent errors for specific app"""
     with get_db() as connection:
@@ -1003,7 +1917,7 @@ async def get_recent_errors(
         if not app_id:
             raise HTTPException(status_code=404, detail="App not found")
         
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        with connection.cursor(pymysql.cursors.DictCursor) as db_cursor:
             query = """
                 SELECT 
                     id,
@@ -1026,25 +1940,31 @@ async def get_recent_errors(
                 query += " AND severity = %s"
                 params.append(severity)
             
-            query += " ORDER BY created_at DESC LIMIT %s"
-            params.append(limit)
+            if cursor:
+                condition, condition_params = keyset_condition(
+                    ["created_at", "id"],
+                    decode_cursor(cursor, (datetime.fromisoformat, int))
+                )
+                query += f" AND {condition}"
+                params.extend(condition_params)
             
-            cursor.execute(query, params)
-            errors = cursor.fetchall()
+            query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+            params.append(limit)
             
-            # Parse JSON fields
-            for error in errors:
-                if error.get('metadata'):
-                    try:
-                        error['metadata'] = json.loads(error['metadata'])
-                    except:
-                        error['metadata'] = {}
+            db_cursor.execute(query, params)
+            errors = db_cursor.fetchall()
+            raw_json_fields(errors, {'metadata': None})
             
-            return {"errors": errors}
+            return json_response({
+                "errors": errors,
+                "next_cursor": next_cursor_for(errors, limit, 'created_at', 'id')
+            })
 
 # Get session analytics
 @app.get("/api/v2/analytics/{app_identifier}/sessions")
-async def get_session_analytics(
+@coalesce("analytics_sessions", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("sessions"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_session_analytics(
     app_identifier: str,
     days: int = Query(7, ge=1, le=365)
 ):
@@ -1085,7 +2005,8 @@ async def get_session_analytics(
 @app.get("/api/v2/sessions/recent/{app_identifier}")
 async def get_recent_sessions(
     app_identifier: str,
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
     """Get recent sessions for specific app"""
     with get_db() as connection:
@@ -1093,9 +2014,8 @@ async def get_recent_sessions(
         if not app_id:
             raise HTTPException(status_code=404, detail="App not found")
         
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(
-                """SELECT 
+        with connection.cursor(pymysql.cursors.DictCursor) as db_cursor:
+            query = """SELECT 
                     s.id,
                     s.user_id,
                     u.email,
@@ -1107,26 +2027,34 @@ async def get_recent_sessions(
                     s.device_info
                 FROM user_sessions s
                 JOIN app_users u ON s.user_id = u.id
-                WHERE s.app_id = %s
-                ORDER BY s.start_time DESC
-                LIMIT %s""",
-                (app_id, limit)
-            )
-            sessions = cursor.fetchall()
+                WHERE s.app_id = %s"""
+            params = [app_id]
             
-            # Parse device_info JSON
-            for session in sessions:
-                if session.get('device_info'):
-                    try:
-                        session['device_info'] = json.loads(session['device_info'])
-                    except:
-                        pass
+            if cursor:
+                condition, condition_params = keyset_condition(
+                    ["s.start_time", "s.id"],
+                    decode_cursor(cursor, (datetime.fromisoformat, int))
+                )
+                query += f" AND {condition}"
+                params.extend(condition_params)
             
-            return {"sessions": sessions}
+            query += " ORDER BY s.start_time DESC, s.id DESC LIMIT %s"
+            params.append(limit)
+            
+            db_cursor.execute(query, params)
+            sessions = db_cursor.fetchall()
+            raw_json_fields(sessions, {'device_info': None})
+            
+            return json_response({
+                "sessions": sessions,
+                "next_cursor": next_cursor_for(sessions, limit, 'session_start', 'id')
+            })
 
 # Get daily session statistics
 @app.get("/api/v2/analytics/{app_identifier}/sessions/daily")
-async def get_daily_session_stats(
+@coalesce("analytics_sessions_daily", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("sessions"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_daily_session_stats(
     app_identifier: str,
     days: int = Query(7, ge=1, le=90)
 ):
@@ -1154,62 +2082,188 @@ async def get_daily_session_stats(
             
             return {"daily_stats": daily_stats}
 
-# Get all users across all applications
+# Cohort retention: matrix maintained as sessions start (see cohort_retention.py)
+@app.get("/api/v2/analytics/{app_identifier}/retention")
+@coalesce("analytics_retention", ttl_seconds=ANALYTICS_CACHE_TTL, cache=result_cache,
+          tags=analytics_tags("sessions"), stale_seconds=ANALYTICS_STALE_SECONDS)
+def get_cohort_retention(
+    app_identifier: str,
+    from_date: Optional[date] = Query(None, description="First cohort day (default: 30 days ago)"),
+    to_date: Optional[date] = Query(None, description="Last cohort day (default: today)"),
+    max_day: int = Query(30, ge=1, le=cohort_retention.MAX_DAY_OFFSET)
+):
+    """Active users per install cohort and day since install, with D1/D7/D30 over the range"""
+    to_date = to_date or date.today()
+    from_date = from_date or to_date - timedelta(days=30)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must not be after to_date")
+    with get_db() as connection:
+        app_id = get_app_id(app_identifier, connection)
+        if not app_id:
+            raise HTTPException(status_code=404, detail="App not found")
+        if not has_table(connection, cohort_retention.ACTIVITY_TABLE):
+            raise HTTPException(status_code=409, detail="Run add_cohort_retention.sql to enable retention analytics")
+
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            matrix = cohort_retention.retention_matrix(cursor, app_id, from_date, to_date, max_day)
+
+        return {"app_identifier": app_identifier, "from_date": from_date, "to_date": to_date, **matrix}
+
+# Cold archive analytics (rows already moved out of MySQL by retention)
+def cold_archive_range(app_identifier: str, start: date, end: Optional[date]):
+    if not HAS_PYARROW:
+        raise HTTPException(status_code=503, detail="Cold archive not available (pyarrow not installed)")
+    end = end or date.today() + timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    with get_db() as connection:
+        app_id = get_app_id(app_identifier, connection)
+    if not app_id:
+        raise HTTPException(status_code=404, detail="App not found")
+    return app_id, end
+
+@app.get("/api/v2/archive/{app_identifier}/sessions/daily")
+async def get_archived_daily_session_stats(
+    app_identifier: str,
+    start: date = Query(..., description="First day (inclusive)"),
+    end: Optional[date] = Query(None, description="Last day (exclusive), default tomorrow")
+):
+    """Daily session statistics from the cold archive"""
+    app_id, end = cold_archive_range(app_identifier, start, end)
+    daily_stats = await run_in_threadpool(cold_archive_reader.daily_session_stats, app_id, start, end)
+    return {"daily_stats": daily_stats, "source": "cold_archive"}
+
+@app.get("/api/v2/archive/{app_identifier}/errors")
+async def get_archived_error_summary(
+    app_identifier: str,
+    start: date = Query(..., description="First day (inclusive)"),
+    end: Optional[date] = Query(None, description="Last day (exclusive), default tomorrow"),
+    severity: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
+    """Error summary from the cold archive"""
+    app_id, end = cold_archive_range(app_identifier, start, end)
+    errors = await run_in_threadpool(cold_archive_reader.error_summary, app_id, start, end, severity, limit)
+    return {"app_identifier": app_identifier, "errors": errors, "source": "cold_archive"}
+
+# Users listing
+# COUNT(*) over app_users is a full index scan, so the total is cached and only approximate
+users_total_cache = TTLCache(ttl_seconds=int(os.environ.get('USERS_TOTAL_CACHE_TTL', 300)), max_entries=1)
+
+def get_users_total(cursor) -> int:
+    """Get the (cached) total number of tracked users"""
+    total = users_total_cache.get('total')
+    if total is None:
+        cursor.execute("SELECT COUNT(*) as total FROM app_users")
+        total = cursor.fetchone()['total']
+        users_total_cache.set('total', total)
+    return total
+
+def load_user_apps(cursor, users: List[Dict[str, Any]]):
+    """
+    Attach installations and session counts to a page of users.
+    Runs one IN (...) query for installations and one pre-aggregated
+    session count query, whatever the page size.
+    """
+    for user in users:
+        user['apps'] = []
+        user['app_count'] = 0
+        user['total_sessions'] = 0
+    if not users:
+        return
+
+    users_by_id = {user['id']: user for user in users}
+    user_ids = list(users_by_id)
+    in_clause = ', '.join(['%s'] * len(user_ids))
+
+    cursor.execute(
+        f"""SELECT
+            user_id,
+            app_id,
+            COUNT(*) as session_count
+        FROM user_sessions
+        WHERE user_id IN ({in_clause})
+        GROUP BY user_id, app_id""",
+        user_ids
+    )
+    session_counts = {}
+    for row in cursor.fetchall():
+        session_counts[(row['user_id'], row['app_id'])] = row['session_count']
+        users_by_id[row['user_id']]['total_sessions'] += row['session_count']
+
+    cursor.execute(
+        f"""SELECT
+            uai.user_id,
+            uai.app_id,
+            a.app_name,
+            a.app_identifier,
+            uai.platform,
+            uai.current_version,
+            uai.last_update_date
+        FROM user_app_installations uai
+        JOIN apps a ON uai.app_id = a.id
+        WHERE uai.user_id IN ({in_clause})
+        ORDER BY uai.last_update_date DESC""",
+        user_ids
+    )
+    for row in cursor.fetchall():
+        user = users_by_id[row.pop('user_id')]
+        app_id = row.pop('app_id')
+        row['session_count'] = session_counts.get((user['id'], app_id), 0)
+        user['apps'].append(row)
+        user['app_count'] += 1
+
 @app.get("/api/v2/users")
-async def get_all_users(
+@coalesce("users")
+def get_users(
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """Get all users across all applications with their app usage details"""
+    """
+    Get users ordered by last activity with their app installations.
+    Pass the returned next_cursor to fetch the following page with a keyset
+    seek on last_seen_at; offset is kept for page-number based clients.
+    """
     with get_db() as connection:
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            # Get users with their basic info and session counts
-            cursor.execute(
-                """SELECT 
+        with connection.cursor(pymysql.cursors.DictCursor) as db_cursor:
+            query = """
+                SELECT
                     u.id,
                     u.user_uuid,
                     u.email,
                     u.first_seen_at,
-                    u.last_seen_at,
-                    COUNT(DISTINCT us.id) as total_sessions,
-                    COUNT(DISTINCT uai.app_id) as app_count
+                    u.last_seen_at
                 FROM app_users u
-                LEFT JOIN user_app_installations uai ON u.id = uai.user_id
-                LEFT JOIN user_sessions us ON u.id = us.user_id
-                GROUP BY u.id
-                ORDER BY u.last_seen_at DESC
-                LIMIT %s OFFSET %s""",
-                (limit, offset)
-            )
-            users = cursor.fetchall()
-            
-            # For each user, get their app details
-            for user in users:
-                cursor.execute(
-                    """SELECT 
-                        a.app_name,
-                        a.app_identifier,
-                        uai.platform,
-                        uai.current_version,
-                        uai.last_update_date
-                    FROM user_app_installations uai
-                    JOIN apps a ON uai.app_id = a.id
-                    WHERE uai.user_id = %s
-                    ORDER BY uai.last_update_date DESC""",
-                    (user['id'],)
+            """
+            params = []
+            # Users never seen have a NULL last_seen_at: sorted last, and a cursor can still move past them
+            last_seen = null_last("u.last_seen_at")
+            if cursor:
+                condition, condition_params = keyset_condition(
+                    [last_seen, "u.id"],
+                    decode_cursor(cursor, (datetime.fromisoformat, int))
                 )
-                user['apps'] = cursor.fetchall()
-            
-            # Get total count for pagination
-            cursor.execute("SELECT COUNT(*) as total FROM app_users")
-            total_count = cursor.fetchone()['total']
-            
-            return {
-                "users": users,
-                "total": total_count,
-                "limit": limit,
-                "offset": offset
-            }
+                query += f" WHERE {condition}"
+                params.extend(condition_params)
+            query += f" ORDER BY {last_seen} DESC, u.id DESC LIMIT %s"
+            params.append(limit)
+            if not cursor and offset:
+                query += " OFFSET %s"
+                params.append(offset)
+
+            db_cursor.execute(query, params)
+            users = db_cursor.fetchall()
+            load_user_apps(db_cursor, users)
+            total_count = get_users_total(db_cursor)
+
+    return {
+        "users": users,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor_for(users, limit, 'last_seen_at', 'id')
+    }
 
 # Get user details by ID
 @app.get("/api/v2/users/{user_id}")
@@ -1239,12 +2293,7 @@ async def get_user_details(user_id: int):
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
             
-            # Parse device_info if it exists
-            if user.get('device_info'):
-                try:
-                    user['device_info'] = json.loads(user['device_info'])
-                except:
-                    pass
+            user['device_info'] = raw_json(user['device_info'])
             
             # Get user's app installations
             cursor.execute(
@@ -1294,75 +2343,15 @@ async def get_user_details(user_id: int):
             )
             user['error_count'] = cursor.fetchone()['error_count']
             
-            return user
-
-# Get all users with their app usage
-@app.get("/api/v2/users")
-async def get_users(
-    limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0)
-):
-    """Get all users with their app installations and session counts"""
-    with get_db() as connection:
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            # Get users with their stats
-            cursor.execute(
-                """SELECT 
-                    u.id,
-                    u.user_uuid,
-                    u.email,
-                    u.first_seen_at,
-                    u.last_seen_at,
-                    COUNT(DISTINCT us.id) as total_sessions,
-                    COUNT(DISTINCT uai.app_id) as app_count
-                FROM app_users u
-                LEFT JOIN user_app_installations uai ON u.id = uai.user_id
-                LEFT JOIN user_sessions us ON u.id = us.user_id
-                GROUP BY u.id, u.user_uuid, u.email, u.first_seen_at, u.last_seen_at
-                ORDER BY u.last_seen_at DESC
-                LIMIT %s OFFSET %s""",
-                (limit, offset)
-            )
-            users = cursor.fetchall()
-            
-            # For each user, get their apps
-            for user in users:
-                cursor.execute(
-                    """SELECT 
-                        a.app_identifier,
-                        a.app_name,
-                        uai.current_version,
-                        uai.platform,
-                        uai.last_update_date,
-                        COUNT(us.id) as session_count
-                    FROM user_app_installations uai
-                    JOIN apps a ON uai.app_id = a.id
-                    LEFT JOIN user_sessions us ON uai.user_id = us.user_id AND uai.app_id = us.app_id
-                    WHERE uai.user_id = %s
-                    GROUP BY a.id, a.app_identifier, a.app_name, uai.current_version, uai.platform, uai.last_update_date
-                    ORDER BY uai.last_update_date DESC
-                    LIMIT 5""",
-                    (user['id'],)
-                )
-                user['apps'] = cursor.fetchall()
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as total FROM app_users")
-            total = cursor.fetchone()['total']
-            
-            return {
-                "users": users,
-                "total": total,
-                "limit": limit,
-                "offset": offset
-            }
+            return json_response(user)
 
 
 # ===== COMPATIBILITY ENDPOINTS FOR FRONTEND =====
 # These endpoints provide backward compatibility for the frontend
 
 @app.get("/api/v2/app-version/latest")
-async def get_latest_version_compat(
+@coalesce("latest_version")
+def get_latest_version_compat(
     platform: str = Query('all'),
     app_identifier: str = Query('nexa-timesheet')
 ):
@@ -1374,7 +2363,11 @@ async def get_latest_version_compat(
             
         with connection.cursor(pymysql.cursors.DictCursor) as cursor:
             cursor.execute(
-                """SELECT v.*, a.app_name, a.app_identifier
+                """SELECT v.id, v.app_id, v.version, v.platform, v.version_code,
+                          v.file_name, v.file_size, v.file_hash, v.changelog,
+                          v.is_active, v.is_mandatory, v.download_count,
+                          v.release_date, v.created_at,
+                          a.app_name, a.app_identifier
                    FROM app_versions v
                    JOIN apps a ON v.app_id = a.id
                    WHERE v.app_id = %s AND (v.platform = %s OR v.platform = 'all')
@@ -1388,14 +2381,8 @@ async def get_latest_version_compat(
             if not version:
                 raise HTTPException(status_code=404, detail="No version found")
                 
-            # Parse changelog
-            if version['changelog']:
-                try:
-                    version['changelog'] = json.loads(version['changelog'])
-                except:
-                    version['changelog'] = []
-                    
-            return version
+            version['changelog'] = raw_json(version['changelog'], [])
+            return json_response(version)
 
 @app.get("/api/v2/app-version/check")
 async def check_version_compat(
@@ -1413,18 +2400,20 @@ async def check_version_compat(
     return await check_version(version_data)
 
 @app.get("/api/v2/app-version/files")
-async def list_files_compat(
-    app_identifier: str = Query('nexa-timesheet')
+@coalesce("version_files")
+def list_files_compat(
+    app_identifier: str = Query('nexa-timesheet'),
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """List all version files (compatibility endpoint)"""
+    """List version files, newest first (compatibility endpoint)"""
     with get_db() as connection:
         app_id = get_app_id(app_identifier, connection)
         if not app_id:
             raise HTTPException(status_code=404, detail="App not found")
             
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(
-                """SELECT 
+        with connection.cursor(pymysql.cursors.DictCursor) as db_cursor:
+            query = """SELECT 
                     v.id,
                     v.version,
                     v.platform,
@@ -1440,24 +2429,38 @@ async def list_files_compat(
                     a.app_name
                 FROM app_versions v
                 JOIN apps a ON v.app_id = a.id
-                WHERE v.app_id = %s
-                ORDER BY v.created_at DESC""",
-                (app_id,)
-            )
-            files = cursor.fetchall()
+                WHERE v.app_id = %s"""
+            params = [app_id]
             
-            # Parse changelog
-            for file in files:
-                if file['changelog']:
-                    try:
-                        file['changelog'] = json.loads(file['changelog'])
-                    except:
-                        file['changelog'] = []
+            if cursor:
+                condition, condition_params = keyset_condition(
+                    ["v.created_at", "v.id"],
+                    decode_cursor(cursor, (datetime.fromisoformat, int))
+                )
+                query += f" AND {condition}"
+                params.extend(condition_params)
+            
+            query += " ORDER BY v.created_at DESC, v.id DESC LIMIT %s"
+            params.append(limit)
+            
+            db_cursor.execute(query, params)
+            files = db_cursor.fetchall()
+            raw_json_fields(files, {'changelog': []})
+            
+            # All the app's files, not just this page
+            db_cursor.execute("SELECT COUNT(*) as total FROM app_versions WHERE app_id = %s", (app_id,))
+            total = db_cursor.fetchone()['total']
                         
-            return {"files": files, "total": len(files)}
+            return json_response({
+                "files": files,
+                "total": total,
+                "next_cursor": next_cursor_for(files, limit, 'created_at', 'id')
+            })
 
 @app.get("/api/v2/app-version/storage-info")
-async def get_storage_info_compat(
+# Only uploads and deletions change it, and they invalidate the tag
+@coalesce("storage_info", ttl_seconds=3600, cache=result_cache, tags=analytics_tags("versions"))
+def get_storage_info_compat(
     app_identifier: str = Query('nexa-timesheet')
 ):
     """Get storage information (compatibility endpoint)"""
@@ -1524,6 +2527,8 @@ async def delete_file_compat(
                 raise HTTPException(status_code=404, detail="Version not found")
                 
             connection.commit()
+            latest_versions_cache.invalidate()
+            invalidate_analytics(app_id, "versions")
             
             return {
                 "success": True,
@@ -1533,6 +2538,7 @@ async def delete_file_compat(
 # Chunked Upload Endpoints for Large Files
 # Temporary storage for upload sessions (in production, use Redis or database)
 upload_sessions = {}
+register_queue_depth("chunked_upload_sessions", lambda: len(upload_sessions))
 
 @app.post("/api/v2/version/upload-chunked/start")
 async def start_chunked_upload(
@@ -1543,7 +2549,8 @@ async def start_chunked_upload(
     file_size: int = Form(...),
     file_name: str = Form(...),
     is_mandatory: bool = Form(False),
-    changelog: Optional[str] = Form(None)
+    changelog: Optional[str] = Form(None),
+    rollout_percentage: int = Form(100, ge=0, le=100)
 ):
     """Start a chunked upload session"""
     with get_db() as connection:
@@ -1565,6 +2572,7 @@ async def start_chunked_upload(
         "file_size": file_size,
         "is_mandatory": is_mandatory,
         "changelog": changelog,
+        "rollout_percentage": rollout_percentage,
         "chunks": {},
         "created_at": datetime.now(),
         "chunk_size": chunk_size
@@ -1625,23 +2633,18 @@ async def complete_chunked_upload(upload_id: str):
             detail=f"Missing chunks: {missing_chunks}"
         )
     
-    # Combine chunks
-    logger.info(f"Combining {total_chunks} chunks for upload {upload_id}")
-    file_content = b""
-    for i in range(total_chunks):
-        file_content += chunks[i]
-        logger.info(f"Added chunk {i}, total size now: {len(file_content)} bytes")
+    # The chunks are written or hashed in order, never joined into a second copy of the build
+    ordered_chunks = [chunks[i] for i in range(total_chunks)]
+    received_size = sum(len(chunk) for chunk in ordered_chunks)
+    logger.info(f"Received {total_chunks} chunks for upload {upload_id}, total size {received_size} bytes")
     
     # Verify file size
-    if len(file_content) != session["file_size"]:
+    if received_size != session["file_size"]:
         raise HTTPException(
             status_code=400,
-            detail=f"File size mismatch. Expected {session['file_size']}, got {len(file_content)}"
+            detail=f"File size mismatch. Expected {session['file_size']}, got {received_size}"
         )
     
-    # Calculate hash
-    file_hash = hashlib.sha256(file_content).hexdigest()
-    
     # Parse changelog
     changelog_list = []
     if session["changelog"]:
@@ -1651,12 +2654,12 @@ async def complete_chunked_upload(upload_id: str):
             changelog_list = [session["changelog"]]
     
     # Check file size and decide storage method
-    file_size_mb = len(file_content) / (1024 * 1024)
+    file_size_mb = received_size / (1024 * 1024)
     logger.info(f"Final file size: {file_size_mb:.2f}MB")
     
     # Use file storage for large files
     USE_FILE_STORAGE_THRESHOLD = 50 * 1024 * 1024  # 50MB
-    use_file_storage = len(file_content) > USE_FILE_STORAGE_THRESHOLD or os.getenv('USE_FILE_STORAGE', 'false').lower() == 'true'
+    use_file_storage = received_size > USE_FILE_STORAGE_THRESHOLD or os.getenv('USE_FILE_STORAGE', 'false').lower() == 'true'
     
     file_path = None
     file_blob = None
@@ -1671,14 +2674,15 @@ async def complete_chunked_upload(upload_id: str):
                 storage_manager.base_path = Path('./storage')
                 storage_manager.ensure_directories()
             
-            metadata = storage_manager.save_file(
+            metadata = await async_storage_manager.save_chunks(
                 app_id=session["app_id"],
                 version=session["version"],
                 platform=session["platform"],
                 filename=session["file_name"],
-                file_content=file_content
+                chunks=ordered_chunks
             )
             file_path = metadata['relative_path']
+            file_hash = metadata['hash']
             logger.info(f"File saved to: {file_path}")
         except Exception as e:
             logger.error(f"Failed to save file to storage: {e}")
@@ -1693,7 +2697,8 @@ async def complete_chunked_upload(upload_id: str):
                 status_code=413,
                 detail=f"File too large ({file_size_mb:.2f}MB). Maximum size is 50MB for database storage."
             )
-        file_blob = file_content
+        file_blob = b"".join(ordered_chunks)
+        file_hash = hashlib.sha256(file_blob).hexdigest()
     
     # Save to database with timeout handling
     with get_db() as connection:
@@ -1731,7 +2736,11 @@ async def complete_chunked_upload(upload_id: str):
                          session["is_mandatory"])
                     )
                 version_id = cursor.lastrowid
+                set_version_key(connection, version_id, session["version"])
+                set_rollout_percentage(connection, version_id, session["rollout_percentage"])
                 connection.commit()
+                latest_versions_cache.invalidate()
+                invalidate_analytics(session["app_id"], "versions")
                 logger.info(f"Successfully inserted version with ID {version_id}")
                 
                 # Clean up session
@@ -1739,6 +2748,10 @@ async def complete_chunked_upload(upload_id: str):
                 
                 logger.info(f"Successfully uploaded version {session['version']} for {session['app_identifier']} via chunked upload")
                 
+                announce_upload(session["app_identifier"], version_id, session["platform"], session["version"],
+                                session["version_code"], session["is_mandatory"], session["file_size"],
+                                session["rollout_percentage"])
+                
                 return {
                     "success": True,
                     "message": "Version uploaded successfully",
@@ -1835,6 +2848,414 @@ except ImportError:
     async def require_superadmin():
         raise HTTPException(status_code=501, detail="Authentication not implemented")
 
+@app.get("/api/v2/admin/slow-queries", dependencies=[Depends(require_superadmin)])
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    min_ms: float = Query(0, ge=0),
+    endpoint: Optional[str] = None
+):
+    """Recent slow statements with redacted parameters and sampled EXPLAIN plans (superadmin only)"""
+    return json_response({
+        "threshold_ms": slow_query_log.threshold_ms,
+        "total_captured": slow_query_log.total_slow,
+        "queries": slow_query_log.entries(limit=limit, min_ms=min_ms, endpoint=endpoint)
+    })
+
+@app.delete("/api/v2/admin/slow-queries", dependencies=[Depends(require_superadmin)])
+async def clear_slow_queries():
+    """Empty the slow-query ring buffer (superadmin only)"""
+    slow_query_log.clear()
+    return {"success": True}
+
+# Cold archive: Parquet files on the storage volume, written before retention removes rows
+COLD_ARCHIVE_PATH = os.environ.get(
+    'COLD_ARCHIVE_PATH',
+    os.path.join(os.environ.get('STORAGE_PATH', './storage'), 'cold_archive')
+)
+COLD_ARCHIVE_ENABLED = HAS_PYARROW and os.environ.get('COLD_ARCHIVE_ENABLED', 'true').lower() == 'true'
+cold_archiver = ColdArchiver(COLD_ARCHIVE_PATH, batch_size=int(os.environ.get('COLD_ARCHIVE_BATCH_SIZE', 10000)))
+cold_archive_reader = ColdArchiveReader(COLD_ARCHIVE_PATH)
+
+# Telemetry retention (monthly partitions or archive tables, see retention.py)
+retention_manager = RetentionManager(
+    get_db,
+    archive_keep_months=int(os.environ.get('ARCHIVE_KEEP_MONTHS', 0)),
+    batch_size=int(os.environ.get('RETENTION_BATCH_SIZE', 5000)),
+    exporter=cold_archiver.export if COLD_ARCHIVE_ENABLED else None
+)
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'false').lower() == 'true'
+RETENTION_INTERVAL_HOURS = float(os.environ.get('RETENTION_INTERVAL_HOURS', 24))
+
+@app.get("/api/v2/admin/retention", dependencies=[Depends(require_superadmin)])
+async def get_retention_policies():
+    """Default and per-app retention in days (superadmin only)"""
+    with get_db() as connection:
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            overrides = retention_manager.policies(cursor)
+            cursor.execute("SELECT id, app_identifier FROM apps")
+            identifiers = {row['id']: row['app_identifier'] for row in cursor.fetchall()}
+    return {
+        "enabled": RETENTION_ENABLED,
+        "interval_hours": RETENTION_INTERVAL_HOURS,
+        "archive_keep_months": retention_manager.archive_keep_months,
+        "defaults": retention_manager.default_days,
+        "apps": {
+            table: {identifiers.get(app_id, str(app_id)): days for app_id, days in per_app.items()}
+            for table, per_app in overrides.items()
+        }
+    }
+
+@app.put("/api/v2/admin/retention/{app_identifier}", dependencies=[Depends(require_superadmin)])
+async def set_retention_policy(app_identifier: str, policy: RetentionPolicy):
+    """Override retention for one app (superadmin only)"""
+    with get_db() as connection:
+        app_id = get_app_id(app_identifier, connection)
+        if not app_id:
+            raise HTTPException(status_code=404, detail="App not found")
+        
+        with connection.cursor() as cursor:
+            for table, days in policy.model_dump().items():
+                if days is None:
+                    cursor.execute(
+                        "DELETE FROM app_retention_policies WHERE app_id = %s AND table_name = %s",
+                        (app_id, table)
+                    )
+                else:
+                    cursor.execute(
+                        """INSERT INTO app_retention_policies (app_id, table_name, retention_days)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE retention_days = VALUES(retention_days)""",
+                        (app_id, table, days)
+                    )
+            connection.commit()
+    
+    return {"success": True, "app_identifier": app_identifier, "retention_days": policy.model_dump()}
+
+@app.post("/api/v2/admin/retention/run", dependencies=[Depends(require_superadmin)])
+async def run_retention(dry_run: bool = Query(True)):
+    """Apply retention now, or preview it with dry_run (superadmin only)"""
+    return await run_in_threadpool(retention_manager.run, dry_run)
+
+async def retention_loop():
+    while True:
+        try:
+            summary = await run_in_threadpool(retention_manager.run)
+            logger.info(f"Retention run completed: {json.dumps(summary['tables'], default=str)}")
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+@app.on_event("startup")
+async def start_retention_job():
+    """Schedule the retention job (opt-in: RETENTION_ENABLED=true)"""
+    if RETENTION_ENABLED:
+        app.state.retention_task = asyncio.create_task(retention_loop())
+
+# Storage index: listings and stats read it; the scanner re-hashes only files changed on disk
+STORAGE_INDEX_INTERVAL_MINUTES = float(os.environ.get('STORAGE_INDEX_INTERVAL_MINUTES', 60))
+STORAGE_SCRUB_INTERVAL_HOURS = float(os.environ.get('STORAGE_SCRUB_INTERVAL_HOURS', 24))
+
+@app.get("/api/v2/admin/storage", dependencies=[Depends(require_superadmin)])
+async def get_storage_index(prefix: str = Query("versions/"), limit: int = Query(500, ge=1, le=5000)):
+    """Stored files and usage totals from the storage index (superadmin only)"""
+    if not storage_manager:
+        raise HTTPException(status_code=404, detail="File storage not configured")
+    stats = await async_storage_manager.get_storage_stats()
+    files = await async_storage_manager.list_files(prefix)
+    return {"stats": stats, "files": files[:limit], "total_listed": len(files)}
+
+@app.post("/api/v2/admin/storage/reconcile", dependencies=[Depends(require_superadmin)])
+async def reconcile_storage_index():
+    """Rescan the storage volume now (superadmin only)"""
+    if not storage_manager:
+        raise HTTPException(status_code=404, detail="File storage not configured")
+    return await async_storage_manager.reconcile_index()
+
+@app.get("/api/v2/admin/storage/blob-cache", dependencies=[Depends(require_superadmin)])
+async def get_blob_cache_stats():
+    """Local disk cache of BLOB-stored builds (superadmin only)"""
+    return blob_cache.stats()
+
+@app.get("/api/v2/admin/storage/scrub", dependencies=[Depends(require_superadmin)])
+async def get_storage_scrub_report():
+    """Last integrity scrub report (superadmin only)"""
+    if not storage_scrubber:
+        raise HTTPException(status_code=404, detail="File storage not configured")
+    return {"running": storage_scrubber.running, "report": storage_scrubber.last_report}
+
+@app.post("/api/v2/admin/storage/scrub", status_code=202, dependencies=[Depends(require_superadmin)])
+async def start_storage_scrub(quarantine: bool = Query(True)):
+    """Start an integrity scrub in the background (superadmin only)"""
+    if not storage_scrubber:
+        raise HTTPException(status_code=404, detail="File storage not configured")
+    if storage_scrubber.running:
+        raise HTTPException(status_code=409, detail="A scrub is already running")
+    app.state.storage_scrub_task = asyncio.create_task(run_storage_scrub(quarantine))
+    return {"started": True, "quarantine": quarantine}
+
+async def run_storage_scrub(quarantine: bool = True):
+    try:
+        await run_in_threadpool(storage_scrubber.run, quarantine)
+    except Exception as e:
+        logger.error(f"Storage scrub failed: {e}")
+
+async def storage_scrub_loop():
+    while True:
+        await asyncio.sleep(STORAGE_SCRUB_INTERVAL_HOURS * 3600)
+        await run_storage_scrub()
+
+@app.on_event("startup")
+async def start_storage_scrubber():
+    """Scrub the build volume periodically (STORAGE_SCRUB_INTERVAL_HOURS=0 disables)"""
+    if storage_scrubber and STORAGE_SCRUB_INTERVAL_HOURS > 0:
+        app.state.storage_scrub_loop_task = asyncio.create_task(storage_scrub_loop())
+
+async def storage_index_loop():
+    while True:
+        try:
+            await async_storage_manager.reconcile_index()
+        except Exception as e:
+            logger.error(f"Storage index scan failed: {e}")
+        await asyncio.sleep(STORAGE_INDEX_INTERVAL_MINUTES * 60)
+
+@app.on_event("startup")
+async def start_storage_index_scanner():
+    """Reconcile the storage index periodically (STORAGE_INDEX_INTERVAL_MINUTES=0 disables)"""
+    if storage_manager and STORAGE_INDEX_INTERVAL_MINUTES > 0:
+        app.state.storage_index_task = asyncio.create_task(storage_index_loop())
+
+# Installed-version counters: corrected against user_app_installations periodically
+INSTALL_COUNTS_RECONCILE_HOURS = float(os.environ.get('INSTALL_COUNTS_RECONCILE_HOURS', 6))
+
+def reconcile_install_counts() -> dict:
+    with get_db() as connection:
+        if not has_table(connection, install_counts.TABLE):
+            raise HTTPException(status_code=409, detail="Run add_version_install_counts.sql to enable install counters")
+        report = install_counts.reconcile(connection)
+    for app_id in report["corrected_apps"]:
+        invalidate_analytics(app_id, "installs")
+    return report
+
+@app.post("/api/v2/admin/install-counts/reconcile", dependencies=[Depends(require_superadmin)])
+async def run_install_counts_reconcile():
+    """Recompute the installed-version counters now (superadmin only)"""
+    return await run_in_threadpool(reconcile_install_counts)
+
+async def install_counts_loop():
+    while True:
+        await asyncio.sleep(INSTALL_COUNTS_RECONCILE_HOURS * 3600)
+        try:
+            await run_in_threadpool(reconcile_install_counts)
+        except HTTPException:
+            pass
+        except Exception as e:
+            logger.error(f"Install counter reconciliation failed: {e}")
+
+@app.on_event("startup")
+async def start_install_counts_reconciler():
+    """Correct install counter drift periodically (INSTALL_COUNTS_RECONCILE_HOURS=0 disables)"""
+    if INSTALL_COUNTS_RECONCILE_HOURS > 0:
+        app.state.install_counts_task = asyncio.create_task(install_counts_loop())
+
+# Update funnel: update_history folded into update_funnel every UPDATE_FUNNEL_INTERVAL_SECONDS
+UPDATE_FUNNEL_INTERVAL_SECONDS = float(os.environ.get('UPDATE_FUNNEL_INTERVAL_SECONDS', 60))
+
+def aggregate_update_funnel() -> dict:
+    with get_db() as connection:
+        if not has_table(connection, update_funnel.TABLE):
+            return {"aggregated": 0, "apps": []}
+        report = update_funnel.aggregate(connection)
+    for app_id in report["apps"]:
+        age_analytics(app_id, "updates")
+    return report
+
+async def update_funnel_loop():
+    while True:
+        await asyncio.sleep(UPDATE_FUNNEL_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(aggregate_update_funnel)
+        except Exception as e:
+            logger.error(f"Update funnel aggregation failed: {e}")
+
+@app.on_event("startup")
+async def start_update_funnel_aggregator():
+    """Fold new update_history rows periodically (UPDATE_FUNNEL_INTERVAL_SECONDS=0 disables)"""
+    if UPDATE_FUNNEL_INTERVAL_SECONDS > 0:
+        app.state.update_funnel_task = asyncio.create_task(update_funnel_loop())
+
+@app.post("/api/v2/admin/cohort-retention/backfill", dependencies=[Depends(require_superadmin)])
+async def backfill_cohort_retention(app_identifier: Optional[str] = None):
+    """Rebuild the cohort retention matrix from user_sessions, for one app or all (superadmin only)"""
+    def run():
+        with get_db() as connection:
+            if not has_table(connection, cohort_retention.MEMBERS_TABLE):
+                raise HTTPException(status_code=409, detail="Run add_cohort_retention.sql to enable retention analytics")
+            app_ids = None
+            if app_identifier:
+                app_id = get_app_id(app_identifier, connection)
+                if not app_id:
+                    raise HTTPException(status_code=404, detail="App not found")
+                app_ids = [app_id]
+            reports = cohort_retention.backfill(connection, app_ids)
+        for report in reports:
+            invalidate_analytics(report["app_id"], "sessions")
+        return {"apps": reports}
+
+    return await run_in_threadpool(run)
+
+# Session closes: /end writes its close at once; timed-out sessions are written in one UPDATE every SESSION_FLUSH_SECONDS
+SESSION_FLUSH_SECONDS = float(os.environ.get('SESSION_FLUSH_SECONDS', 5))
+SESSION_SWEEP_HOURS = float(os.environ.get('SESSION_SWEEP_HOURS', 24))
+
+def write_session_closes(closes) -> list:
+    """Write closes and announce them; returns the rows of the sessions that exist"""
+    with get_db() as connection:
+        closed = close_sessions(connection, closes)
+    for app_id in {row[2] for row in closed}:
+        age_analytics(app_id, "sessions")
+    for session_id, app_identifier, _, end_time, duration_seconds in closed:
+        event_broker.publish(app_identifier, "session_ended", {
+            "id": session_id,
+            "session_end": end_time,
+            "duration_seconds": duration_seconds
+        })
+        event_broker.count(app_identifier, "sessions_ended")
+    return closed
+
+def flush_session_closes() -> int:
+    closes = session_tracker.collect()
+    if not closes:
+        return 0
+    try:
+        return len(write_session_closes(closes))
+    except Exception:
+        session_tracker.requeue(closes)
+        raise
+
+def sweep_abandoned_sessions() -> int:
+    with get_db() as connection:
+        return sweep_abandoned(connection, SESSION_SWEEP_HOURS)
+
+async def session_close_loop():
+    last_sweep = 0.0
+    while True:
+        await asyncio.sleep(SESSION_FLUSH_SECONDS)
+        try:
+            await run_in_threadpool(flush_session_closes)
+            if SESSION_SWEEP_HOURS > 0 and time.monotonic() - last_sweep > 3600:
+                last_sweep = time.monotonic()
+                await run_in_threadpool(sweep_abandoned_sessions)
+        except Exception as e:
+            logger.error(f"Session close flush failed: {e}")
+
+@app.on_event("startup")
+async def start_session_closer():
+    app.state.session_close_task = asyncio.create_task(session_close_loop())
+
+@app.on_event("shutdown")
+async def flush_sessions_on_shutdown():
+    """Write the closes still queued; tracked sessions are adopted by the next heartbeat elsewhere"""
+    try:
+        await run_in_threadpool(flush_session_closes)
+    except Exception as e:
+        logger.error(f"Session close flush failed: {e}")
+
+# Live stream for dashboards
+@app.get("/api/v2/stream/{app_identifier}")
+async def stream_app_events(app_identifier: str):
+    """
+    Server-Sent Events feed of new sessions, errors, uploads, update statuses
+    and counter deltas for one app ("all" for every app). Pass the API key as
+    ?api_key= when connecting with EventSource.
+    """
+    if app_identifier != ALL_APPS:
+        with get_db() as connection:
+            if not get_app_id(app_identifier, connection):
+                raise HTTPException(status_code=404, detail="App not found")
+    
+    subscriber = event_broker.subscribe(app_identifier)
+    return StreamingResponse(
+        event_broker.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.on_event("startup")
+async def start_event_broker():
+    event_broker.start()
+
+# Update notification channel for mobile clients
+def fetch_versions_since(last_id: Optional[int]):
+    """High-water mark of app_versions.id and the active builds created after last_id"""
+    with get_db() as connection:
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            if last_id is None:
+                cursor.execute("SELECT MAX(id) AS max_id FROM app_versions")
+                return cursor.fetchone()['max_id'] or 0, []
+            # Builds staged at 0% are announced by nobody
+            if has_column(connection, "app_versions", "rollout_percentage"):
+                rollout_column, rollout_filter = "v.rollout_percentage", " AND v.rollout_percentage > 0"
+            else:
+                rollout_column, rollout_filter = "100", ""
+            cursor.execute(
+                f"""SELECT v.id, a.app_identifier, v.platform, v.version, v.version_code, v.is_mandatory,
+                       {rollout_column} AS rollout_percentage
+                FROM app_versions v
+                JOIN apps a ON v.app_id = a.id
+                WHERE v.id > %s AND v.is_active = TRUE{rollout_filter}
+                ORDER BY v.id""",
+                (last_id,)
+            )
+            versions = cursor.fetchall()
+            return (versions[-1]['id'] if versions else last_id), versions
+
+def validate_platform(platform: str):
+    if platform not in PLATFORMS:
+        raise HTTPException(status_code=400, detail="Invalid platform. Must be 'android', 'ios', or 'web'")
+
+@app.websocket("/api/v2/updates/ws/{app_identifier}/{platform}")
+async def update_channel_websocket(websocket: WebSocket, app_identifier: str, platform: str,
+                                   user_uuid: Optional[str] = None):
+    """
+    Idle WebSocket receiving {"type": "version_available", ...} when a build is
+    activated. Send "ping" at least every heartbeat_timeout seconds (given in
+    the first message) or the connection is closed. Builds in a partial rollout
+    are only announced to devices in it, so pass the user_uuid used for checks.
+    """
+    if platform not in PLATFORMS:
+        await websocket.close(code=1008)
+        return
+    await update_notifier.serve(websocket, app_identifier, platform, user_uuid)
+
+@app.get("/api/v2/updates/wait/{app_identifier}/{platform}")
+async def update_channel_long_poll(
+    app_identifier: str,
+    platform: str,
+    timeout: int = Query(55, ge=1, le=120),
+    user_uuid: Optional[str] = Query(None, description="Device id used for checks (partial rollouts)")
+):
+    """Long-poll fallback: returns the notification, or 204 when nothing was released within timeout"""
+    validate_platform(platform)
+    message = await update_notifier.wait(app_identifier, platform, timeout, user_uuid)
+    if message is None:
+        return Response(status_code=204)
+    return message
+
+@app.on_event("startup")
+async def start_update_notifier():
+    update_notifier.start(
+        fetch_versions_since,
+        watch_interval=float(os.environ.get('UPDATE_CHANNEL_WATCH_INTERVAL', 5))
+    )
+
+@app.on_event("shutdown")
+async def stop_update_notifier():
+    await update_notifier.stop()
+
+@app.on_event("shutdown")
+async def stop_event_broker():
+    await event_broker.stop()
+
 # Clean up old upload sessions periodically
 @app.on_event("startup")
 @app.on_event("shutdown")
@@ -1852,11 +3273,21 @@ async def cleanup_upload_sessions():
 # Run the application
 # Import file storage only if module exists
 try:
-    from file_storage_api import storage_manager
+    from file_storage_api import async_storage_manager, storage_manager
 except ImportError:
     storage_manager = None
+    async_storage_manager = None
     logger.warning("File storage module not available, using BLOB storage only")
 
+# Integrity scrubber for the build volume (see storage_scrubber.py)
+storage_scrubber = StorageScrubber(
+    storage_manager,
+    get_db,
+    workers=int(os.environ.get('STORAGE_SCRUB_WORKERS', 2)),
+    io_budget_mb_s=float(os.environ.get('STORAGE_SCRUB_IO_MB_S', 50)),
+    orphan_grace_hours=float(os.environ.get('STORAGE_SCRUB_ORPHAN_GRACE_HOURS', 6))
+) if storage_manager else None
+
 if __name__ == "__main__":
     import uvicorn
     # Railway sometimes sets PORT to MySQL port (3306), we need to handle this
@@ -0,0 +1,70 @@
+"""
+Opaque cursor helpers for keyset pagination
+A cursor encodes the sort key of the last row returned, so the next page
+starts with an index range seek instead of scanning and discarding OFFSET rows
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+# Stands in for NULL in a nullable datetime sort column: NULL rows sort last on
+# a descending sort and the cursor always carries a comparable value
+NULL_DATETIME = datetime(1000, 1, 1)
+
+
+def null_last(column: str) -> str:
+    """SQL sort expression for a nullable datetime column, for ORDER BY and keyset_condition alike"""
+    return f"COALESCE({column}, CAST('{NULL_DATETIME.isoformat(sep=' ')}' AS DATETIME))"
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row of a page into an opaque string"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, parsers: Sequence[Callable[[Any], Any]]) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor
+    parsers converts each stored value back to its column type
+    (e.g. datetime.fromisoformat, int); a malformed cursor is a 400
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("cursor arity mismatch")
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def keyset_condition(columns: Sequence[str], values: Sequence[Any]):
+    """
+    Build the WHERE fragment selecting rows strictly after a cursor for a
+    descending sort on columns, e.g. for (created_at, id):
+        (created_at < %s OR (created_at = %s AND id < %s))
+    Returns (sql, params). The last column must be unique (usually the PK).
+    """
+    clauses = []
+    params = []
+    for position, column in enumerate(columns):
+        equal_parts = [f"{prefix} = %s" for prefix in columns[:position]]
+        clauses.append("(" + " AND ".join(equal_parts + [f"{column} < %s"]) + ")")
+        params.extend(list(values[:position]) + [values[position]])
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def next_cursor_for(rows: List[dict], limit: int, *keys: str) -> Optional[str]:
+    """
+    Return the cursor for the page after rows, or None on the last page
+    A NULL key is encoded as NULL_DATETIME (the column is sorted with null_last)
+    """
+    if len(rows) < limit or not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(*(NULL_DATETIME if last[key] is None else last[key] for key in keys))
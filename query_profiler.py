@@ -0,0 +1,145 @@
+"""
+Slow-query profiler
+Statements slower than a threshold are logged with redacted parameters and the
+calling endpoint, and kept in a ring buffer. A sample of them is EXPLAINed
+(at most once per statement shape per interval) so full scans and missing
+indexes show up without reproducing the workload.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pymysql.cursors
+
+from metrics import current_endpoint, current_path, fingerprint
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE_PREFIXES = ("select", "with", "(select")
+
+
+def redact_params(args) -> Any:
+    """Keep the shape of bound parameters, never their values"""
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {key: redact_params(value) for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        return [redact_params(value) for value in args]
+    if isinstance(args, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(args)}>"
+    if isinstance(args, str):
+        return f"<str:{len(args)}>"
+    return f"<{type(args).__name__}>"
+
+
+def summarize_plan(plan: List[Dict[str, Any]]) -> List[str]:
+    """Flag the usual suspects in a traditional EXPLAIN output"""
+    warnings = []
+    for row in plan:
+        table = row.get("table")
+        access = (row.get("type") or "").upper()
+        extra = row.get("Extra") or ""
+        if access == "ALL":
+            if row.get("possible_keys"):
+                warnings.append(f"full scan on {table} (possible keys not used: {row['possible_keys']})")
+            else:
+                warnings.append(f"full scan on {table} (no usable index)")
+        elif access == "INDEX":
+            warnings.append(f"full index scan on {table}")
+        if "Using filesort" in extra:
+            warnings.append(f"filesort on {table}")
+        if "Using temporary" in extra:
+            warnings.append(f"temporary table for {table}")
+    return warnings
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements, fed by the timed cursors"""
+
+    def __init__(self, threshold_ms: float = 500, capacity: int = 200,
+                 explain_sample_rate: float = 0.2, explain_interval: float = 300):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self._entries = deque(maxlen=capacity)
+        self._last_explained: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.total_slow = 0
+
+    def observe(self, cursor, query, args, elapsed: float):
+        duration_ms = elapsed * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        statement = fingerprint(query)
+        entry = {
+            "captured_at": datetime.utcnow().isoformat() + "Z",
+            "duration_ms": round(duration_ms, 2),
+            "rows": max(cursor.rowcount, 0),
+            "query": statement,
+            "params": redact_params(args),
+            "endpoint": current_endpoint(),
+            "path": current_path(),
+            "plan": None,
+            "plan_warnings": [],
+        }
+        if self._should_explain(cursor, query, statement):
+            plan = self._explain(cursor, query, args)
+            if plan is not None:
+                entry["plan"] = plan
+                entry["plan_warnings"] = summarize_plan(plan)
+
+        with self._lock:
+            self._entries.append(entry)
+            self.total_slow += 1
+        logger.warning(
+            f"Slow query {entry['duration_ms']}ms [{entry['endpoint'] or 'background'}]: {statement}"
+            + (f" -- {'; '.join(entry['plan_warnings'])}" if entry["plan_warnings"] else "")
+        )
+
+    def _should_explain(self, cursor, query, statement: str) -> bool:
+        # Unbuffered cursors still hold the result stream; the connection is busy
+        if isinstance(cursor, pymysql.cursors.SSCursor):
+            return False
+        if not query.lstrip().lower().startswith(EXPLAINABLE_PREFIXES):
+            return False
+        if random.random() >= self.explain_sample_rate:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_explained.get(statement)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            self._last_explained[statement] = now
+        return True
+
+    def _explain(self, cursor, query, args) -> Optional[List[Dict[str, Any]]]:
+        try:
+            sql = cursor.mogrify(query, args)
+            # Plain DictCursor: bypasses the timed cursor so EXPLAIN is not profiled itself
+            with pymysql.cursors.DictCursor(cursor.connection) as explain_cursor:
+                explain_cursor.execute(f"EXPLAIN {sql}")
+                return [dict(row) for row in explain_cursor.fetchall()]
+        except Exception as e:
+            logger.info(f"EXPLAIN failed for slow query: {e}")
+            return None
+
+    def entries(self, limit: int = 50, min_ms: float = 0, endpoint: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if min_ms:
+            entries = [e for e in entries if e["duration_ms"] >= min_ms]
+        if endpoint:
+            entries = [e for e in entries if e["endpoint"] and endpoint in e["endpoint"]]
+        return entries[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_explained.clear()
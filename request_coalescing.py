@@ -0,0 +1,160 @@
+"""
+Single-flight coalescing for identical read requests
+On release day and on dashboard refreshes the same request (same endpoint,
+same parameters) arrives many times at once, and each copy used to run the
+same queries. Wrapped endpoints now run one computation per key: concurrent
+identical calls await the one in flight and get its result (or its error).
+A per-endpoint TTL can also keep the result for a few seconds afterwards,
+either in the flight's own TTLCache or, for tagged endpoints, in a shared
+ResultCache (see response_cache.py) that serves stale results while one
+call recomputes them.
+
+Handlers written as plain functions are run in the threadpool, so their
+blocking queries do not hold up the event loop while others wait.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from fast_json import json_response
+from metrics import REGISTRY, Counter
+from response_cache import ResultCache, TTLCache
+
+logger = logging.getLogger(__name__)
+
+coalesced_requests_total = REGISTRY.register(Counter(
+    "coalesced_requests_total", "Coalesced endpoint calls by outcome", ("endpoint", "result")))
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable, order-insensitive form of a request parameter"""
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((_freeze(item) for item in value), key=repr))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class SingleFlight:
+    def __init__(self, name: str, ttl_seconds: float = 0, max_entries: int = 256):
+        """ttl_seconds: how long a result is reused after the call ends (0: only while in flight)"""
+        self.name = name
+        self.cache = TTLCache(ttl_seconds, max_entries) if ttl_seconds > 0 else None
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                coalesced_requests_total.inc(endpoint=self.name, result="hit")
+                return cached
+
+        coalesced_requests_total.inc(endpoint=self.name,
+                                     result="coalesced" if key in self._inflight else "miss")
+        return await asyncio.shield(self.start(key, compute))
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """The task computing key, started if none is running"""
+        task = self._inflight.get(key)
+        if task is None:
+            # A task of its own: one caller going away must not cancel it for the others
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+        return task
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.cache is not None and task.result() is not None:
+            self.cache.set(key, task.result())
+
+    def invalidate(self):
+        """Forget cached results (calls in flight still complete)"""
+        if self.cache is not None:
+            self.cache.invalidate()
+
+
+def _as_response(result: Any) -> Response:
+    return result if isinstance(result, Response) else json_response(result)
+
+
+def coalesce(name: str, ttl_seconds: float = 0, cache: Optional[ResultCache] = None,
+             tags: Optional[Callable[..., Iterable[str]]] = None, stale_seconds: float = 0) -> Callable:
+    """
+    Decorator for endpoints: identical calls (same keyword arguments) share one computation
+    With cache, 200 responses are kept there for ttl_seconds under tags(**kwargs),
+    then served stale for up to stale_seconds while a refresh runs. tags may
+    block (it runs in the threadpool) and returns None when the call cannot
+    be cached. The flight is exposed as handler.flight.
+    """
+    def decorator(handler: Callable) -> Callable:
+        flight = SingleFlight(name, 0 if cache else ttl_seconds)
+        is_coroutine = inspect.iscoroutinefunction(handler)
+
+        def compute(args, kwargs) -> Awaitable[Any]:
+            if is_coroutine:
+                return handler(*args, **kwargs)
+            return run_in_threadpool(handler, *args, **kwargs)
+
+        async def refresh(cache_key: str, entry_tags: list, args, kwargs) -> Response:
+            blocking = cache.backend.blocking
+            # Versions read before computing: a change made meanwhile leaves the entry outdated
+            versions = (await run_in_threadpool(cache.tag_versions, entry_tags) if blocking
+                        else cache.tag_versions(entry_tags))
+            response = _as_response(await compute(args, kwargs))
+            if response.status_code == 200 and not isinstance(response, StreamingResponse):
+                store_args = (cache_key, entry_tags, versions, response.status_code,
+                              response.media_type, response.body, ttl_seconds, stale_seconds)
+                if blocking:
+                    await run_in_threadpool(cache.store, *store_args)
+                else:
+                    cache.store(*store_args)
+            return response
+
+        def lookup(cache_key: str, kwargs):
+            entry_tags = tags(**kwargs) if tags else []
+            if entry_tags is None:
+                return None, None
+            entry_tags = sorted(entry_tags)
+            return entry_tags, cache.get(cache_key, entry_tags)
+
+        def log_failure(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Background refresh of {name} failed: {task.exception()!r}")
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            key = (_freeze(args), _freeze(kwargs))
+            if cache is None:
+                return await flight.do(key, lambda: compute(args, kwargs))
+
+            cache_key = f"{name}:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+            entry_tags, cached = await run_in_threadpool(lookup, cache_key, kwargs)
+            if entry_tags is None:
+                return await flight.do(key, lambda: compute(args, kwargs))
+            if cached is not None:
+                if cached.stale and not flight.in_flight(key):
+                    flight.start(key, lambda: refresh(cache_key, entry_tags, args, kwargs)).add_done_callback(log_failure)
+                coalesced_requests_total.inc(endpoint=name, result="stale" if cached.stale else "hit")
+                return Response(cached.body, status_code=cached.status_code, media_type=cached.media_type)
+            return await flight.do(key, lambda: refresh(cache_key, entry_tags, args, kwargs))
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,204 @@
+"""
+In-process TTL cache for expensive read endpoints
+Used to avoid recomputing the same aggregates on every dashboard refresh
+
+ResultCache adds tag-based invalidation for rendered endpoint results. Each
+entry records the version of its tags (e.g. "sessions:12": sessions of app
+12) when it was computed:
+
+- invalidate_tags(): entries with the tag are no longer served at all
+  (a new build was uploaded, the listing must show it)
+- age_tags(): entries with the tag become stale, as if their TTL had run out
+  (a few new sessions arrived; the old figures are fine for a little longer)
+
+Stale entries can still be served for stale_seconds while the caller
+recomputes them (stale-while-revalidate). Storage is pluggable: MemoryBackend
+(default, per process) or RedisBackend, shared by all workers
+(RESULT_CACHE_URL=redis://...).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    def __init__(self, ttl_seconds: float = 30, max_entries: int = 256):
+        """
+        Initialize the cache
+        Entries expire after ttl_seconds; the least recently used entry is
+        evicted once max_entries is reached
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Store a value for ttl_seconds (defaults to the cache TTL)"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop a single key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class MemoryBackend:
+    """Per-process store for ResultCache (LRU, bytes values)"""
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024):
+        self._entries = TTLCache(max_entries=max_entries)
+        self._tags: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self._entries.set(key, value, ttl_seconds)
+
+    def tag_versions(self, tags: List[str]) -> List[int]:
+        with self._lock:
+            return [self._tags.get(tag, 0) for tag in tags]
+
+    def bump(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+
+class RedisBackend:
+    """Store shared by all workers; tag versions are Redis counters"""
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = "result_cache:"):
+        if redis is None:
+            raise RuntimeError("redis is not installed (pip install redis)")
+        self._client = redis.Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self._client.set(self.prefix + key, value, px=max(1, int(ttl_seconds * 1000)))
+
+    def tag_versions(self, tags: List[str]) -> List[int]:
+        if not tags:
+            return []
+        values = self._client.mget([self.prefix + "tag:" + tag for tag in tags])
+        return [int(value) if value else 0 for value in values]
+
+    def bump(self, tags: Iterable[str]):
+        pipeline = self._client.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(self.prefix + "tag:" + tag)
+        pipeline.execute()
+
+
+class CachedResult(NamedTuple):
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+    stale: bool
+
+
+class ResultCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _tag_keys(tags: List[str]) -> List[str]:
+        # Two counters per tag: hard (invalidate) and soft (age)
+        return [f"{tag}#{kind}" for tag in tags for kind in ("hard", "soft")]
+
+    def tag_versions(self, tags: List[str]) -> List[int]:
+        """Current versions of tags; pass them to store() for a result computed from now on"""
+        return self.backend.tag_versions(self._tag_keys(tags))
+
+    def get(self, key: str, tags: List[str]) -> Optional[CachedResult]:
+        try:
+            raw = self.backend.get(key)
+            if raw is None:
+                return None
+            header, body = raw.split(b"\n", 1)
+            meta = json.loads(header)
+            if meta["tags"] != tags:
+                return None
+            versions = self.tag_versions(tags)
+        except Exception as e:
+            # A cache outage degrades to recomputing
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+        stored = meta["versions"]
+        if any(current != old for current, old in zip(versions[0::2], stored[0::2])):
+            return None
+        stale = time.time() > meta["fresh_until"] or versions[1::2] != stored[1::2]
+        return CachedResult(meta["status_code"], meta["media_type"], body, stale)
+
+    def store(self, key: str, tags: List[str], versions: List[int], status_code: int,
+              media_type: Optional[str], body: bytes, ttl_seconds: float, stale_seconds: float = 0):
+        meta = {"tags": tags, "versions": versions, "status_code": status_code,
+                "media_type": media_type, "fresh_until": time.time() + ttl_seconds}
+        try:
+            self.backend.set(key, json.dumps(meta).encode() + b"\n" + body, ttl_seconds + stale_seconds)
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def invalidate_tags(self, *tags: str):
+        self._bump(tags, "hard")
+
+    def age_tags(self, *tags: str):
+        self._bump(tags, "soft")
+
+    def _bump(self, tags, kind: str):
+        try:
+            self.backend.bump(f"{tag}#{kind}" for tag in tags)
+        except Exception as e:
+            logger.warning(f"Result cache tag update failed: {e}")
+
+
+def result_cache_from_url(url: Optional[str], max_entries: int = 1024) -> ResultCache:
+    """RedisBackend for a redis:// URL, MemoryBackend otherwise (or if Redis is unavailable)"""
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return ResultCache(RedisBackend(url))
+        except Exception as e:
+            logger.warning(f"Result cache: {e}, using the in-process backend")
+    return ResultCache(MemoryBackend(max_entries))
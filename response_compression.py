@@ -0,0 +1,200 @@
+"""
+Negotiated response compression (Brotli when installed, gzip otherwise)
+Only complete, compressible bodies above a size threshold are compressed.
+Binary downloads are skipped: APK/IPA archives are already compressed.
+Hot, rarely changing payloads keep their compressed bytes cached and reuse
+them while the uncompressed body stays byte-for-byte identical.
+"""
+import gzip
+import hashlib
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+    "image/svg+xml",
+)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: qvalue}"""
+    codings = {}
+    for part in header.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Pick br or gzip according to the client's preferences"""
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = codings.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class PrecompressedCache:
+    """Compressed bodies of hot endpoints, keyed by request and validated by body digest"""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str, str], Tuple[bytes, bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str, str], digest: bytes) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, key: Tuple[str, str, str], digest: bytes, compressed: bytes):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (digest, compressed)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        cached_brotli_quality: int = 11,
+        exclude_paths: Iterable[str] = ("/api/v2/download/",),
+        precompressed_paths: Iterable[str] = (),
+    ):
+        """
+        exclude_paths: path prefixes never compressed (binary downloads)
+        precompressed_paths: exact paths whose compressed bodies are cached
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cached_brotli_quality = cached_brotli_quality
+        self.exclude_paths = tuple(exclude_paths)
+        self.precompressed_paths = frozenset(precompressed_paths)
+        self.cache = PrecompressedCache()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingSender(self, scope, encoding, send)
+        await self.app(scope, receive, responder)
+
+    def compress(self, body: bytes, encoding: str, cached: bool) -> bytes:
+        if encoding == "br":
+            quality = self.cached_brotli_quality if cached else self.brotli_quality
+            return brotli.compress(body, quality=quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+class _CompressingSender:
+    """Wraps send() for a single response and compresses it when worthwhile"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, encoding: str, send):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = {name.lower(): value for name, value in message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            if b"content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        if message.get("more_body", False) or len(body) < self.middleware.minimum_size:
+            # Streaming bodies and tiny payloads go out untouched
+            self.passthrough = True
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        compressed = self._compressed_body(body)
+        headers = []
+        vary = [b"Accept-Encoding"]
+        for name, value in self.start_message.get("headers", []):
+            lowered = name.lower()
+            if lowered == b"vary":
+                vary.insert(0, value)
+            elif lowered != b"content-length":
+                headers.append((name, value))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+        headers.append((b"vary", b", ".join(vary)))
+        self.start_message["headers"] = headers
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    def _compressed_body(self, body: bytes) -> bytes:
+        path = self.scope["path"]
+        if path not in self.middleware.precompressed_paths:
+            return self.middleware.compress(body, self.encoding, cached=False)
+
+        key = (path, self.scope.get("query_string", b"").decode("latin-1"), self.encoding)
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        compressed = self.middleware.cache.get(key, digest)
+        if compressed is None:
+            compressed = self.middleware.compress(body, self.encoding, cached=True)
+            self.middleware.cache.set(key, digest, compressed)
+        return compressed
@@ -0,0 +1,373 @@
+"""
+Retention engine for telemetry tables
+user_sessions, app_error_logs and update_history are either partitioned by
+month (RANGE COLUMNS on their timestamp, partitions named pYYYYMM plus
+p_future) or, when partitioning is not available, rotated into monthly
+archive tables ({table}_archive_YYYYMM).
+
+Each run:
+- keeps PARTITION_MONTHS_AHEAD future partitions ready
+- drops (or exchanges into archive tables) whole months older than the longest
+  retention configured for the table
+- purges apps with a shorter retention in bounded, index-driven batches
+- drops archive tables older than ARCHIVE_KEEP_MONTHS
+
+When an exporter is configured (cold_archive.ColdArchiver.export), rows are
+exported before they leave MySQL.
+
+Usage:
+    python retention.py --dry-run
+    python retention.py --run
+    python retention.py --partition user_sessions   # one-off conversion
+"""
+import argparse
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pymysql
+import pymysql.cursors
+
+logger = logging.getLogger(__name__)
+
+# table -> timestamp column used for partitioning, retention and analytics windows
+TELEMETRY_TABLES = {
+    "user_sessions": "start_time",
+    "app_error_logs": "created_at",
+    "update_history": "updated_at",
+}
+
+DEFAULT_RETENTION_DAYS = {
+    "user_sessions": int(os.environ.get("RETENTION_SESSIONS_DAYS", 395)),
+    "app_error_logs": int(os.environ.get("RETENTION_ERRORS_DAYS", 180)),
+    "update_history": int(os.environ.get("RETENTION_UPDATES_DAYS", 395)),
+}
+
+PARTITION_MONTHS_AHEAD = 3
+FUTURE_PARTITION = "p_future"
+RETENTION_LOCK = "nexa_retention"
+
+
+def month_floor(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    years, month_index = divmod(value.month - 1 + months, 12)
+    return date(value.year + years, month_index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def month_of(name: str) -> Optional[date]:
+    """Month encoded in a pYYYYMM partition or *_archive_YYYYMM table name"""
+    suffix = name.rsplit("_", 1)[-1].lstrip("p")
+    if len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def partition_clause(month: date) -> str:
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1):%Y-%m-%d}')"
+
+
+class RetentionManager:
+    """Applies per-app retention to the telemetry tables"""
+
+    def __init__(self, connect: Callable, default_days: Optional[Dict[str, int]] = None,
+                 archive_keep_months: int = 0, batch_size: int = 5000,
+                 exporter: Optional[Callable] = None):
+        self.connect = connect
+        self.default_days = dict(default_days or DEFAULT_RETENTION_DAYS)
+        self.archive_keep_months = archive_keep_months
+        self.batch_size = batch_size
+        # exporter(cursor, table, column, source, start, end, app_id=None)
+        self.exporter = exporter
+
+    def _export(self, cursor, table, column, source, start, end, app_id=None):
+        if self.exporter:
+            self.exporter(cursor, table, column, source, start, end, app_id=app_id)
+
+    # Introspection
+
+    def partitions(self, cursor, table: str) -> List[str]:
+        cursor.execute(
+            """SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION""",
+            (table,)
+        )
+        return [row["PARTITION_NAME"] for row in cursor.fetchall()]
+
+    def archive_tables(self, cursor, table: str) -> List[str]:
+        cursor.execute(
+            """SELECT TABLE_NAME FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+            ORDER BY TABLE_NAME""",
+            (f"{table}\\_archive\\_%",)
+        )
+        return [row["TABLE_NAME"] for row in cursor.fetchall()]
+
+    def policies(self, cursor) -> Dict[str, Dict[int, int]]:
+        """Per-app overrides: {table: {app_id: retention_days}}"""
+        overrides = {table: {} for table in TELEMETRY_TABLES}
+        try:
+            cursor.execute("SELECT app_id, table_name, retention_days FROM app_retention_policies")
+        except pymysql.err.ProgrammingError:
+            # add_retention_policies.sql not applied: defaults only
+            return overrides
+        for row in cursor.fetchall():
+            if row["table_name"] in overrides:
+                overrides[row["table_name"]][row["app_id"]] = row["retention_days"]
+        return overrides
+
+    # Run
+
+    def run(self, dry_run: bool = False, today: Optional[date] = None) -> Dict[str, Any]:
+        today = today or date.today()
+        summary = {"dry_run": dry_run, "started_at": datetime.now().isoformat(), "tables": {}}
+        with self.connect() as connection:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                # Several workers may schedule the job; only one applies it
+                cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (RETENTION_LOCK,))
+                if not cursor.fetchone()["acquired"]:
+                    summary["skipped"] = "another worker is running retention"
+                    return summary
+                try:
+                    overrides = self.policies(cursor)
+                    for table, column in TELEMETRY_TABLES.items():
+                        summary["tables"][table] = self._apply(
+                            connection, cursor, table, column, overrides[table], today, dry_run
+                        )
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (RETENTION_LOCK,))
+        summary["finished_at"] = datetime.now().isoformat()
+        return summary
+
+    def _apply(self, connection, cursor, table, column, overrides, today, dry_run) -> Dict[str, Any]:
+        default_days = self.default_days[table]
+        horizon_days = max([default_days] + list(overrides.values()))
+        # Whole months entirely older than the longest retention expire for every app
+        cutoff_month = month_floor(today - timedelta(days=horizon_days))
+        partitions = self.partitions(cursor, table)
+        result = {
+            "mode": "partitions" if partitions else "archive_tables",
+            "default_days": default_days,
+            "horizon_days": horizon_days,
+            "expired_before": cutoff_month.isoformat(),
+            "created_partitions": [],
+            "dropped_partitions": [],
+            "expired_months": [],
+            "dropped_archives": [],
+            "purged_rows": {},
+        }
+
+        if partitions:
+            result["created_partitions"] = self._ensure_partitions(cursor, table, partitions, today, dry_run)
+            for name in partitions:
+                month = month_of(name)
+                if month is None or add_months(month, 1) > cutoff_month:
+                    continue
+                if self.archive_keep_months and not dry_run:
+                    self._exchange_into_archive(cursor, table, name, month)
+                elif not dry_run:
+                    self._export(cursor, table, column, table, month, add_months(month, 1))
+                if not dry_run:
+                    cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+                result["dropped_partitions"].append(name)
+        else:
+            result["expired_months"] = self._rotate_into_archives(
+                connection, cursor, table, column, cutoff_month, dry_run
+            )
+
+        # Apps with a shorter retention than the horizon: batched range deletes on (app_id, ts)
+        for app_id, days in overrides.items():
+            if days >= horizon_days:
+                continue
+            cutoff = datetime.combine(today - timedelta(days=days), datetime.min.time())
+            result["purged_rows"][app_id] = self._purge_app(connection, cursor, table, column, app_id, cutoff, dry_run)
+        if default_days < horizon_days:
+            cutoff = datetime.combine(today - timedelta(days=default_days), datetime.min.time())
+            for app_id in self._apps_on_default(cursor, overrides):
+                result["purged_rows"][app_id] = self._purge_app(connection, cursor, table, column, app_id, cutoff, dry_run)
+
+        oldest_archive = add_months(cutoff_month, -self.archive_keep_months)
+        for archive in self.archive_tables(cursor, table):
+            month = month_of(archive)
+            if month is not None and month < oldest_archive:
+                if not dry_run:
+                    self._export(cursor, table, column, archive, month, add_months(month, 1))
+                    cursor.execute(f"DROP TABLE IF EXISTS {archive}")
+                result["dropped_archives"].append(archive)
+
+        connection.commit()
+        return result
+
+    def _apps_on_default(self, cursor, overrides) -> List[int]:
+        cursor.execute("SELECT id FROM apps")
+        return [row["id"] for row in cursor.fetchall() if row["id"] not in overrides]
+
+    def _ensure_partitions(self, cursor, table, partitions, today, dry_run) -> List[str]:
+        if FUTURE_PARTITION not in partitions:
+            return []
+        months = [month for month in map(month_of, partitions) if month is not None]
+        next_month = add_months(max(months), 1) if months else month_floor(today)
+        last_month = add_months(month_floor(today), PARTITION_MONTHS_AHEAD)
+        new_months = []
+        while next_month <= last_month:
+            new_months.append(next_month)
+            next_month = add_months(next_month, 1)
+        if new_months and not dry_run:
+            # p_future is empty in steady state, so splitting it is a metadata-only change
+            clauses = ", ".join(partition_clause(month) for month in new_months)
+            cursor.execute(
+                f"ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO "
+                f"({clauses}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE))"
+            )
+        return [partition_name(month) for month in new_months]
+
+    def _exchange_into_archive(self, cursor, table, name, month):
+        archive = f"{table}_archive_{month:%Y%m}"
+        cursor.execute(f"DROP TABLE IF EXISTS {archive}")
+        cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+        cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+
+    def _rotate_into_archives(self, connection, cursor, table, column, cutoff_month, dry_run) -> List[str]:
+        """Fallback without partitioning: move expired months out in primary-key batches"""
+        cursor.execute(f"SELECT MIN({column}) AS oldest FROM {table}")
+        oldest = cursor.fetchone()["oldest"]
+        if oldest is None:
+            return []
+        months = []
+        month = month_floor(oldest.date())
+        while month < cutoff_month:
+            months.append(f"{month:%Y-%m}")
+            if not dry_run:
+                self._move_month(connection, cursor, table, column, month)
+            month = add_months(month, 1)
+        return months
+
+    def _move_month(self, connection, cursor, table, column, month):
+        archive = f"{table}_archive_{month:%Y%m}" if self.archive_keep_months else None
+        start, end = month, add_months(month, 1)
+        if archive:
+            # LIKE copies indexes but not foreign keys, so archived rows never cascade
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {archive} LIKE {table}")
+        else:
+            self._export(cursor, table, column, table, start, end)
+        while True:
+            cursor.execute(
+                f"SELECT id FROM {table} WHERE {column} >= %s AND {column} < %s ORDER BY id LIMIT %s",
+                (start, end, self.batch_size)
+            )
+            ids = [row["id"] for row in cursor.fetchall()]
+            if not ids:
+                break
+            in_clause = ", ".join(["%s"] * len(ids))
+            if archive:
+                cursor.execute(f"INSERT IGNORE INTO {archive} SELECT * FROM {table} WHERE id IN ({in_clause})", ids)
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({in_clause})", ids)
+            connection.commit()
+
+    def _purge_app(self, connection, cursor, table, column, app_id, cutoff, dry_run) -> int:
+        if dry_run:
+            cursor.execute(
+                f"SELECT COUNT(*) AS expired FROM {table} WHERE app_id = %s AND {column} < %s",
+                (app_id, cutoff)
+            )
+            return cursor.fetchone()["expired"]
+        self._export(cursor, table, column, table, None, cutoff, app_id=app_id)
+        purged = 0
+        while True:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE app_id = %s AND {column} < %s LIMIT %s",
+                (app_id, cutoff, self.batch_size)
+            )
+            connection.commit()
+            purged += cursor.rowcount
+            if cursor.rowcount < self.batch_size:
+                return purged
+
+    # One-off conversion
+
+    def partition_statements(self, cursor, table: str, today: Optional[date] = None) -> List[str]:
+        """DDL converting a table to monthly RANGE COLUMNS partitions.
+
+        MySQL partitioned tables cannot have foreign keys (in either direction)
+        and every unique key must contain the partitioning column, so both are
+        adjusted; referential cleanup then happens in the application.
+        """
+        column = TELEMETRY_TABLES[table]
+        today = today or date.today()
+        statements = []
+
+        cursor.execute(
+            """SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)""",
+            (table, table)
+        )
+        for row in cursor.fetchall():
+            statements.append(f"ALTER TABLE {row['TABLE_NAME']} DROP FOREIGN KEY {row['CONSTRAINT_NAME']}")
+
+        cursor.execute(
+            """SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'""",
+            (table,)
+        )
+        unique_indexes = [row["INDEX_NAME"] for row in cursor.fetchall()]
+        if unique_indexes:
+            raise ValueError(f"{table} has unique keys without {column}: {', '.join(unique_indexes)}")
+
+        statements.append(f"UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL")
+        statements.append(
+            f"ALTER TABLE {table} MODIFY {column} DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})"
+        )
+
+        cursor.execute(f"SELECT MIN({column}) AS oldest FROM {table}")
+        oldest = cursor.fetchone()["oldest"]
+        month = month_floor(oldest.date() if oldest else today)
+        last_month = add_months(month_floor(today), PARTITION_MONTHS_AHEAD)
+        clauses = []
+        while month <= last_month:
+            clauses.append(partition_clause(month))
+            month = add_months(month, 1)
+        clauses.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+        statements.append(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS({column}) (\n    " + ",\n    ".join(clauses) + "\n)")
+        return statements
+
+
+def main():
+    from multi_app_api import get_db, retention_manager
+
+    parser = argparse.ArgumentParser(description="Telemetry retention")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--dry-run", action="store_true", help="Show what would be dropped or purged")
+    action.add_argument("--run", action="store_true", help="Apply retention now")
+    action.add_argument("--partition", choices=sorted(TELEMETRY_TABLES), help="Convert a table to monthly partitions")
+    parser.add_argument("--execute", action="store_true", help="With --partition: run the DDL instead of printing it")
+    parser.add_argument("--archive-keep-months", type=int, default=int(os.environ.get("ARCHIVE_KEEP_MONTHS", 0)))
+    args = parser.parse_args()
+
+    manager = retention_manager
+    manager.archive_keep_months = args.archive_keep_months
+    if args.partition:
+        with get_db() as connection:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                for statement in manager.partition_statements(cursor, args.partition):
+                    print(statement + ";")
+                    if args.execute:
+                        cursor.execute(statement)
+                connection.commit()
+        return
+
+    import json
+    print(json.dumps(manager.run(dry_run=args.dry_run), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
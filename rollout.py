@@ -0,0 +1,37 @@
+"""
+Staged rollout of app versions
+Each version has a rollout_percentage (0-100). A device is in the rollout when
+its bucket, a stable hash of app, version and user_uuid, falls below the
+percentage: the same device gets the same answer on every check, raising the
+percentage only adds devices, and each version samples a different slice of
+users.
+"""
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+
+BUCKETS = 10000
+
+
+def rollout_bucket(app_identifier: str, version: str, user_uuid: str) -> int:
+    digest = hashlib.sha256(f"{app_identifier}:{version}:{user_uuid}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % BUCKETS
+
+
+def in_rollout(app_identifier: str, version: str, percentage: Optional[int],
+               user_uuid: Optional[str]) -> bool:
+    if percentage is None or percentage >= 100:
+        return True
+    if percentage <= 0 or not user_uuid:
+        # Anonymous checks only see fully released versions
+        return False
+    return rollout_bucket(app_identifier, version, user_uuid) < percentage * BUCKETS // 100
+
+
+def pick_version(app_identifier: str, candidates: Iterable[Dict[str, Any]],
+                 user_uuid: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Newest candidate (ordered by version_code DESC) this device is eligible for"""
+    for candidate in candidates:
+        if in_rollout(app_identifier, candidate["version"],
+                      candidate.get("rollout_percentage"), user_uuid):
+            return candidate
+    return None
@@ -0,0 +1,223 @@
+"""
+In-memory active sessions with heartbeats and batched closes
+Each worker keeps the sessions it has seen in a slot table (parallel arrays
+plus a session id -> slot index, freed slots reused, at most max_sessions).
+Heartbeats for tracked sessions only touch that table: no database write.
+Sessions are closed by close_sessions(), one UPDATE per kind:
+
+- ended explicitly: end_time is the /end call, written right away (the
+  caller learns whether the session exists and nothing is lost on a crash)
+- no heartbeat for timeout_seconds: end_time is the last heartbeat, written
+  in batches
+- no heartbeat at all before the timeout (clients that do not send them):
+  only marked inactive, the duration is left NULL for now; their /end, when
+  it comes, still records it
+
+Times are kept as ages (seconds before the flush) and applied to the
+database clock, so a different host clock or time zone does not shift
+durations against start_time.
+
+A heartbeat for a session this worker does not know (started on another
+worker, or before a restart) is adopted only if the session is still active
+in the database; the caller checks and then calls adopt(). Closes of tracked
+sessions keep the latest end_time recorded, so a worker closing a session
+with an older heartbeat does not shorten it; /end for an untracked session
+only closes it if it is still active or has no duration yet. sweep_abandoned() marks inactive the
+sessions no worker is tracking any more.
+"""
+import threading
+import time
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from metrics import REGISTRY, Counter, Gauge, register_queue_depth
+
+session_closes_total = REGISTRY.register(Counter(
+    "session_closes_total", "Sessions closed by the session tracker", ("reason",)))
+sessions_tracked = REGISTRY.register(Gauge(
+    "sessions_tracked", "Active sessions held in this worker's session table"))
+
+BATCH_SIZE = 1000
+
+
+class Close(NamedTuple):
+    session_id: int
+    end: Optional[float]    # epoch seconds on this host; None when the duration is unknown
+    tracked: bool           # the session was in the table (known to be active)
+
+
+class SessionTracker:
+    def __init__(self, timeout_seconds: float = 300, max_sessions: int = 200000):
+        self.timeout_seconds = timeout_seconds
+        self.max_sessions = max_sessions
+        self._ids = array("q")
+        self._last_seen = array("d")
+        self._heard = bytearray()  # 1 once the session has sent a heartbeat
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._pending: List[Close] = []
+        self._lock = threading.Lock()
+        sessions_tracked.set_function(lambda: len(self._slots))
+        register_queue_depth("session_closes", lambda: len(self._pending))
+
+    def _track(self, session_id: int, now: float, heard: int) -> bool:
+        slot = self._slots.get(session_id)
+        if slot is None:
+            if len(self._slots) >= self.max_sessions:
+                return False
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = session_id
+            else:
+                slot = len(self._ids)
+                self._ids.append(session_id)
+                self._last_seen.append(0.0)
+                self._heard.append(0)
+            self._slots[session_id] = slot
+        self._last_seen[slot] = now
+        self._heard[slot] = heard or self._heard[slot]
+        return True
+
+    def _release(self, session_id: int) -> int:
+        slot = self._slots.pop(session_id)
+        self._ids[slot] = 0
+        self._free.append(slot)
+        return slot
+
+    def start(self, session_id: int, now: Optional[float] = None) -> bool:
+        """Track a session just created; False when the table is full (the sweep will close it)"""
+        with self._lock:
+            return self._track(session_id, now or time.time(), heard=0)
+
+    def heartbeat(self, session_id: int, now: Optional[float] = None) -> bool:
+        """Refresh a tracked session; False if this worker does not track it"""
+        with self._lock:
+            if session_id not in self._slots:
+                return False
+            return self._track(session_id, now or time.time(), heard=1)
+
+    def adopt(self, session_id: int, now: Optional[float] = None) -> bool:
+        """Track a session checked to be active in the database; False when the table is full"""
+        with self._lock:
+            return self._track(session_id, now or time.time(), heard=1)
+
+    def end(self, session_id: int, now: Optional[float] = None) -> Close:
+        """Stop tracking a session ended by the client; the caller writes the returned close"""
+        with self._lock:
+            tracked = session_id in self._slots
+            if tracked:
+                self._release(session_id)
+        session_closes_total.inc(reason="ended")
+        return Close(session_id, now or time.time(), tracked)
+
+    def collect(self, now: Optional[float] = None) -> List[Close]:
+        """Time out silent sessions and take every close waiting to be written"""
+        cutoff = (now or time.time()) - self.timeout_seconds
+        with self._lock:
+            for session_id, slot in list(self._slots.items()):
+                if self._last_seen[slot] < cutoff:
+                    heard = self._heard[slot]
+                    self._pending.append(Close(session_id, self._last_seen[slot] if heard else None, True))
+                    self._release(session_id)
+                    session_closes_total.inc(reason="timeout" if heard else "abandoned")
+            closes, self._pending = self._pending, []
+        return closes
+
+    def requeue(self, closes: List[Close]):
+        """Put back closes whose write failed"""
+        with self._lock:
+            self._pending[:0] = closes
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+def _close_timed(cursor, chunk: List[Tuple[int, int]], extend: bool):
+    """
+    chunk: (session id, age in seconds); extend: keep the later of the stored and new end_time
+    Without extend only sessions still open or closed without a duration are updated
+    """
+    end_sql = f"DATE_SUB(NOW(), INTERVAL CASE id {' '.join(['WHEN %s THEN %s'] * len(chunk))} END SECOND)"
+    if extend:
+        end_sql = f"GREATEST(COALESCE(end_time, start_time), {end_sql})"
+    # Assignments run left to right: duration_seconds sees the new end_time
+    cursor.execute(
+        f"""UPDATE user_sessions
+           SET end_time = {end_sql},
+               is_active = 0,
+               duration_seconds = TIMESTAMPDIFF(SECOND, start_time, end_time)
+           WHERE id IN ({', '.join(['%s'] * len(chunk))})
+           {'' if extend else 'AND (is_active = 1 OR duration_seconds IS NULL)'}""",
+        [value for item in chunk for value in item] + [session_id for session_id, _ in chunk]
+    )
+
+
+def close_sessions(connection, closes: List[Close], now: Optional[float] = None) -> List[tuple]:
+    """
+    Write closes in batched UPDATEs
+    Returns (id, app_identifier, app_id, end_time, duration_seconds) of the closed sessions
+    """
+    now = now or time.time()
+    merged: Dict[int, Close] = {}
+    for close in closes:
+        previous = merged.get(close.session_id)
+        if previous is None:
+            merged[close.session_id] = close
+        else:
+            ends = [end for end in (previous.end, close.end) if end is not None]
+            merged[close.session_id] = Close(close.session_id, max(ends) if ends else None,
+                                             previous.tracked or close.tracked)
+    ages = {session_id: max(0, int(round(now - close.end)))
+            for session_id, close in merged.items() if close.end is not None}
+    extended = sorted((session_id, age) for session_id, age in ages.items() if merged[session_id].tracked)
+    guarded = sorted((session_id, age) for session_id, age in ages.items() if not merged[session_id].tracked)
+    unknown = sorted(session_id for session_id, close in merged.items() if close.end is None)
+
+    with connection.cursor() as cursor:
+        for timed, extend in ((extended, True), (guarded, False)):
+            for start in range(0, len(timed), BATCH_SIZE):
+                _close_timed(cursor, timed[start:start + BATCH_SIZE], extend)
+        for start in range(0, len(unknown), BATCH_SIZE):
+            chunk = unknown[start:start + BATCH_SIZE]
+            cursor.execute(
+                f"UPDATE user_sessions SET is_active = 0 WHERE id IN ({', '.join(['%s'] * len(chunk))}) AND is_active = 1",
+                chunk
+            )
+        connection.commit()
+
+        closed = []
+        ids = sorted(merged)
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                f"""SELECT s.id, a.app_identifier, s.app_id, s.end_time, s.duration_seconds
+                   FROM user_sessions s
+                   JOIN apps a ON s.app_id = a.id
+                   WHERE s.id IN ({', '.join(['%s'] * len(chunk))})""",
+                chunk
+            )
+            closed.extend(cursor.fetchall())
+    return closed
+
+
+def is_active(connection, session_id: int) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT is_active FROM user_sessions WHERE id = %s", (session_id,))
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def sweep_abandoned(connection, max_hours: float, limit: int = 10000) -> int:
+    """Mark inactive the sessions still open max_hours after they started (no worker tracks them)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """UPDATE user_sessions SET is_active = 0
+               WHERE is_active = 1 AND start_time < DATE_SUB(NOW(), INTERVAL %s MINUTE)
+               LIMIT %s""",
+            (int(max_hours * 60), limit)
+        )
+        connection.commit()
+        swept = cursor.rowcount
+    if swept:
+        session_closes_total.inc(swept, reason="swept")
+    return swept
@@ -0,0 +1,126 @@
+"""
+Small mergeable summaries for pre-aggregated analytics
+Both have a bounded size however many values they absorb, merge without
+losing their guarantees (so per-platform summaries can be combined per
+release, or batches folded into a stored summary) and serialize to JSON.
+
+- TopK: Misra-Gries frequent items; exact while there are at most capacity
+  distinct items, otherwise each count is under by at most total/(capacity+1)
+- QuantileSketch: logarithmic buckets (DDSketch); any quantile is within
+  relative_accuracy of a value actually seen
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class TopK:
+    def __init__(self, capacity: int = 20, counts: Optional[Dict[str, int]] = None):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = dict(counts or {})
+
+    def add(self, item: str, count: int = 1):
+        self.counts[item] = self.counts.get(item, 0) + count
+        self._prune()
+
+    def merge(self, other: "TopK") -> "TopK":
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+        self._prune()
+        return self
+
+    def _prune(self):
+        if len(self.counts) <= self.capacity:
+            return
+        # Subtract the (capacity+1)-th largest count from every item, drop those left at zero
+        cut = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self.counts = {item: count - cut for item, count in self.counts.items() if count > cut}
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], capacity: int = 20) -> "TopK":
+        if not data:
+            return cls(capacity)
+        return cls(data.get("capacity", capacity), data.get("counts"))
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.02, max_buckets: int = 512):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float, count: int = 1):
+        value = max(0.0, float(value))
+        if value < 1e-9:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._collapse()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for bound in (other.min, other.max):
+            if bound is not None:
+                self.min = bound if self.min is None else min(self.min, bound)
+                self.max = bound if self.max is None else max(self.max, bound)
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        # Past max_buckets the lowest buckets are folded together: high quantiles stay accurate
+        if len(self.buckets) <= self.max_buckets:
+            return
+        indexes = sorted(self.buckets)
+        excess = indexes[:len(indexes) - self.max_buckets + 1]
+        folded = sum(self.buckets.pop(index) for index in excess)
+        self.buckets[excess[-1]] = folded
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"relative_accuracy": self.relative_accuracy, "zero_count": self.zero_count,
+                "count": self.count, "min": self.min, "max": self.max,
+                "buckets": {str(index): count for index, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], relative_accuracy: float = 0.02) -> "QuantileSketch":
+        sketch = cls((data or {}).get("relative_accuracy", relative_accuracy))
+        if data:
+            sketch.buckets = {int(index): count for index, count in data.get("buckets", {}).items()}
+            sketch.zero_count = data.get("zero_count", 0)
+            sketch.count = data.get("count", 0)
+            sketch.min = data.get("min")
+            sketch.max = data.get("max")
+        return sketch
@@ -0,0 +1,181 @@
+"""
+Persistent index of the files in a storage tree
+One SQLite row per file (path relative to the root, size, mtime, inode,
+SHA-256), so listings and storage stats are index reads instead of a tree
+walk that stats and re-hashes every APK/IPA.
+
+Writers keep it current (FileStorageManager.save_file/delete_file). reconcile()
+catches changes made behind their back: it walks the tree once and re-hashes
+only files whose (size, mtime, inode) signature differs from the index.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".storage_index.sqlite3"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path) -> str:
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256_hash.update(chunk)
+    return sha256_hash.hexdigest()
+
+
+def _signature(stat: os.stat_result) -> tuple:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class StorageIndex:
+    def __init__(self, root, db_path=None, ignore: Optional[Callable[[str], bool]] = None):
+        """
+        root: directory whose files are indexed (paths are stored relative to it)
+        ignore(relative_path): files to leave out, e.g. metadata sidecars
+        """
+        self.root = Path(root)
+        self.db_path = Path(db_path) if db_path else self.root / INDEX_FILENAME
+        self.ignore = ignore
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            # WAL: several workers can read while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _relative(self, path) -> str:
+        """Accepts paths under the root or already relative to it"""
+        path = Path(path)
+        root = self.root.resolve() if path.is_absolute() else self.root
+        try:
+            return path.relative_to(root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _skip(self, relative_path: str) -> bool:
+        name = relative_path.rsplit("/", 1)[-1]
+        if name.startswith(INDEX_FILENAME):
+            return True
+        return bool(self.ignore and self.ignore(relative_path))
+
+    # Writers
+
+    def record(self, path, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Index a file that was just written (hash computed if not given)"""
+        relative = self._relative(path)
+        full_path = self.root / relative
+        stat = full_path.stat()
+        if file_hash is None:
+            file_hash = file_sha256(full_path)
+        entry = {"path": relative, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "inode": stat.st_ino, "hash": file_hash, "indexed_at": time.time()}
+        with self._lock, self._db:
+            self._db.execute(
+                """INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash, indexed_at)
+                   VALUES (:path, :size, :mtime_ns, :inode, :hash, :indexed_at)""",
+                entry
+            )
+        return entry
+
+    def remove(self, path):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE path = ?", (self._relative(path),))
+
+    # Readers
+
+    def get(self, path) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM files WHERE path = ?", (self._relative(path),)).fetchone()
+        return dict(row) if row else None
+
+    def lookup(self, path) -> Dict[str, Any]:
+        """Entry for a file, re-hashed only if its signature changed since it was indexed"""
+        entry = self.get(path)
+        stat = (self.root / self._relative(path)).stat()
+        if entry and (entry["size"], entry["mtime_ns"], entry["inode"]) == _signature(stat):
+            return entry
+        return self.record(path)
+
+    def entries(self, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        query, params = "SELECT * FROM files", ()
+        if prefix:
+            query, params = "SELECT * FROM files WHERE path LIKE ? ESCAPE '\\'", (
+                prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query + " ORDER BY path", params)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return {"files": count, "bytes": total}
+
+    @property
+    def last_reconciled(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'last_reconciled'").fetchone()
+        return float(row[0]) if row else None
+
+    # Scanner
+
+    def reconcile(self) -> Dict[str, int]:
+        """Bring the index in line with the tree; only changed files are re-hashed"""
+        with self._lock:
+            known = {row["path"]: (row["size"], row["mtime_ns"], row["inode"])
+                     for row in self._db.execute("SELECT path, size, mtime_ns, inode FROM files")}
+        seen, changed = set(), 0
+        stack = [self.root] if self.root.exists() else []
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                relative = Path(entry.path).relative_to(self.root).as_posix()
+                if self._skip(relative) or entry.name.startswith("."):
+                    continue
+                seen.add(relative)
+                try:
+                    if known.get(relative) != _signature(entry.stat()):
+                        self.record(relative)
+                        changed += 1
+                except FileNotFoundError:
+                    seen.discard(relative)
+
+        removed = [path for path in known if path not in seen]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_reconciled', ?)",
+                             (str(time.time()),))
+        if changed or removed:
+            logger.info(f"Storage index {self.root}: {changed} files (re)hashed, {len(removed)} removed")
+        return {"files": len(seen), "rehashed": changed, "removed": len(removed)}
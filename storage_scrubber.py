@@ -0,0 +1,184 @@
+"""
+Integrity scrubber for the build volume
+Re-reads every stored build and compares its SHA-256 with
+app_versions.file_hash, so bit rot or a file damaged outside the API is found
+before a device downloads it. Files that do not match are quarantined (moved
+to quarantine/corrupt/, so download_version fails loudly instead of serving
+them). The report also lists:
+
+- orphans: files with no app_versions row; quarantined once older than the
+  grace period, so uploads still being registered are left alone
+- missing: rows whose file_path points to no file
+- stale temp files left in temp/ by interrupted writes (deleted)
+
+Hashing runs in a process pool; each worker is throttled so the whole scrub
+stays within an I/O budget (STORAGE_SCRUB_IO_MB_S) and does not starve
+downloads.
+"""
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from typing import Any, Callable, Dict, Optional
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+storage_scrub_files_total = REGISTRY.register(Counter(
+    "storage_scrub_files_total", "Files checked by the storage scrubber", ("result",)))
+
+
+def hash_file_throttled(path: str, bytes_per_second: float = 0) -> Optional[str]:
+    """SHA-256 of a file read at most at bytes_per_second (0: unthrottled); None if it is gone"""
+    sha256_hash = hashlib.sha256()
+    started = time.monotonic()
+    read = 0
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256_hash.update(chunk)
+                read += len(chunk)
+                if bytes_per_second:
+                    ahead = read / bytes_per_second - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+    except FileNotFoundError:
+        return None
+    return sha256_hash.hexdigest()
+
+
+class StorageScrubber:
+    def __init__(self, storage, connect: Callable, workers: int = 2, io_budget_mb_s: float = 50,
+                 orphan_grace_hours: float = 6, max_orphan_ratio: float = 0.5):
+        """
+        storage: FileStorageManager; connect: get_db-style context manager
+        max_orphan_ratio: above this share of orphaned files nothing is quarantined
+        (more likely a wrong database than a real leak)
+        """
+        self.storage = storage
+        self.connect = connect
+        self.workers = max(1, workers)
+        self.io_budget = io_budget_mb_s * 1024 * 1024
+        self.orphan_grace = orphan_grace_hours * 3600
+        self.max_orphan_ratio = max_orphan_ratio
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._running = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.locked()
+
+    def _stored_versions(self) -> Dict[str, Dict[str, Any]]:
+        import pymysql.cursors
+
+        with self.connect() as connection:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("SHOW COLUMNS FROM app_versions LIKE 'file_path'")
+                if cursor.fetchone() is None:
+                    raise RuntimeError("app_versions.file_path is missing (run add_file_path_column.sql)")
+                cursor.execute(
+                    """SELECT v.id, a.app_identifier, v.platform, v.version, v.file_path, v.file_hash
+                    FROM app_versions v
+                    JOIN apps a ON a.id = v.app_id
+                    WHERE v.file_path IS NOT NULL AND v.file_path != 'BLOB_STORAGE'"""
+                )
+                return {row['file_path']: row for row in cursor.fetchall()}
+
+    def run(self, quarantine: bool = True) -> Dict[str, Any]:
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A scrub is already running")
+        try:
+            return self._run(quarantine)
+        finally:
+            self._running.release()
+
+    def _run(self, quarantine: bool) -> Dict[str, Any]:
+        started = time.monotonic()
+        base_path = self.storage.base_path
+        self.storage.reconcile_index()
+        rows = self._stored_versions()
+        files = {entry['path']: entry for entry in self.storage.index.entries("versions/")}
+        report: Dict[str, Any] = {
+            "started_at": datetime.now().isoformat(),
+            "files": len(files),
+            "verified": 0,
+            "unverifiable": 0,
+            "corrupt": [],
+            "missing": [],
+            "orphans": [],
+            "stale_temp_files": 0,
+            "quarantined": 0,
+        }
+
+        def describe(row):
+            return {"version_id": row['id'], "app_identifier": row['app_identifier'],
+                    "platform": row['platform'], "version": row['version'], "file_path": row['file_path']}
+
+        for path, row in rows.items():
+            if path not in files:
+                report["missing"].append(describe(row))
+                storage_scrub_files_total.inc(result="missing")
+
+        now = time.time()
+        orphans = [path for path in files if path not in rows]
+        old_orphans = [path for path in orphans if now - files[path]['mtime_ns'] / 1e9 > self.orphan_grace]
+        quarantine_orphans = quarantine and len(orphans) <= self.max_orphan_ratio * max(len(files), 1)
+        if orphans and not quarantine_orphans and quarantine:
+            logger.warning(f"Storage scrub: {len(orphans)}/{len(files)} files have no database row, not quarantining")
+        for path in orphans:
+            entry = {"file_path": path, "size": files[path]['size']}
+            if quarantine_orphans and path in old_orphans:
+                entry["quarantined_to"] = self.storage.quarantine(path, "orphan")
+                report["quarantined"] += 1
+            report["orphans"].append(entry)
+            storage_scrub_files_total.inc(result="orphan")
+
+        to_verify = [(path, row) for path, row in rows.items() if path in files and row['file_hash']]
+        report["unverifiable"] = sum(1 for path, row in rows.items() if path in files and not row['file_hash'])
+        if to_verify:
+            # spawn: the API process is multi-threaded, forking it is not safe
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                digests = pool.map(hash_file_throttled,
+                                   [str(base_path / path) for path, _ in to_verify],
+                                   repeat(self.io_budget / self.workers))
+                for (path, row), digest in zip(to_verify, digests):
+                    if digest is None:
+                        report["missing"].append(describe(row))
+                        storage_scrub_files_total.inc(result="missing")
+                    elif digest != row['file_hash']:
+                        entry = dict(describe(row), expected_hash=row['file_hash'], actual_hash=digest)
+                        if quarantine:
+                            entry["quarantined_to"] = self.storage.quarantine(path, "corrupt")
+                            report["quarantined"] += 1
+                        report["corrupt"].append(entry)
+                        storage_scrub_files_total.inc(result="corrupt")
+                    else:
+                        report["verified"] += 1
+                        storage_scrub_files_total.inc(result="ok")
+
+        # Leftovers of writes interrupted before their rename
+        for temp_path in (base_path / "temp").glob("*.part"):
+            try:
+                if now - temp_path.stat().st_mtime > self.orphan_grace:
+                    temp_path.unlink()
+                    report["stale_temp_files"] += 1
+            except FileNotFoundError:
+                pass
+
+        report["duration_seconds"] = round(time.monotonic() - started, 1)
+        if report["corrupt"] or report["missing"] or report["orphans"]:
+            logger.warning(
+                f"Storage scrub: {len(report['corrupt'])} corrupt, {len(report['missing'])} missing, "
+                f"{len(report['orphans'])} orphaned files ({report['quarantined']} quarantined)"
+            )
+        else:
+            logger.info(f"Storage scrub: {report['verified']} files verified in {report['duration_seconds']}s")
+        self.last_report = report
+        return report
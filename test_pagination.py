@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test dei cursori di paginazione keyset (pagination.py), senza server né database
+"""
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from pagination import NULL_DATETIME, decode_cursor, encode_cursor, keyset_condition, null_last
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, [datetime.fromisoformat, int]) == [created_at, 42]
+
+
+def test_cursor_with_null_placeholder():
+    cursor = encode_cursor(NULL_DATETIME, 7)
+    assert decode_cursor(cursor, [datetime.fromisoformat, int]) == [NULL_DATETIME, 7]
+    assert "1000-01-01 00:00:00" in null_last("last_seen")
+
+
+def test_invalid_cursor_is_400():
+    for cursor in ("not-base64!", encode_cursor(1), encode_cursor("x", 1)):
+        try:
+            decode_cursor(cursor, [datetime.fromisoformat, int])
+        except HTTPException as e:
+            assert e.status_code == 400
+        else:
+            raise AssertionError(f"cursor {cursor!r} should be rejected")
+
+
+def test_keyset_condition():
+    sql, params = keyset_condition(["created_at", "id"], ["2024-05-01", 42])
+    assert sql == "((created_at < %s) OR (created_at = %s AND id < %s))"
+    assert params == ["2024-05-01", "2024-05-01", 42]
+    sql, params = keyset_condition(["id"], [5])
+    assert sql == "((id < %s))" and params == [5]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Pagination tests completed!")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test del single-flight per letture identiche (request_coalescing.py), senza server
+"""
+import asyncio
+import json
+
+from request_coalescing import SingleFlight, _freeze, coalesce
+from response_cache import MemoryBackend, ResultCache
+
+
+def test_freeze_ignores_order_and_whitespace():
+    assert _freeze({"b": [2, 1], "a": " x "}) == _freeze({"a": "x", "b": [1, 2]})
+    assert _freeze(["a", "b"]) != _freeze(["a", "c"])
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": len(calls)}
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*[flight.do("key", compute) for _ in range(10)])
+        assert not flight.in_flight("key")
+        return results
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {"value": 1} for result in results)
+
+
+def test_errors_are_shared_and_not_cached():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        flight = SingleFlight("test", ttl_seconds=60)
+        results = await asyncio.gather(*[flight.do("key", compute) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        await asyncio.gather(flight.do("key", compute), return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_ttl_reuses_result_until_invalidated():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight("test", ttl_seconds=60)
+        assert await flight.do("key", compute) == 1
+        assert await flight.do("key", compute) == 1
+        assert await flight.do("other", compute) == 2
+        flight.invalidate()
+        assert await flight.do("key", compute) == 3
+
+    asyncio.run(main())
+
+
+def test_decorator_keys_on_arguments():
+    calls = []
+
+    @coalesce("test_sync")
+    def handler(app_identifier: str, days: int = 7):
+        calls.append((app_identifier, days))
+        return {"app": app_identifier, "days": days}
+
+    async def main():
+        same = await asyncio.gather(handler(app_identifier="a", days=7), handler(app_identifier=" a", days=7))
+        other = await handler(app_identifier="a", days=30)
+        return same, other
+
+    same, other = asyncio.run(main())
+    assert same == [{"app": "a", "days": 7}] * 2
+    assert other == {"app": "a", "days": 30}
+    assert len(calls) == 2
+
+
+def test_tagged_cache_invalidate_and_age():
+    cache = ResultCache(MemoryBackend())
+    calls = []
+
+    @coalesce("test_tagged", ttl_seconds=60, cache=cache,
+              tags=lambda app_id: [f"sessions:{app_id}"], stale_seconds=60)
+    async def handler(app_id: int):
+        calls.append(app_id)
+        return {"app_id": app_id, "computed": len(calls)}
+
+    async def call():
+        response = await handler(app_id=1)
+        return json.loads(response.body)["computed"]
+
+    async def main():
+        assert await call() == 1
+        assert await call() == 1                # fresh hit
+        cache.invalidate_tags("sessions:2")
+        assert await call() == 1                # other tag: still valid
+        cache.age_tags("sessions:1")
+        assert await call() == 1                # stale: served, refreshed in background
+        await asyncio.sleep(0.01)
+        assert await call() == 2
+        cache.invalidate_tags("sessions:1")
+        assert await call() == 3                # invalidated: recomputed before answering
+
+    asyncio.run(main())
+
+
+def test_tags_none_skips_the_shared_cache():
+    cache = ResultCache(MemoryBackend())
+    calls = []
+
+    @coalesce("test_uncached", ttl_seconds=60, cache=cache, tags=lambda app_id: None)
+    async def handler(app_id: int):
+        calls.append(app_id)
+        return {"computed": len(calls)}
+
+    async def main():
+        await handler(app_id=1)
+        await handler(app_id=1)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Request coalescing tests completed!")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test della compressione negoziata (response_compression.py), senza server
+Il middleware è provato su una piccola app ASGI in memoria
+"""
+import asyncio
+import gzip
+
+import response_compression
+from response_compression import CompressionMiddleware, choose_encoding, parse_accept_encoding
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, identity;q=0") == {"gzip": 1.0, "br": 0.5, "identity": 0.0}
+    assert parse_accept_encoding("GZIP;q=bad, ,") == {"gzip": 0.0}
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") in ("br", "gzip")
+    assert choose_encoding("*;q=0.5, gzip;q=0") == ("br" if response_compression.brotli else None)
+    if response_compression.brotli is not None:
+        assert choose_encoding("gzip, br") == "br"
+        assert choose_encoding("gzip, br;q=0.5") == "gzip"
+    else:
+        assert choose_encoding("br") is None
+
+
+def run(middleware, path="/api/v2/apps", accept="gzip"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "path": path, "query_string": b"",
+             "headers": [(b"accept-encoding", accept.encode())]}
+    asyncio.run(middleware(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    return headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def app_returning(body: bytes, content_type: bytes = b"application/json"):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def test_middleware_compresses_large_json():
+    body = b'{"items": [' + b'"x",' * 1000 + b'"x"]}'
+    headers, sent = run(CompressionMiddleware(app_returning(body)))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(sent)
+    assert gzip.decompress(sent) == body
+
+
+def test_middleware_skips_small_binary_and_excluded():
+    small = b'{"ok": true}'
+    headers, sent = run(CompressionMiddleware(app_returning(small)))
+    assert b"content-encoding" not in headers and sent == small
+
+    blob = b"PK" * 2000
+    headers, sent = run(CompressionMiddleware(app_returning(blob, b"application/vnd.android.package-archive")))
+    assert b"content-encoding" not in headers and sent == blob
+
+    body = b"{}" * 2000
+    headers, sent = run(CompressionMiddleware(app_returning(body)), path="/api/v2/download/app.apk")
+    assert b"content-encoding" not in headers and sent == body
+
+    headers, sent = run(CompressionMiddleware(app_returning(body)), accept="identity")
+    assert b"content-encoding" not in headers and sent == body
+
+
+def test_precompressed_cache_reuses_identical_bodies():
+    body = b'{"apps": [' + b'"a",' * 1000 + b'"a"]}'
+    middleware = CompressionMiddleware(app_returning(body), precompressed_paths=["/api/v2/apps"])
+    first = run(middleware)[1]
+    second = run(middleware)[1]
+    assert first == second
+    assert (middleware.cache.misses, middleware.cache.hits) == (1, 1)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Compression tests completed!")
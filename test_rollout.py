@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test del rollout graduale (rollout.py), senza server né database
+"""
+from rollout import BUCKETS, in_rollout, pick_version, rollout_bucket
+
+APP = "nexa-timesheet"
+USERS = [f"user-{n:04d}" for n in range(2000)]
+
+
+def test_bucket_is_stable():
+    bucket = rollout_bucket(APP, "1.2.0", "user-0001")
+    assert 0 <= bucket < BUCKETS
+    assert rollout_bucket(APP, "1.2.0", "user-0001") == bucket
+
+
+def test_full_and_empty_rollout():
+    assert in_rollout(APP, "1.2.0", None, None)
+    assert in_rollout(APP, "1.2.0", 100, "user-0001")
+    assert not in_rollout(APP, "1.2.0", 0, "user-0001")
+
+
+def test_anonymous_only_sees_full_releases():
+    assert not in_rollout(APP, "1.2.0", 50, None)
+    assert not in_rollout(APP, "1.2.0", 99, "")
+
+
+def test_percentage_is_approximate():
+    selected = sum(in_rollout(APP, "1.2.0", 10, user) for user in USERS)
+    assert 140 <= selected <= 260, selected
+
+
+def test_widening_only_adds_devices():
+    previous = set()
+    for percentage in (1, 5, 10, 25, 50, 100):
+        current = {user for user in USERS if in_rollout(APP, "1.2.0", percentage, user)}
+        assert previous <= current, percentage
+        previous = current
+    assert previous == set(USERS)
+
+
+def test_versions_sample_different_users():
+    first = {user for user in USERS if in_rollout(APP, "1.2.0", 10, user)}
+    second = {user for user in USERS if in_rollout(APP, "1.3.0", 10, user)}
+    assert first != second
+
+
+def test_pick_version():
+    candidates = [
+        {"version": "1.3.0", "rollout_percentage": 0},
+        {"version": "1.2.0", "rollout_percentage": 100},
+        {"version": "1.1.0"},
+    ]
+    assert pick_version(APP, candidates, "user-0001")["version"] == "1.2.0"
+    assert pick_version(APP, candidates[:1], "user-0001") is None
+    assert pick_version(APP, [], None) is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Rollout tests completed!")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test della tabella sessioni in memoria (session_tracker.py)
+Il database è sostituito da una connessione finta che registra le query
+"""
+from session_tracker import Close, SessionTracker, close_sessions
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.connection.queries.append((" ".join(sql.split()), list(params)))
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_heartbeat_only_for_tracked_sessions():
+    tracker = SessionTracker(timeout_seconds=60)
+    assert tracker.start(1, now=1000)
+    assert tracker.heartbeat(1, now=1010)
+    assert not tracker.heartbeat(2, now=1010)
+    assert len(tracker) == 1
+
+
+def test_timeouts():
+    tracker = SessionTracker(timeout_seconds=60)
+    tracker.start(1, now=1000)
+    tracker.heartbeat(1, now=1030)
+    tracker.start(2, now=1000)            # nessun heartbeat
+    tracker.start(3, now=1090)
+    assert tracker.collect(now=1050) == []
+    closes = sorted(tracker.collect(now=1100))
+    assert closes == [Close(1, 1030, True), Close(2, None, True)]
+    assert len(tracker) == 1
+    # Gli slot liberati vengono riusati
+    tracker.start(4, now=1100)
+    assert len(tracker._ids) == 3
+
+
+def test_table_is_bounded():
+    tracker = SessionTracker(max_sessions=2)
+    assert tracker.start(1) and tracker.start(2)
+    assert not tracker.start(3)
+    assert not tracker.adopt(3)
+
+
+def test_end_returns_close_instead_of_queueing():
+    tracker = SessionTracker(timeout_seconds=60)
+    tracker.start(1, now=1000)
+    assert tracker.end(1, now=1020) == Close(1, 1020, True)
+    assert tracker.end(2, now=1020) == Close(2, 1020, False)
+    assert len(tracker) == 0
+    assert tracker.collect(now=5000) == []
+
+
+def test_requeue():
+    tracker = SessionTracker(timeout_seconds=60)
+    tracker.start(1, now=1000)
+    closes = tracker.collect(now=2000)
+    tracker.requeue(closes)
+    assert tracker.collect(now=2000) == closes
+
+
+def test_close_sessions_merges_and_splits_by_kind():
+    connection = FakeConnection()
+    close_sessions(connection, [
+        Close(1, 990, True),
+        Close(1, 995, False),           # stessa sessione: vince la fine più recente
+        Close(2, 980, False),           # /end di una sessione non tracciata
+        Close(3, None, True),           # mai un heartbeat: durata ignota
+    ], now=1000)
+    updates = [(sql, params) for sql, params in connection.queries if sql.startswith("UPDATE")]
+    assert len(updates) == 3
+    extended, guarded, unknown = updates
+    assert "GREATEST(COALESCE(end_time, start_time)" in extended[0]
+    assert extended[1] == [1, 5, 1]
+    assert "GREATEST" not in guarded[0]
+    assert "AND (is_active = 1 OR duration_seconds IS NULL)" in guarded[0]
+    assert guarded[1] == [2, 20, 2]
+    assert unknown[0].endswith("AND is_active = 1") and unknown[1] == [3]
+    assert connection.commits == 1
+    select = [params for sql, params in connection.queries if sql.startswith("SELECT")]
+    assert select == [[1, 2, 3]]
+
+
+def test_close_sessions_batches():
+    import session_tracker
+    original = session_tracker.BATCH_SIZE
+    session_tracker.BATCH_SIZE = 2
+    try:
+        connection = FakeConnection()
+        close_sessions(connection, [Close(n, 1000, True) for n in range(5)], now=1000)
+        updates = [sql for sql, _ in connection.queries if sql.startswith("UPDATE")]
+        assert len(updates) == 3
+    finally:
+        session_tracker.BATCH_SIZE = original
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Session tracker tests completed!")
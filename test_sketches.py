@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test dei riepiloghi mergeabili (sketches.py), senza server né database
+"""
+import json
+import random
+
+from sketches import QuantileSketch, TopK
+
+
+def test_topk_exact_under_capacity():
+    top = TopK(capacity=5)
+    for item, count in (("a", 5), ("b", 3), ("c", 1)):
+        top.add(item, count)
+    assert top.top() == [("a", 5), ("b", 3), ("c", 1)]
+    assert top.top(1) == [("a", 5)]
+
+
+def test_topk_bounded_and_keeps_heavy_items():
+    top = TopK(capacity=3)
+    for n in range(1000):
+        top.add("heavy" if n % 2 else f"rare-{n}")
+    assert len(top.counts) <= 3
+    assert top.top(1)[0][0] == "heavy"
+    # Sottostima al massimo total / (capacity + 1)
+    assert top.counts["heavy"] >= 500 - 1000 // 4
+
+
+def test_topk_merge_and_round_trip():
+    left, right = TopK(capacity=5), TopK(capacity=5)
+    left.add("a", 2)
+    right.add("a", 3)
+    right.add("b", 1)
+    merged = left.merge(right)
+    assert merged.top() == [("a", 5), ("b", 1)]
+    restored = TopK.from_dict(json.loads(json.dumps(merged.to_dict())))
+    assert restored.capacity == 5 and restored.top() == merged.top()
+    assert TopK.from_dict(None, capacity=7).capacity == 7
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(42)
+    values = sorted(rng.uniform(1, 1000) for _ in range(5000))
+    sketch = QuantileSketch(relative_accuracy=0.02)
+    for value in values:
+        sketch.add(value)
+    assert sketch.count == len(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.02 * exact + 1e-9, q
+    assert values[0] <= sketch.quantile(0) <= values[0] * 1.02
+    assert values[-1] / 1.02 <= sketch.quantile(1) <= values[-1]
+
+
+def test_quantile_zeros_and_empty():
+    assert QuantileSketch().quantile(0.5) is None
+    sketch = QuantileSketch()
+    for value in (0, 0, 0, 10):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.min == 0.0 and sketch.max == 10.0
+
+
+def test_quantile_merge_and_round_trip():
+    left, right, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for value in range(1, 101):
+        (left if value % 2 else right).add(value)
+        whole.add(value)
+    left.merge(right)
+    assert left.count == whole.count and left.buckets == whole.buckets
+    assert (left.min, left.max) == (1, 100)
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(left.to_dict())))
+    assert restored.buckets == left.buckets and restored.quantile(0.9) == left.quantile(0.9)
+
+
+def test_quantile_merge_rejects_other_accuracy():
+    try:
+        QuantileSketch(0.02).merge(QuantileSketch(0.05))
+    except ValueError:
+        return
+    raise AssertionError("merge with a different accuracy should fail")
+
+
+def test_quantile_collapse_is_bounded():
+    sketch = QuantileSketch(max_buckets=16)
+    for exponent in range(200):
+        sketch.add(1.1 ** exponent)
+    assert len(sketch.buckets) <= 16
+    assert sketch.count == 200
+    assert abs(sketch.quantile(1) - 1.1 ** 199) <= 0.02 * 1.1 ** 199
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Sketch tests completed!")
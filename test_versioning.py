@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test delle chiavi di versione (versioning.py), senza server né database
+"""
+from versioning import format_version_key, is_newer, parse_version, version_key
+
+
+def test_semantic_order():
+    """Le chiavi ordinano come semver, non come testo"""
+    ordered = ["0.9.0", "0.10.0", "1.0.0-dev", "1.0.0-alpha.2", "1.0.0-beta.1",
+               "1.0.0-beta.3", "1.0.0-rc.1", "1.0.0", "1.0.1", "1.10.0", "2.0.0"]
+    keys = [version_key(version) for version in ordered]
+    assert None not in keys
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_equivalent_spellings():
+    """Prefisso v, componenti mancanti e build metadata non cambiano la chiave"""
+    assert version_key("v1.2") == version_key("1.2.0")
+    assert version_key("1.4.0+build.7") == version_key("1.4.0")
+    assert version_key("1.0.0-b2") == version_key("1.0.0-beta.2")
+
+
+def test_unencodable():
+    """Stringhe non valide o fuori range non hanno chiave"""
+    for value in (None, "", "latest", "1.0.0-rc.2000", f"{1 << 14}.0.0"):
+        assert version_key(value) is None, value
+
+
+def test_format_round_trip():
+    for version in ("1.2.0", "0.10.3", "2.0.0-beta.3", "3.1.4-rc"):
+        assert format_version_key(version_key(version)) == version
+    assert format_version_key(None) is None
+
+
+def test_is_newer():
+    assert is_newer("0.10.0", "0.9.0")
+    assert is_newer("1.0.0", "1.0.0-rc.1")
+    assert not is_newer("1.0.0", "1.0.0")
+    assert not is_newer("1.0.0-beta.1", "1.0.0")
+    # Quarto componente: stessa chiave, confronto completo
+    assert version_key("1.0.0.2") == version_key("1.0.0")
+    assert is_newer("1.0.0.2", "1.0.0.1")
+    assert not is_newer("1.0.0.1", "1.0.0.2")
+    # Senza chiave: basta che siano diverse
+    assert is_newer("nightly", "latest")
+    assert not is_newer("latest", "latest")
+
+
+def test_parse_version():
+    assert parse_version("1.2.3-rc.4") == (1, 2, 3, 4, 4, 0)
+    assert parse_version("1.2.3.9").build == 9
+    assert parse_version("garbage") is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ Versioning tests completed!")
@@ -0,0 +1,268 @@
+"""
+Update funnel aggregation over update_history
+track_update_status appends started/downloaded/installed/failed rows.
+aggregate() folds the rows added since its last run into update_funnel,
+one row per (app, to_version, platform):
+
+- event counts per stage
+- failure reasons (sketches.TopK)
+- time from the device's first "started" to "installed" for that version
+  (sketches.QuantileSketch)
+
+so /api/v2/analytics/{app}/updates reads a handful of rows whatever the size
+of the history. Progress is a watermark on update_history.id in
+aggregation_state, locked while a batch is folded, so several workers can run
+the job without counting a row twice. Rows are only taken once they are
+SETTLE_SECONDS old, so a transaction that commits a lower id late is not
+skipped. update_history has no platform column: the platform is the one of
+the user's installation ('unknown' without one).
+
+Usage:
+    python update_funnel.py --catch-up     # fold the whole backlog now
+"""
+import argparse
+import itertools
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sketches import QuantileSketch, TopK
+from versioning import version_key
+
+logger = logging.getLogger(__name__)
+
+TABLE = "update_funnel"
+STAGES = ("started", "downloaded", "installed", "failed")
+STATE_NAME = "update_funnel"
+SETTLE_SECONDS = 10
+TOP_REASONS_CAPACITY = 50
+MAX_REASON_LENGTH = 200
+
+
+class FunnelRow:
+    """Aggregates of one (app_id, to_version, platform); mergeable"""
+
+    def __init__(self, counts: Optional[Dict[str, int]] = None, reasons: Optional[TopK] = None,
+                 install_seconds: Optional[QuantileSketch] = None):
+        self.counts = {stage: 0 for stage in STAGES}
+        self.counts.update(counts or {})
+        self.reasons = reasons or TopK(TOP_REASONS_CAPACITY)
+        self.install_seconds = install_seconds or QuantileSketch()
+
+    @classmethod
+    def from_db(cls, row: Dict[str, Any]) -> "FunnelRow":
+        def load(value):
+            return json.loads(value) if isinstance(value, (str, bytes)) else value
+        return cls({stage: row[stage] for stage in STAGES},
+                   TopK.from_dict(load(row['failure_reasons']), TOP_REASONS_CAPACITY),
+                   QuantileSketch.from_dict(load(row['install_seconds'])))
+
+    def merge(self, other: "FunnelRow") -> "FunnelRow":
+        for stage in STAGES:
+            self.counts[stage] += other.counts[stage]
+        self.reasons.merge(other.reasons)
+        self.install_seconds.merge(other.install_seconds)
+        return self
+
+    @staticmethod
+    def _rounded(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value, 1)
+
+    def summary(self, top_reasons: int = 5) -> Dict[str, Any]:
+        started = self.counts["started"]
+        return {
+            **self.counts,
+            "success_rate": round(self.counts["installed"] / started, 4) if started else None,
+            "failure_rate": round(self.counts["failed"] / started, 4) if started else None,
+            "top_failure_reasons": [{"reason": reason, "count": count}
+                                    for reason, count in self.reasons.top(top_reasons)],
+            "time_to_install_seconds": {
+                "count": self.install_seconds.count,
+                **{name: self._rounded(self.install_seconds.quantile(q))
+                   for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+            },
+        }
+
+
+def _platforms(cursor, pairs) -> Dict[tuple, str]:
+    """(user_id, app_id) -> installation platform"""
+    user_ids = sorted({user_id for user_id, _ in pairs})
+    cursor.execute(
+        f"""SELECT user_id, app_id, platform FROM user_app_installations
+           WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})""",
+        user_ids
+    )
+    return {(row['user_id'], row['app_id']): row['platform'] for row in cursor.fetchall()}
+
+
+def _first_starts(cursor, installs) -> Dict[tuple, datetime]:
+    """(user_id, app_id, to_version) -> first "started" row of that update"""
+    user_ids = sorted({user_id for user_id, _, _ in installs})
+    cursor.execute(
+        f"""SELECT user_id, app_id, to_version, MIN(updated_at) as started_at
+           FROM update_history
+           WHERE user_id IN ({', '.join(['%s'] * len(user_ids))}) AND update_status = 'started'
+           GROUP BY user_id, app_id, to_version""",
+        user_ids
+    )
+    return {(row['user_id'], row['app_id'], row['to_version']): row['started_at'] for row in cursor.fetchall()}
+
+
+def aggregate_batch(connection, batch_size: int = 5000) -> Tuple[int, Set[int]]:
+    """Fold the next batch of settled update_history rows; returns how many were folded and their apps"""
+    import pymysql.cursors
+
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        # The lock serializes aggregators: a second worker waits, then sees the new watermark
+        cursor.execute("SELECT last_id FROM aggregation_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+        state = cursor.fetchone()
+        if state is None:
+            cursor.execute("INSERT IGNORE INTO aggregation_state (name, last_id) VALUES (%s, 0)", (STATE_NAME,))
+            connection.commit()
+            return aggregate_batch(connection, batch_size)
+
+        # Settling is judged on the database clock, the one updated_at was written with
+        cursor.execute(
+            """SELECT id, user_id, app_id, to_version, update_status, failure_reason, updated_at,
+                      updated_at > NOW() - INTERVAL %s SECOND AS unsettled
+               FROM update_history
+               WHERE id > %s
+               ORDER BY id
+               LIMIT %s""",
+            (SETTLE_SECONDS, state['last_id'], batch_size)
+        )
+        rows = []
+        for row in cursor.fetchall():
+            if row['unsettled']:
+                break
+            rows.append(row)
+        if not rows:
+            connection.rollback()
+            return 0, set()
+
+        platforms = _platforms(cursor, {(row['user_id'], row['app_id']) for row in rows})
+        installs = {(row['user_id'], row['app_id'], row['to_version'])
+                    for row in rows if row['update_status'] == 'installed'}
+        starts = _first_starts(cursor, installs) if installs else {}
+
+        batch: Dict[tuple, FunnelRow] = defaultdict(FunnelRow)
+        for row in rows:
+            key = (row['app_id'], row['to_version'] or '',
+                   platforms.get((row['user_id'], row['app_id'])) or 'unknown')
+            funnel = batch[key]
+            status = row['update_status']
+            if status not in funnel.counts:
+                continue
+            funnel.counts[status] += 1
+            if status == 'failed':
+                reason = (row['failure_reason'] or 'unknown').strip()[:MAX_REASON_LENGTH] or 'unknown'
+                funnel.reasons.add(reason)
+            elif status == 'installed':
+                started_at = starts.get((row['user_id'], row['app_id'], row['to_version']))
+                if started_at is not None and row['updated_at'] is not None:
+                    funnel.install_seconds.add((row['updated_at'] - started_at).total_seconds())
+
+        keys = sorted(batch)
+        cursor.execute(
+            f"""SELECT app_id, to_version, platform, {', '.join(STAGES)}, failure_reasons, install_seconds
+               FROM {TABLE}
+               WHERE (app_id, to_version, platform) IN ({', '.join(['(%s, %s, %s)'] * len(keys))})""",
+            [value for key in keys for value in key]
+        )
+        for row in cursor.fetchall():
+            key = (row['app_id'], row['to_version'], row['platform'])
+            batch[key] = FunnelRow.from_db(row).merge(batch[key])
+
+        cursor.execute(
+            f"""INSERT INTO {TABLE}
+               (app_id, to_version, platform, {', '.join(STAGES)}, failure_reasons, install_seconds)
+               VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(keys))}
+               ON DUPLICATE KEY UPDATE
+                   {', '.join(f'{stage} = VALUES({stage})' for stage in STAGES)},
+                   failure_reasons = VALUES(failure_reasons),
+                   install_seconds = VALUES(install_seconds)""",
+            [value for key in keys for value in (
+                *key, *(batch[key].counts[stage] for stage in STAGES),
+                json.dumps(batch[key].reasons.to_dict()), json.dumps(batch[key].install_seconds.to_dict()))]
+        )
+        cursor.execute("UPDATE aggregation_state SET last_id = %s WHERE name = %s", (rows[-1]['id'], STATE_NAME))
+        connection.commit()
+        return len(rows), {key[0] for key in keys}
+
+
+def aggregate(connection, batch_size: int = 5000, max_batches: Optional[int] = 20) -> Dict[str, Any]:
+    """Fold batches until caught up (or max_batches)"""
+    report = {"aggregated": 0, "apps": set()}
+    for _ in itertools.count() if max_batches is None else range(max_batches):
+        count, app_ids = aggregate_batch(connection, batch_size)
+        report["aggregated"] += count
+        report["apps"] |= app_ids
+        if count < batch_size:
+            break
+    report["apps"] = sorted(report["apps"])
+    if report["aggregated"]:
+        logger.info(f"Update funnel: {report['aggregated']} update_history rows aggregated")
+    return report
+
+
+def release_funnels(cursor, app_id: int, to_version: Optional[str] = None, platform: Optional[str] = None,
+                    limit: int = 20, top_reasons: int = 5) -> List[Dict[str, Any]]:
+    """Funnel per release, newest first, with a breakdown per platform (DictCursor)"""
+    query = f"""SELECT app_id, to_version, platform, {', '.join(STAGES)}, failure_reasons, install_seconds
+                FROM {TABLE} WHERE app_id = %s"""
+    params: list = [app_id]
+    if to_version:
+        query += " AND to_version = %s"
+        params.append(to_version)
+    if platform:
+        query += " AND platform = %s"
+        params.append(platform)
+    cursor.execute(query, params)
+
+    releases: Dict[str, Dict[str, FunnelRow]] = defaultdict(dict)
+    for row in cursor.fetchall():
+        releases[row['to_version']][row['platform']] = FunnelRow.from_db(row)
+
+    def newest_first(version):
+        key = version_key(version)
+        return (key is not None, key or 0, version)
+
+    result = []
+    for version in sorted(releases, key=newest_first, reverse=True)[:limit]:
+        total = FunnelRow()
+        for funnel in releases[version].values():
+            total.merge(funnel)
+        result.append({
+            "to_version": version,
+            **total.summary(top_reasons),
+            "platforms": {name: funnel.summary(top_reasons) for name, funnel in sorted(releases[version].items())},
+        })
+    return result
+
+
+def last_aggregated_id(cursor) -> Optional[int]:
+    cursor.execute("SELECT last_id FROM aggregation_state WHERE name = %s", (STATE_NAME,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row['last_id'] if isinstance(row, dict) else row[0]
+
+
+def main():
+    from multi_app_api import get_db
+
+    parser = argparse.ArgumentParser(description="Update funnel aggregation")
+    parser.add_argument("--catch-up", action="store_true", help="Aggregate the whole backlog")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.catch_up:
+        parser.error("nothing to do (pass --catch-up)")
+    logging.basicConfig(level=logging.INFO)
+    with get_db() as connection:
+        print(aggregate(connection, args.batch_size, max_batches=None))
+
+
+if __name__ == "__main__":
+    main()
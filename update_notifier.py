@@ -0,0 +1,226 @@
+"""
+Push channel for "new version available" notifications
+Mobile clients keep one idle WebSocket (or a long-poll request) per
+(app_identifier, platform) instead of polling /api/v2/version/check. When a
+build is activated a compact message is encoded once and sent to every
+listener of that key; clients then call check_version, which still decides
+(mandatory flag, rollout) whether to update. A build in a partial rollout is
+only announced to listeners that gave the user_uuid of a device in it (the
+same rollout.in_rollout bucketing as check_version); widening the rollout
+announces it again to the devices now in it.
+
+Idle connections cost no timers: clients send a heartbeat ("ping") and a
+single sweeper closes the ones silent for longer than heartbeat_timeout.
+Uploads handled by another worker are picked up by a cheap watcher query on
+app_versions.id, so every worker notifies its own clients.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from metrics import REGISTRY, Counter, Gauge
+from rollout import in_rollout
+
+logger = logging.getLogger(__name__)
+
+PLATFORMS = ("android", "ios", "web")
+
+update_channel_connections = REGISTRY.register(Gauge(
+    "update_channel_connections", "Clients waiting for update notifications", ("transport",)))
+update_notifications_total = REGISTRY.register(Counter(
+    "update_notifications_total", "Update notifications delivered", ("transport",)))
+update_channel_expired_total = REGISTRY.register(Counter(
+    "update_channel_expired_total", "WebSockets closed for missing heartbeats"))
+
+Key = Tuple[str, str]
+
+
+class UpdateNotifier:
+    def __init__(self, heartbeat_timeout: float = 90, sweep_interval: float = 30,
+                 send_timeout: float = 5):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.sweep_interval = sweep_interval
+        self.send_timeout = send_timeout
+        # Listener -> the user_uuid it subscribed with (None: anonymous)
+        self._sockets: Dict[Key, Dict[WebSocket, Optional[str]]] = {}
+        self._last_seen: Dict[WebSocket, float] = {}
+        self._waiters: Dict[Key, Dict[asyncio.Future, Optional[str]]] = {}
+        self._watch_cursor: Optional[int] = None
+        # (id, rollout percentage) already broadcast (locally or by the watcher), bounded
+        self._announced: "OrderedDict[tuple, None]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # Lifecycle
+
+    def start(self, fetch_versions_since: Optional[Callable] = None, watch_interval: float = 5):
+        """fetch_versions_since(last_id) -> (max_id, [version dicts]); runs in a worker thread"""
+        self._loop = asyncio.get_running_loop()
+        self._tasks.append(self._loop.create_task(self._sweep_forever()))
+        if fetch_versions_since:
+            self._tasks.append(self._loop.create_task(self._watch_forever(fetch_versions_since, watch_interval)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def connection_count(self) -> int:
+        return len(self._last_seen) + sum(len(waiters) for waiters in self._waiters.values())
+
+    # WebSocket transport
+
+    async def serve(self, websocket: WebSocket, app_identifier: str, platform: str,
+                    user_uuid: Optional[str] = None):
+        await websocket.accept()
+        key = (app_identifier, platform)
+        self._sockets.setdefault(key, {})[websocket] = user_uuid
+        self._last_seen[websocket] = time.monotonic()
+        update_channel_connections.inc(transport="websocket")
+        try:
+            await websocket.send_text(json.dumps({"type": "subscribed", "heartbeat_timeout": self.heartbeat_timeout}))
+            while True:
+                message = await websocket.receive_text()
+                self._last_seen[websocket] = time.monotonic()
+                if message == "ping":
+                    await websocket.send_text("pong")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._discard(key, websocket)
+
+    def _discard(self, key: Key, websocket: WebSocket):
+        sockets = self._sockets.get(key)
+        if sockets and websocket in sockets:
+            del sockets[websocket]
+            if not sockets:
+                del self._sockets[key]
+        if self._last_seen.pop(websocket, None) is not None:
+            update_channel_connections.dec(transport="websocket")
+
+    # Long-poll transport
+
+    async def wait(self, app_identifier: str, platform: str, timeout: float,
+                   user_uuid: Optional[str] = None) -> Optional[dict]:
+        """Resolve with the next notification for the key, or None after timeout"""
+        key = (app_identifier, platform)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, {})[future] = user_uuid
+        update_channel_connections.inc(transport="long_poll")
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.pop(future, None)
+                if not waiters:
+                    del self._waiters[key]
+            update_channel_connections.dec(transport="long_poll")
+
+    # Broadcasting
+
+    def notify(self, version: dict):
+        """Announce an activated build; safe from any thread, duplicates (same id and percentage) are ignored"""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._loop.create_task(self._broadcast(version))
+        else:
+            asyncio.run_coroutine_threadsafe(self._broadcast(version), self._loop)
+
+    async def _broadcast(self, version: dict):
+        version_id = version.get("id")
+        percentage = version.get("rollout_percentage")
+        if version_id is not None:
+            announced = (version_id, percentage)
+            if announced in self._announced:
+                return
+            self._announced[announced] = None
+            if len(self._announced) > 1000:
+                self._announced.popitem(last=False)
+
+        def eligible(user_uuid: Optional[str]) -> bool:
+            return in_rollout(version["app_identifier"], version["version"], percentage, user_uuid)
+
+        platforms = PLATFORMS if version["platform"] == "all" else (version["platform"],)
+        message = {
+            "type": "version_available",
+            "app_identifier": version["app_identifier"],
+            "platform": version["platform"],
+            "version": version["version"],
+            "version_code": version.get("version_code"),
+            "is_mandatory": bool(version.get("is_mandatory")),
+            "rollout_percentage": 100 if percentage is None else percentage,
+        }
+        encoded = json.dumps(message)
+        sends = []
+        for platform in platforms:
+            key = (version["app_identifier"], platform)
+            for future, user_uuid in list(self._waiters.get(key, {}).items()):
+                if not future.done() and eligible(user_uuid):
+                    future.set_result(message)
+                    update_notifications_total.inc(transport="long_poll")
+            for websocket, user_uuid in list(self._sockets.get(key, {}).items()):
+                if eligible(user_uuid):
+                    sends.append(self._send(key, websocket, encoded))
+        if sends:
+            await asyncio.gather(*sends)
+            logger.info(f"Notified {len(sends)} clients of {version['app_identifier']} {version['version']} ({version['platform']})")
+
+    async def _send(self, key: Key, websocket: WebSocket, encoded: str):
+        try:
+            await asyncio.wait_for(websocket.send_text(encoded), self.send_timeout)
+            update_notifications_total.inc(transport="websocket")
+        except Exception:
+            # Stuck or gone: drop it, the client reconnects and checks on launch
+            self._discard(key, websocket)
+            await self._close(websocket)
+
+    async def _close(self, websocket: WebSocket, code: int = 1001):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    # Background tasks
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            deadline = time.monotonic() - self.heartbeat_timeout
+            stale = [
+                (key, websocket)
+                for key, sockets in self._sockets.items()
+                for websocket in sockets
+                if self._last_seen.get(websocket, 0) < deadline
+            ]
+            for key, websocket in stale:
+                self._discard(key, websocket)
+                update_channel_expired_total.inc()
+                await self._close(websocket)
+
+    async def _watch_forever(self, fetch_versions_since: Callable, interval: float):
+        from starlette.concurrency import run_in_threadpool
+
+        while True:
+            try:
+                # First pass only records the current high-water mark
+                cursor, versions = await run_in_threadpool(fetch_versions_since, self._watch_cursor)
+                if self._watch_cursor is not None:
+                    for version in versions:
+                        await self._broadcast(version)
+                self._watch_cursor = cursor if cursor is not None else self._watch_cursor
+            except Exception as e:
+                logger.warning(f"Version watcher failed: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,177 @@
+"""
+Version parsing and sortable integer keys
+Version strings ("1.10.0", "v2.0.0-beta.3", "1.4+build.7") sort wrongly as text
+("0.10.0" < "0.9.0"), so each versioned table also stores version_key, a
+BIGINT that orders like semver. Comparisons, MIN/MAX and range filters then
+run on an indexed integer column.
+
+Key layout (63 bits, fits a signed BIGINT):
+
+    major:14 | minor:16 | patch:20 | pre-release:13
+
+A release has the pre-release field at its maximum, so 1.2.0-rc.1 < 1.2.0.
+Pre-releases are ordered by stage (dev < alpha < beta < pre < rc), then by
+their first number; build metadata is ignored. A fourth component
+("1.0.0.2") is not part of the key, so such builds share their key with
+x.y.z: key order is only a pre-filter for them, and is_newer() compares the
+parsed versions in full when keys tie. Strings that do not parse, or do not
+fit (including pre-release numbers above 1023), have no key (NULL).
+
+Usage:
+    python versioning.py --backfill     # fill version keys for existing rows
+"""
+import argparse
+import logging
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MAJOR_BITS, MINOR_BITS, PATCH_BITS, PRE_BITS = 14, 16, 20, 13
+PRE_NUMBER_BITS = 10
+RELEASE = (1 << PRE_BITS) - 1
+
+STAGES = {"dev": 0, "snapshot": 0, "alpha": 1, "a": 1, "beta": 2, "b": 2,
+          "pre": 3, "preview": 3, "rc": 4, "c": 4}
+STAGE_NAMES = {0: "dev", 1: "alpha", 2: "beta", 3: "pre", 4: "rc"}
+
+_VERSION_RE = re.compile(
+    r"^\s*[vV]?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:\.(\d+))?"
+    r"(?:[-_.]?([0-9A-Za-z.\-]+?))?(?:\+[0-9A-Za-z.\-]*)?\s*$"
+)
+_STAGE_RE = re.compile(r"([A-Za-z]+)?\.?(\d+)?")
+
+# Versioned columns: table -> (version column, key column)
+VERSION_COLUMNS = {
+    "app_versions": ("version", "version_key"),
+    "user_app_installations": ("current_version", "current_version_key"),
+    "app_error_logs": ("app_version", "app_version_key"),
+}
+
+
+class Version(NamedTuple):
+    major: int
+    minor: int
+    patch: int
+    stage: Optional[int] = None     # None for a release
+    pre_number: int = 0
+    build: int = 0                  # fourth component, not encoded in the key
+
+    def sort_tuple(self) -> tuple:
+        """Full ordering, fourth component included (a release sorts after its pre-releases)"""
+        stage = len(STAGE_NAMES) if self.stage is None else self.stage
+        return self.major, self.minor, self.patch, self.build, stage, self.pre_number
+
+
+def parse_version(value: Optional[str]) -> Optional[Version]:
+    if not value:
+        return None
+    match = _VERSION_RE.match(value)
+    if not match:
+        return None
+    major, minor, patch, build, pre = match.groups()
+    build = int(build or 0)
+    if not pre:
+        return Version(int(major), int(minor or 0), int(patch or 0), build=build)
+    stage_match = _STAGE_RE.match(pre)
+    tag, number = stage_match.groups()
+    # Unknown tags sort with the earliest stage
+    stage = STAGES.get(tag.lower(), 0) if tag else 0
+    return Version(int(major), int(minor or 0), int(patch or 0), stage, int(number or 0), build)
+
+
+@lru_cache(maxsize=4096)
+def version_key(value: Optional[str]) -> Optional[int]:
+    """Sortable integer for a version string, or None if it cannot be encoded"""
+    version = parse_version(value)
+    if version is None:
+        return None
+    if (version.major >= 1 << MAJOR_BITS or version.minor >= 1 << MINOR_BITS
+            or version.patch >= 1 << PATCH_BITS or version.pre_number >= 1 << PRE_NUMBER_BITS):
+        return None
+    if version.stage is None:
+        pre = RELEASE
+    else:
+        pre = (version.stage << PRE_NUMBER_BITS) | version.pre_number
+    key = version.major
+    key = (key << MINOR_BITS) | version.minor
+    key = (key << PATCH_BITS) | version.patch
+    return (key << PRE_BITS) | pre
+
+
+def format_version_key(key: Optional[int]) -> Optional[str]:
+    """Canonical string for a key ("1.2.0", "1.2.0-beta.3")"""
+    if key is None:
+        return None
+    pre = key & RELEASE
+    key >>= PRE_BITS
+    patch = key & ((1 << PATCH_BITS) - 1)
+    key >>= PATCH_BITS
+    minor = key & ((1 << MINOR_BITS) - 1)
+    major = key >> MINOR_BITS
+    text = f"{major}.{minor}.{patch}"
+    if pre != RELEASE:
+        stage, number = pre >> PRE_NUMBER_BITS, pre & ((1 << PRE_NUMBER_BITS) - 1)
+        text += f"-{STAGE_NAMES.get(stage, 'dev')}"
+        if number:
+            text += f".{number}"
+    return text
+
+
+def is_newer(candidate: str, current: str) -> bool:
+    """True if candidate is a later version; falls back to inequality for unparseable strings"""
+    candidate_key, current_key = version_key(candidate), version_key(current)
+    if candidate_key is not None and current_key is not None and candidate_key != current_key:
+        return candidate_key > current_key
+    # Same key (fourth component, build metadata) or no key: compare in full
+    candidate_version, current_version = parse_version(candidate), parse_version(current)
+    if candidate_version is None or current_version is None:
+        return candidate != current
+    return candidate_version.sort_tuple() > current_version.sort_tuple()
+
+
+def backfill(connection, batch_size: int = 5000) -> dict:
+    """Fill missing version keys in PK batches"""
+    filled = {}
+    with connection.cursor() as cursor:
+        for table, (column, key_column) in VERSION_COLUMNS.items():
+            filled[table] = 0
+            last_id = 0
+            while True:
+                cursor.execute(
+                    f"""SELECT id, {column} FROM {table}
+                        WHERE id > %s AND {key_column} IS NULL AND {column} IS NOT NULL
+                        ORDER BY id LIMIT %s""",
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = [(version_key(value), row_id) for row_id, value in rows]
+                updates = [update for update in updates if update[0] is not None]
+                if updates:
+                    cursor.executemany(f"UPDATE {table} SET {key_column} = %s WHERE id = %s", updates)
+                connection.commit()
+                filled[table] += len(updates)
+            logger.info(f"Version keys: {filled[table]} rows of {table} filled")
+    return filled
+
+
+def main():
+    from multi_app_api import get_db
+
+    parser = argparse.ArgumentParser(description="Sortable version keys")
+    parser.add_argument("--backfill", action="store_true", help="Fill version keys for existing rows")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do (pass --backfill)")
+    logging.basicConfig(level=logging.INFO)
+    with get_db() as connection:
+        print(backfill(connection, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()